@@ -0,0 +1,60 @@
+"""
+Cuentas de GoCardless que consulta el bot.
+
+Cada `--account_id` es una cuenta (p. ej. la común y la de ahorro), con un
+nombre opcional delante: `--account_id Ahorro=<id>`. Los comandos piden a
+todas a la vez con `gather_bounded`, que limita cuántas peticiones salen en
+paralelo; la cuota del banco ya se lleva por cuenta y endpoint en
+`quota.QuotaManager`.
+"""
+import asyncio
+
+API_URL = "https://bankaccountdata.gocardless.com/api/v2/accounts"
+# Cuentas que se consultan a la vez
+FANOUT = 4
+
+
+class Account:
+    __slots__ = ("id", "name", "base_url", "balances_url", "details_url", "transactions_url")
+
+    def __init__(self, id, name=None, api_url=API_URL):
+        self.id = id
+        self.name = name or id
+        self.base_url = f"{api_url}/{id}"
+        self.balances_url = f"{self.base_url}/balances/"
+        self.details_url = f"{self.base_url}/details/"
+        self.transactions_url = f"{self.base_url}/transactions/"
+
+    def __repr__(self):
+        return f"Account({self.id!r}, {self.name!r})"
+
+
+def parse_accounts(values, api_url=API_URL):
+    """
+    Cuentas a partir de los `--account_id` ("<id>" o "<nombre>=<id>"). Sin
+    nombre, la primera es "Principal" y las demás "Cuenta N".
+    """
+    accounts = []
+    for i, value in enumerate(values, start=1):
+        name, sep, id = value.partition("=")
+        if not sep:
+            name, id = ("Principal" if i == 1 else f"Cuenta {i}"), value
+        if not id or any(a.id == id for a in accounts):
+            raise ValueError(f"cuenta vacía o repetida: {value}")
+        accounts.append(Account(id.strip(), name.strip(), api_url))
+    return accounts
+
+
+async def gather_bounded(funcs, limit=FANOUT):
+    """
+    Ejecuta las corrutinas que devuelven `funcs` (funciones sin argumentos)
+    con como mucho `limit` a la vez. Devuelve los resultados en el mismo
+    orden; una excepción se devuelve en su posición en vez de propagarse.
+    """
+    sem = asyncio.Semaphore(limit)
+
+    async def run(func):
+        async with sem:
+            return await func()
+
+    return await asyncio.gather(*(run(f) for f in funcs), return_exceptions=True)
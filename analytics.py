@@ -0,0 +1,93 @@
+"""
+Resumen de gastos e ingresos por mes y por contrapartida para /resumen.
+
+Se trabaja sobre una instantánea en columnas (arrays de NumPy) de todo el
+histórico local: mes, importe en céntimos y código de contrapartida por
+transacción. Las agregaciones son `bincount` sobre esos arrays, sin bucles
+en Python. La instantánea se reconstruye sólo cuando el almacén cambia.
+
+NumPy es opcional: sin él, `available()` es False y el bot lo indica.
+"""
+import weakref
+from datetime import date
+
+try:
+    import numpy as np
+except ImportError:  # dependencia opcional
+    np = None
+
+# Instantánea por almacén: TransactionStore -> (versión, Snapshot)
+_snapshots = weakref.WeakKeyDictionary()
+
+
+def available() -> bool:
+    return np is not None
+
+
+def month_index(d) -> int:
+    return d.year * 12 + d.month - 1
+
+
+class Snapshot:
+    """
+    Columnas de todas las transacciones guardadas.
+    """
+    __slots__ = ("months", "amounts", "parties", "names")
+
+    def __init__(self, rows):
+        fechas, importes, nombres = zip(*rows) if rows else ((), (), ())
+        dias = np.array(fechas, dtype="datetime64[D]")
+        meses = dias.astype("datetime64[M]").astype(np.int64)   # meses desde 1970-01
+        self.months = meses + 1970 * 12
+        self.amounts = np.array(importes, dtype=np.int64)
+        self.names, self.parties = np.unique(
+            np.array([n or "—" for n in nombres], dtype=object), return_inverse=True
+        )
+
+    def __len__(self):
+        return len(self.amounts)
+
+
+def snapshot(store) -> Snapshot:
+    """
+    Instantánea en columnas de `store`, reutilizada mientras no cambie.
+    """
+    cached = _snapshots.get(store)
+    if cached is not None and cached[0] == store.version:
+        return cached[1]
+    snap = Snapshot(store.columns())
+    _snapshots[store] = (store.version, snap)
+    return snap
+
+
+def summarize(snap, meses, today=None, top=5):
+    """
+    Ingresos, gastos y neto (céntimos) de cada uno de los últimos `meses`
+    meses, del más reciente al más antiguo, y las `top` contrapartidas con
+    más gasto en ese tiempo.
+    """
+    today = today or date.today()
+    hasta = month_index(today)
+    desde = hasta - meses + 1
+    sel = (snap.months >= desde) & (snap.months <= hasta)
+    mes = (snap.months[sel] - desde).astype(np.intp)
+    importes = snap.amounts[sel]
+
+    ingresos = np.bincount(mes, weights=np.where(importes > 0, importes, 0), minlength=meses)
+    gastos = np.bincount(mes, weights=np.where(importes < 0, -importes, 0), minlength=meses)
+    n = np.bincount(mes, minlength=meses)
+
+    gasto_por = np.bincount(
+        snap.parties[sel], weights=np.where(importes < 0, -importes, 0), minlength=len(snap.names)
+    )
+    orden = np.argsort(-gasto_por, kind="stable")[:top]
+    principales = [(snap.names[i], int(gasto_por[i])) for i in orden if gasto_por[i] > 0]
+
+    filas = []
+    for k in range(meses - 1, -1, -1):
+        year, month = divmod(desde + k, 12)
+        filas.append((
+            f"{year}-{month + 1:02d}", int(n[k]), int(ingresos[k]), int(gastos[k]),
+            int(ingresos[k] - gastos[k]),
+        ))
+    return filas, principales
@@ -1,104 +1,272 @@
+import asyncio
+import httpx
 import os
-import re
-import requests
 import random
-import json
+import secrets
 import argparse
 from apscheduler.jobstores.base import JobLookupError
-from datetime import datetime, timedelta, time
+from datetime import date, datetime, timedelta, time
 from telegram import Update, MessageEntity
-from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, filters, ContextTypes
+from telegram.helpers import escape_markdown
+from telegram.ext import (
+    ApplicationBuilder, ApplicationHandlerStop, CommandHandler, MessageHandler, filters,
+    ContextTypes,
+)
 from functools import wraps
 
+import analytics
+import export
+from accounts import FANOUT, gather_bounded, parse_accounts
+from auth import StaticToken, TokenError, TokenManager
+from breaker import CLOSED
+from cache import ResponseCache, SharedResponses
+from gating import Addressed, Throttle, is_addressed
+from events import BalanceBelow, BalanceEvent, RentSent, RoommatePaid, RuleEngine, TransactionEvent
+from calendar_trigger import MonthlyTrigger
+from gocardless import GoCardlessClient
+from leader import LeaderLock
+from outbox import Outbox
+from metrics import (
+    HANDLER_LATENCY, OUTBOUND_MESSAGES, RATE_LIMITED, REGISTRY, REMINDER_LAG, UPDATES_DROPPED,
+    UPSTREAM_REQUESTS, start_metrics_server, timed,
+)
+from quota import (
+    PRIORITY_INTERACTIVE, PRIORITY_SCHEDULED, QuotaManager, SharedQuota, retry_after_seconds,
+)
+from reminder_store import ReminderStore
+from recurrence import parse_rule_args
+from reminders import ReminderEngine
+from roommates import PaymentMatcher, load_roommates, normalize
+from search import SearchIndex
+from transaction import format_cents, parse_cents
+from transaction_store import TransactionStore
+from update_processor import PerChatUpdateProcessor
+from webhook import serve_standby
+
 
 
 ADMIN_CHAT_ID = 00000000
 
+# Updates de chats distintos que se procesan a la vez
+UPDATE_WORKERS = 8
+
+# Varios procesos (`--leader_lock`): comparten las bases locales y sólo el
+# líder ejecuta las tareas programadas y dispara los recordatorios
+LEADER = None           # LeaderLock, o None con un único proceso
+LEADER_INTERVAL = 5     # segundos entre intentos de ser líder
+CACHE_DB = "cache.db"   # respuestas del banco compartidas entre procesos
+
 # Variables para gestionar recordatorios
-# Archivo para persistir recordatorios
+# Base de datos para persistir recordatorios (y JSON antiguo a migrar)
+REMINDERS_DB = "reminders.db"
 REMINDERS_FILE = "reminders.json"
-MAX_REMINDERS = 15
+REMINDER_STORE = None
+MAX_REMINDERS = 15  # por chat
+REMINDERS_PAGE_SIZE = 10
 
 # Variables para gestionar recordatorios en memoria
-REMINDER_COUNTER = 0
-REMINDERS = {}  # mapping id -> Job
+REMINDERS = None        # ReminderEngine: índice por id, por chat y montículo por hora
+REMINDER_TIMER = None   # único job que despierta al vencer el recordatorio más próximo
+REMINDER_TIMER_AT = None
+
+# Cliente HTTP asíncrono compartido con GoCardless (se crea en main)
+GC_CLIENT = None
+
+# Cuentas consultadas (`--account_id`, una o varias); la primera es la principal
+ACCOUNTS = []
+
+# Almacén local de transacciones (sincronización incremental)
+TRANSACTIONS_DB = "transactions.db"
+TX_STORE = None
+
+# Importe del alquiler, en céntimos
+ALQUILER_CENTS = 80000
+
+# Avisos de transacciones nuevas a ADMIN_CHAT_ID: sondeos al banco por día
+# (0 = sin sondeo), saldo mínimo en céntimos (None = sin aviso) y reglas
+POLL_PER_DAY = 12
+MIN_BALANCE_CENTS = None
+EVENT_RULES = RuleEngine()
+
+# /buscar: índice invertido (se crea al primer uso) y resultados por página
+SEARCH_INDEX = None
+BUSCAR_PAGE_SIZE = 10
+BUSCAR_INDEX_BATCH = 2000
+
+# /resumen: meses por defecto y máximo
+RESUMEN_MESES = 6
+RESUMEN_MAX_MESES = 120
+
+# Compañeros de piso (alias, importe y tolerancia) para /morosos
+ROOMMATES_FILE = "roommates.json"
+PAYMENTS = PaymentMatcher(load_roommates(None))
+MOROSOS_DIAS = 20
+MOROSOS_MAX_MESES = 36
+
+# Caché de saldo y datos de cuenta: segundos de validez por endpoint
+CACHE_TTLS = {"balances": 300, "details": 7 * 86400}
+RESPONSE_CACHE = ResponseCache(CACHE_TTLS)
+
+# Tareas programadas: disparadores mensuales y sincronización compartida del día
+MOROSOS_TRIGGER = MonthlyTrigger(29, time(hour=9, minute=0), overrides={2: 26})
+RENT_TRIGGER = MonthlyTrigger(1, time(hour=9, minute=5))
+SNAPSHOT_DAYS = {}      # id de cuenta -> día de su última sincronización forzada
+SNAPSHOT_LOCK = asyncio.Lock()
+
+# Límite de órdenes antes de los handlers: ráfaga y fichas por segundo
+USER_THROTTLE = Throttle(rate=1 / 10, burst=5)    # por usuario: 5 seguidas, luego 1 cada 10 s
+CHAT_THROTTLE = Throttle(rate=1 / 2, burst=15)    # por chat: 15 seguidas, luego 1 cada 2 s
+
+# Mensajes que el bot envía por su cuenta (recordatorios, informes, avisos):
+# pasan por la cola de salida para respetar los límites de Telegram
+OUTBOX = Outbox()
+
+# Endpoint de métricas Prometheus (desactivado si no hay puerto)
+METRICS_LISTEN = "127.0.0.1"
+METRICS_PORT = None
+METRICS_SERVER = None
+
+# Métricas que se leen del estado del bot al exportar
+REGISTRY.gauge("bot_reminders", "Recordatorios pendientes en memoria",
+               lambda: len(REMINDERS) if REMINDERS is not None else None)
+REGISTRY.gauge("bot_transactions_stored", "Transacciones en el almacén local",
+               lambda: TX_STORE.count() if TX_STORE is not None else None)
+REGISTRY.gauge("bot_cache_requests_total", "Consultas a la caché de respuestas por resultado",
+               lambda: dict(RESPONSE_CACHE.counters), ("endpoint", "result"), kind="counter")
+REGISTRY.gauge("bot_upstream_quota_remaining", "Peticiones que quedan al banco hasta el reset",
+               lambda: {k: q.remaining for k, q in GC_CLIENT.quota.quotas.items()
+                        if q.remaining is not None},
+               ("account", "endpoint"))
+REGISTRY.gauge("bot_upstream_circuit_open", "1 si el circuito del endpoint está abierto o probando",
+               lambda: {k: int(b.state != CLOSED) for k, b in GC_CLIENT.breakers.items()},
+               ("account", "endpoint"))
+REGISTRY.gauge("bot_outbound_queue", "Mensajes en la cola de salida pendientes de enviar",
+               lambda: len(OUTBOX))
 # --- Handlers existentes ---
 
 # --- Funciones auxiliares de persistencia ---
 def load_reminders(app):
-    print(GO_CARDLESS_TOKEN)
     """
-    Carga recordatorios desde REMINDERS_FILE y los programa.
+    Carga recordatorios desde REMINDERS_DB (migrando el antiguo
+    REMINDERS_FILE si existe) y arma el temporizador.
+    """
+    global REMINDERS, REMINDER_STORE
+    REMINDER_STORE = ReminderStore(REMINDERS_DB)
+    REMINDER_STORE.import_json(REMINDERS_FILE)
+    REMINDERS = ReminderEngine(REMINDER_STORE, max_per_chat=MAX_REMINDERS)
+    # Los que ya pasaron mientras el bot estaba parado se descartan (si hay
+    # otro proceso líder, el bot no estaba parado: los disparará él)
+    REMINDERS.load(datetime.now(), prune=is_leader())
+    arm_reminder_timer(app.job_queue)
+
+
+def is_leader() -> bool:
+    return LEADER is None or LEADER.is_leader
+
+
+def leader_only(func):
+    """
+    Tarea programada que sólo ejecuta el proceso líder.
+    """
+    @wraps(func)
+    async def wrapper(context: ContextTypes.DEFAULT_TYPE):
+        if not is_leader():
+            return
+        return await func(context)
+
+    return wrapper
+
+
+def sync_reminders(job_queue):
+    """
+    Con varios procesos, recoge los recordatorios que otros hayan añadido o
+    borrado y, si cambia el más próximo, rearma el temporizador.
+    """
+    if LEADER is not None and REMINDERS.refresh(datetime.now()):
+        arm_reminder_timer(job_queue)
+
+
+async def elect_leader(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Los procesos de reserva intentan ser líder (lo consiguen en cuanto el
+    actual muere); el líder recoge lo que los demás cambien en los recordatorios.
+    """
+    if LEADER.is_leader:
+        sync_reminders(context.job_queue)
+    elif LEADER.try_acquire():
+        print(f"Proceso {os.getpid()}: ahora es el líder")
+        # Lo que venció con el líder anterior caído se dispara ahora
+        REMINDERS.load(datetime.now(), prune=False)
+        arm_reminder_timer(context.job_queue)
+
+
+def arm_reminder_timer(job_queue):
+    """
+    Programa el único job de recordatorios para la hora del más próximo.
+    Si ya estaba programado para esa hora no hace nada.
     """
-    global REMINDER_COUNTER, REMINDERS
-    if not os.path.exists(REMINDERS_FILE):
+    global REMINDER_TIMER, REMINDER_TIMER_AT
+    # Los recordatorios sólo los dispara el líder
+    siguiente = REMINDERS.next_run_at() if is_leader() else None
+    if siguiente == REMINDER_TIMER_AT and REMINDER_TIMER is not None:
         return
-    try:
-        with open(REMINDERS_FILE, "r") as f:
-            data = json.load(f)
-    except Exception:
+    if REMINDER_TIMER is not None:
+        try:
+            REMINDER_TIMER.schedule_removal()
+        except JobLookupError:
+            pass
+    REMINDER_TIMER, REMINDER_TIMER_AT = None, siguiente
+    if siguiente is None:
         return
+    espera = max(0.0, (siguiente - datetime.now()).total_seconds())
+    REMINDER_TIMER = job_queue.run_once(timed(alarm_callback), when=espera, name="recordatorios")
 
-    now = datetime.now()
-    for item in data:
-        rid = item.get("id")
-        chat_id = item.get("chat_id")
-        dt_str = item.get("datetime")
-        mensaje = item.get("message")
-        try:
-            run_at = datetime.fromisoformat(dt_str)
-            # Normalizar a datetime naive (local)
-            if run_at.tzinfo is not None:
-                run_at = run_at.astimezone().replace(tzinfo=None)
-        except Exception:
-            continue
-        # Solo reprogramar futuros
-        if run_at <= now:
+
+async def compact_reminders(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Compactación periódica del journal de recordatorios.
+    """
+    REMINDER_STORE.compact()
+
+# --- Filtros previos a los handlers ---
+async def drop_unaddressed(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Mensajes de grupo que no van dirigidos al bot: no pasan a ningún handler.
+    """
+    UPDATES_DROPPED.inc(reason="sin_mencion")
+    raise ApplicationHandlerStop
+
+async def throttle_commands(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Cubetas de fichas por usuario y por chat, antes de cualquier handler o
+    llamada al banco. Al quedarse sin fichas se avisa una vez y el resto de
+    órdenes se descartan en silencio hasta que se recuperan.
+    """
+    user, chat = update.effective_user, update.effective_chat
+    limites = ((USER_THROTTLE, user.id if user else None, "usuario"), (CHAT_THROTTLE, chat.id, "chat"))
+    for throttle, key, motivo in limites:
+        if key is None:
             continue
-        delta = (run_at - now).total_seconds()
-        job = app.job_queue.run_once(
-            alarm_callback,
-            when=delta,
-            chat_id=chat_id,
-            data=mensaje,
-            name=f"recordatorio_{chat_id}_{int(run_at.timestamp())}"
-        )
-        REMINDERS[rid] = job
-        REMINDER_COUNTER = max(REMINDER_COUNTER, rid)
-
-
-def save_reminders():
-    """
-    Guarda en REMINDERS_FILE la lista actual de recordatorios.
-    """
-    items = []
-    for rid, job in REMINDERS.items():
-        run_at = job.next_t
-        # Normalizar a datetime naive antes de guardar
-        if run_at.tzinfo is not None:
-            run_at = run_at.astimezone().replace(tzinfo=None)
-        items.append({
-            "id": rid,
-            "chat_id": job.chat_id,
-            "datetime": run_at.isoformat(),
-            "message": job.data
-        })
-    try:
-        with open(REMINDERS_FILE, "w") as f:
-            json.dump(items, f, ensure_ascii=False, indent=2)
-    except Exception:
-        pass
+        espera = throttle.wait(key)
+        if espera:
+            UPDATES_DROPPED.inc(reason=motivo)
+            if throttle.should_warn(key):
+                await update.effective_message.reply_text(
+                    f"⏳ Demasiadas órdenes seguidas. Espera {int(espera) + 1} s."
+                )
+            raise ApplicationHandlerStop
+    for throttle, key, _ in limites:
+        if key is not None:
+            throttle.take(key)
 
 def require_mention(func):
     @wraps(func)
     async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
         chat_type = update.effective_chat.type
-        text = update.message.text or ""
-        bot_username = context.bot.username
 
-        # En grupo/ supergrupo, exige mención
+        # En grupo/ supergrupo, exige mención (por entidades, como el filtro `Addressed`)
         if chat_type in ("group", "supergroup"):
-            if f"@{bot_username}" not in text:
+            if not is_addressed(update.message, context.bot.username):
                 return  # ignora sin mención
 
         # En privado (o si pasa la mención), ejecuta normalmente
@@ -109,18 +277,14 @@ def check_rate_limit(resp):
     """
     Si resp.status_code == 429, extrae de resp.json()['detail'] o del header Retry-After
     los segundos que faltan y devuelve una cadena formateada en días, horas, minutos, segundos.
-    En otro caso devuelve None.
+    En otro caso (o si no hubo petición) devuelve None.
     """
-    if resp.status_code != 429:
+    if resp is None or resp.status_code != 429:
         return None
 
-    # Intentamos extraer segundos de la clave "detail"
-    try:
-        detail = resp.json().get("detail", "")
-        m = re.search(r"(\d+)\s*seconds", detail)
-        seconds = int(m.group(1)) if m else int(resp.headers.get("Retry-After", 0))
-    except Exception:
-        seconds = int(resp.headers.get("Retry-After", 0))
+    RATE_LIMITED.inc()
+    # Segundos de la clave "detail" o, si no, de Retry-After
+    seconds = retry_after_seconds(resp)
 
     # Convertir segundos a d/h/m/s
     days, rem = divmod(seconds, 86400)
@@ -144,6 +308,22 @@ def check_rate_limit(resp):
         return ", ".join(parts[:-1]) + " y " + parts[-1]
     return parts[0]
 
+def describe_age(seconds) -> str:
+    """
+    Antigüedad legible de unos datos cacheados ("ahora mismo", "hace 5 min"...).
+    """
+    seconds = int(seconds)
+    if seconds < 5:
+        return "ahora mismo"
+    if seconds < 60:
+        return f"hace {seconds} s"
+    if seconds < 3600:
+        return f"hace {seconds // 60} min"
+    if seconds < 86400:
+        return f"hace {seconds // 3600} h"
+    dias = seconds // 86400
+    return f"hace {dias} día{'s' if dias != 1 else ''}"
+
 @require_mention
 async def hola(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await update.message.reply_text("¡Hola! ¿En qué puedo ayudarte? 🤖")
@@ -152,90 +332,424 @@ async def fecha(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     ahora = datetime.now().strftime("%d/%m/%Y %H:%M")
     await update.message.reply_text(f"La fecha y hora actual es: {ahora}")
 
-@require_mention
-async def saldo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    resp = requests.get(BALANCES_URL, headers=HEADERS)
-    # 1) ¿Rate limit?
-    wait = check_rate_limit(resp)
-    if wait:
-        return await update.message.reply_text(
-            f"⚠️ Límite de peticiones excedido. Vuelve a intentarlo en {wait}."
+# --- Varias cuentas ---
+async def fetch_all(url_of):
+    """
+    Respuestas cacheadas (resp, edad) del endpoint `url_of(cuenta)` de todas
+    las cuentas, pedidas a la vez (como mucho FANOUT en paralelo).
+    """
+    return await gather_bounded([
+        lambda url=url_of(a): RESPONSE_CACHE.get(url, lambda: GC_CLIENT.get(url))
+        for a in ACCOUNTS
+    ], FANOUT)
+
+async def sync_accounts(accounts, force=False, priority=PRIORITY_INTERACTIVE, max_age=None):
+    """
+    Sincroniza a la vez las transacciones de `accounts` en el almacén común.
+    Devuelve la respuesta de cada cuenta (None si no hizo falta pedir nada).
+    """
+    results = await gather_bounded([
+        lambda a=a: TX_STORE.sync(
+            GC_CLIENT, a.transactions_url, force=force, priority=priority, max_age=max_age
         )
+        for a in accounts
+    ], FANOUT)
+    for r in results:
+        if isinstance(r, BaseException):
+            raise r
+    return results
+
+def worst_response(resps):
+    """
+    La respuesta que decide qué ve el usuario: un 429 si alguna cuenta lo
+    recibió, si no el primer error y, si todo fue bien, un 200 (o None si
+    ninguna cuenta tuvo que pedir nada).
+    """
+    resps = [r for r in resps if r is not None]
+    for resp in resps:
+        if resp.status_code == 429:
+            return resp
+    for resp in resps:
+        if resp.status_code != 200:
+            return resp
+    return resps[0] if resps else None
 
-    # 2) Si no, seguimos con la lógica normal
-    try:
-        resp.raise_for_status()
-        balances = resp.json().get("balances", [])
-        if not balances:
-            texto = "No se encontró información de saldo."
-        else:
-            lines = ["💰 *Saldos disponibles:*"]
-            for bal in balances:
-                tipo  = bal.get("balanceType", "desconocido")
-                amt   = bal.get("balanceAmount", {}).get("amount", "N/A")
-                curr  = bal.get("balanceAmount", {}).get("currency", "EUR")
-                fecha = bal.get("referenceDate", "")
-                lines.append(f"• _{tipo}_: {amt} {curr} (ref: {fecha})")
-            texto = "\n".join(lines)
-    except Exception as e:
-        texto = f"⚠️ Error al obtener el saldo: {e}"
-    await update.message.reply_text(texto, parse_mode="Markdown")
+async def sync_transactions(**kwargs):
+    return worst_response(await sync_accounts(ACCOUNTS, **kwargs))
+
+async def backfill_transactions(desde, fetch=True):
+    """
+    Completa hasta `desde` el histórico guardado de todas las cuentas (la
+    primera sincronización sólo trae los últimos días). Devuelve el aviso
+    para el usuario si alguna no llega tan atrás (el banco no da más
+    histórico o ha fallado), o None. Con `fetch=False` sólo comprueba.
+    """
+    if fetch:
+        results = await gather_bounded([
+            lambda a=a: TX_STORE.backfill(GC_CLIENT, a.transactions_url, desde)
+            for a in ACCOUNTS
+        ], FANOUT)
+        for a, r in zip(ACCOUNTS, results):
+            if isinstance(r, BaseException):
+                print(f"Error completando el histórico de {a.name}: {r!r}")
+    inicios = [TX_STORE.history_start(a.id) for a in ACCOUNTS]
+    inicio = max((d for d in inicios if d is not None), default=None)
+    if inicio is None or inicio <= desde:
+        return None
+    return f"⚠️ _Sólo hay movimientos guardados desde el {inicio:%d/%m/%Y}; lo anterior no está incluido._"
+
+def months_back(meses, today=None) -> date:
+    """
+    Primer día del periodo de `meses` meses naturales que acaba en el actual.
+    """
+    today = today or date.today()
+    n = today.year * 12 + today.month - meses
+    return date(n // 12, n % 12 + 1, 1)
+
+def offline_notice(resp):
+    """
+    Si la sincronización ha fallado (límite de peticiones, error del banco o
+    circuito abierto) pero hay datos guardados de todas las cuentas, el aviso
+    con el que el comando responde igualmente con ellos. None si no ha
+    fallado o si no hay nada guardado (entonces se muestra el error).
+    """
+    if resp is None or resp.status_code == 200:
+        return None
+    guardado = min(TX_STORE.last_sync(a.id) for a in ACCOUNTS)
+    if not guardado:
+        return None
+    if resp.status_code == 429:
+        motivo = f"límite de peticiones, vuelve a intentarlo en {check_rate_limit(resp)}"
+    elif resp.status_code >= 500:
+        motivo = "el banco no responde"
+    else:
+        motivo = f"error {resp.status_code} del banco"
+    return f"⚠️ _Datos guardados del {datetime.fromtimestamp(guardado):%d/%m/%Y %H:%M} ({motivo})_"
+
+def account_tag(tx) -> str:
+    """
+    Nombre de la cuenta de una transacción (" [Ahorro]"), sólo si hay varias.
+    """
+    if len(ACCOUNTS) < 2:
+        return ""
+    for a in ACCOUNTS:
+        if a.id == tx.account:
+            return f" [{a.name}]"
+    return ""
+
+def age_line(url, edad) -> str:
+    """
+    Antigüedad de una respuesta cacheada. Con el banco caído (circuito
+    abierto) se marca como dato guardado, con su fecha y hora.
+    """
+    if GC_CLIENT.is_down(url):
+        guardado = datetime.now() - timedelta(seconds=edad)
+        return f"⚠️ _Banco no disponible: datos guardados del {guardado:%d/%m/%Y %H:%M}_"
+    return f"🕒 _Datos de {describe_age(edad)}_"
+
+def balance_lines(resp, edad):
+    """
+    Líneas de /saldo de una cuenta a partir de su respuesta de `balances`.
+    """
+    resp.raise_for_status()
+    balances = resp.json().get("balances", [])
+    if not balances:
+        return ["No se encontró información de saldo."]
+    lines = []
+    for bal in balances:
+        tipo  = bal.get("balanceType", "desconocido")
+        amt   = bal.get("balanceAmount", {}).get("amount", "N/A")
+        curr  = bal.get("balanceAmount", {}).get("currency", "EUR")
+        fecha = bal.get("referenceDate", "")
+        lines.append(f"• _{tipo}_: {amt} {curr} (ref: {fecha})")
+    lines.append(age_line(str(resp.request.url), edad))
+    return lines
 
 @require_mention
-async def iban(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    resp = requests.get(DETAILS_URL, headers=HEADERS)
-    wait = check_rate_limit(resp)
-    if wait:
+async def saldo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    results = await fetch_all(lambda a: a.balances_url)
+    # 1) ¿Rate limit en todas las cuentas?
+    waits = [
+        check_rate_limit(r[0]) if not isinstance(r, BaseException) else None for r in results
+    ]
+    if all(waits):
         return await update.message.reply_text(
-            f"⚠️ Límite de peticiones excedido. Vuelve a intentarlo en {wait}."
+            f"⚠️ Límite de peticiones excedido. Vuelve a intentarlo en {waits[0]}."
         )
 
+    # 2) Si no, un bloque por cuenta y, con varias, el total disponible
+    lines = ["💰 *Saldos disponibles:*"]
+    totales = {}
+    for account, result, wait in zip(ACCOUNTS, results, waits):
+        if len(ACCOUNTS) > 1:
+            lines.append(f"🏦 *{account.name}*")
+        if wait:
+            lines.append(f"⚠️ Límite de peticiones excedido. Vuelve a intentarlo en {wait}.")
+            continue
+        try:
+            if isinstance(result, BaseException):
+                raise result
+            resp, edad = result
+            lines += balance_lines(resp, edad)
+            disponible = balance_cents(resp.json())
+            if disponible is not None:
+                totales[disponible[1]] = totales.get(disponible[1], 0) + disponible[0]
+        except Exception as e:
+            lines.append(f"⚠️ Error al obtener el saldo: {e}")
+    if len(ACCOUNTS) > 1 and totales:
+        lines.append("Σ *Total:* " + ", ".join(
+            f"{format_cents(c)} {moneda}" for moneda, c in sorted(totales.items())
+        ))
+    await update.message.reply_text("\n".join(lines), parse_mode="Markdown")
+
+def details_text(account, result) -> str:
+    """
+    Bloque de /iban de una cuenta a partir de su respuesta de `details`.
+    """
+    titulo = f" ({account.name})" if len(ACCOUNTS) > 1 else ""
     try:
+        # Un fallo al pedirla llega como excepción: se responde igual, sin datos
+        if isinstance(result, BaseException):
+            raise result
+        resp, edad = result
+        wait = check_rate_limit(resp)
+        if wait:
+            return f"⚠️ Límite de peticiones excedido. Vuelve a intentarlo en {wait}."
         resp.raise_for_status()
         acct = resp.json().get("account", {})
         texto = (
-            "🏦 *Detalles de la cuenta:*\n"
+            f"🏦 *Detalles de la cuenta{titulo}:*\n"
             f"• _IBAN_: `{acct.get('iban','N/A')}`\n"
             f"• _BIC_: `{acct.get('bic','N/A')}`\n"
             f"• _Titular_: {acct.get('ownerName','N/A')}\n"
             f"• _Moneda_: {acct.get('currency','EUR')}\n"
-            f"• _Estado_: {acct.get('status','')}"
+            f"• _Estado_: {acct.get('status','')}\n"
+            + age_line(str(resp.request.url), edad)
         )
     except Exception as e:
-        texto = f"⚠️ Error al obtener el IBAN: {e}"
-    await update.message.reply_text(texto, parse_mode="Markdown")
+        if GC_CLIENT.is_down(account.details_url):
+            texto = f"⚠️ _Banco no disponible{titulo}: no hay datos guardados, vuelve a intentarlo más tarde_"
+        else:
+            texto = f"⚠️ Error al obtener el IBAN{titulo}: {md(e)}"
+    return texto
 
 @require_mention
-async def transacciones(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    resp = requests.get(TRANSACTIONS_URL, headers=HEADERS)
-    wait = check_rate_limit(resp)
-    if wait:
-        return await update.message.reply_text(
-            f"⚠️ Límite de peticiones excedido. Vuelve a intentarlo en {wait}."
-        )
+async def iban(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    bloques = []
+    for account, result in zip(ACCOUNTS, await fetch_all(lambda a: a.details_url)):
+        bloques.append(details_text(account, result))
+    await update.message.reply_text("\n\n".join(bloques), parse_mode="Markdown")
 
+@require_mention
+async def transacciones(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # La sincronización va dentro del try: si falla, el usuario recibe el error
+    aviso = None
     try:
-        resp.raise_for_status()
-        txs = resp.json().get("transactions", {}).get("booked", [])
-        if not txs:
+        resp = await sync_transactions()
+        aviso = offline_notice(resp)
+        wait = None if aviso else check_rate_limit(resp)
+        if wait:
+            return await update.message.reply_text(
+                f"⚠️ Límite de peticiones excedido. Vuelve a intentarlo en {wait}."
+            )
+        if resp is not None and not aviso:
+            resp.raise_for_status()
+        ultimas = TX_STORE.recent(6)
+        if not ultimas:
             texto = "No hay transacciones recientes."
         else:
-            ultimas = txs[:6]
             lines = ["🧾 *Últimas 6 transacciones:*"]
             for tx in ultimas:
-                date    = tx.get("bookingDate","")
-                amt     = tx.get("transactionAmount",{}).get("amount","N/A")
-                curr    = tx.get("transactionAmount",{}).get("currency","EUR")
-                contra  = tx.get("creditorName") or tx.get("debtorName") or "—"
-                info    = tx.get("remittanceInformationUnstructuredArray", [])
-                concepto= "; ".join(info) if info else "—"
-                sign    = "" if amt.startswith("-") else "+"
-                lines.append(f"• {date}: {sign}{amt} {curr} — {contra} ({concepto})")
+                contra  = tx.counterparty or "—"
+                concepto= tx.concept or "—"
+                sign    = "" if tx.amount < 0 else "+"
+                lines.append(
+                    f"• {tx.date_text()}: {sign}{tx.amount_text()} {tx.currency} — {contra} ({concepto})"
+                    + account_tag(tx)
+                )
             texto = "\n".join(lines)
     except Exception as e:
         texto = f"⚠️ Error al obtener transacciones: {e}"
+    if aviso:
+        texto = f"{texto}\n\n{aviso}"
+    await update.message.reply_text(texto, parse_mode="Markdown")
+
+# --- Comando /buscar ---
+def parse_search_args(args):
+    """
+    Separa el texto de los filtros `desde:AAAA-MM-DD`, `hasta:AAAA-MM-DD` y
+    `pagina:N` de /buscar. Lanza ValueError si alguno está mal.
+    """
+    palabras, desde, hasta, pagina = [], None, None, 1
+    for arg in args:
+        clave, sep, valor = arg.partition(":")
+        clave = clave.lower()
+        if sep and clave == "desde":
+            desde = date.fromisoformat(valor).toordinal()
+        elif sep and clave == "hasta":
+            hasta = date.fromisoformat(valor).toordinal()
+        elif sep and clave in ("pagina", "página", "p"):
+            pagina = int(valor)
+        else:
+            palabras.append(arg)
+    if not palabras or pagina < 1:
+        raise ValueError
+    return " ".join(palabras), desde, hasta, pagina
+
+@require_mention
+async def buscar(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    global SEARCH_INDEX
+    try:
+        texto_buscado, desde, hasta, pagina = parse_search_args(context.args or [])
+    except ValueError:
+        return await update.message.reply_text(
+            "❌ Uso: /buscar <texto> [desde:AAAA-MM-DD] [hasta:AAAA-MM-DD] [pagina:N]"
+        )
+    aviso = None
+    try:
+        resp = await sync_transactions()
+        aviso = offline_notice(resp)
+        wait = None if aviso else check_rate_limit(resp)
+        if wait:
+            return await update.message.reply_text(
+                f"⚠️ Límite de peticiones excedido. Vuelve a intentarlo en {wait}."
+            )
+        if resp is not None and not aviso:
+            resp.raise_for_status()
+        # El índice se crea la primera vez y luego sólo añade lo nuevo, por
+        # lotes para no bloquear al resto de chats con un histórico grande
+        if SEARCH_INDEX is None or SEARCH_INDEX.store is not TX_STORE:
+            SEARCH_INDEX = SearchIndex(TX_STORE)
+        while SEARCH_INDEX.refresh(limit=BUSCAR_INDEX_BATCH):
+            await asyncio.sleep(0)
+        hits = SEARCH_INDEX.search(texto_buscado, desde, hasta)
+        consulta = " ".join(normalize(texto_buscado)).lower()
+        if not hits:
+            texto = f"🔎 Sin resultados para “{consulta}”."
+        else:
+            paginas = -(-len(hits) // BUSCAR_PAGE_SIZE)
+            pagina = min(pagina, paginas)
+            inicio = (pagina - 1) * BUSCAR_PAGE_SIZE
+            keys = [key for key, _ in hits[inicio:inicio + BUSCAR_PAGE_SIZE]]
+            lines = [f"🔎 *{len(hits)} resultado{'s' if len(hits) != 1 else ''} para “{consulta}”:*"]
+            for tx in TX_STORE.by_keys(keys):
+                contra  = tx.counterparty or "—"
+                concepto= tx.concept or "—"
+                sign    = "" if tx.amount < 0 else "+"
+                lines.append(
+                    f"• {tx.date_text()}: {sign}{tx.amount_text()} {tx.currency} — {contra} ({concepto})"
+                    + account_tag(tx)
+                )
+            if paginas > 1:
+                lines.append(f"Página {pagina}/{paginas} — añade pagina:N para ver más")
+            texto = "\n".join(lines)
+    except Exception as e:
+        texto = f"⚠️ Error en /buscar: {e}"
+    if aviso:
+        texto = f"{texto}\n\n{aviso}"
+    await update.message.reply_text(texto, parse_mode="Markdown")
+
+# --- Comando /resumen ---
+@require_mention
+async def resumen(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not analytics.available():
+        return await update.message.reply_text("⚠️ /resumen necesita NumPy (pip install numpy).")
+    try:
+        meses = int(context.args[0]) if context.args else RESUMEN_MESES
+        if not 1 <= meses <= RESUMEN_MAX_MESES:
+            raise ValueError
+    except ValueError:
+        return await update.message.reply_text(
+            f"❌ Uso: /resumen [meses] (entre 1 y {RESUMEN_MAX_MESES})"
+        )
+    aviso = None
+    try:
+        resp = await sync_transactions()
+        aviso = offline_notice(resp)
+        wait = None if aviso else check_rate_limit(resp)
+        if wait:
+            return await update.message.reply_text(
+                f"⚠️ Límite de peticiones excedido. Vuelve a intentarlo en {wait}."
+            )
+        if resp is not None and not aviso:
+            resp.raise_for_status()
+        hueco = await backfill_transactions(months_back(meses), fetch=not aviso)
+        filas, principales = analytics.summarize(analytics.snapshot(TX_STORE), meses)
+        lines = [f"📊 *Resumen de los últimos {meses} meses:*"]
+        for mes, n, ingresos, gastos, neto in filas:
+            if not n:
+                continue
+            sign = "" if neto < 0 else "+"
+            lines.append(
+                f"• {mes}: +{format_cents(ingresos)} / -{format_cents(gastos)} "
+                f"= {sign}{format_cents(neto)} EUR ({n} mov.)"
+            )
+        if len(lines) == 1:
+            lines.append("No hay transacciones en ese periodo.")
+        if principales:
+            lines.append("")
+            lines.append("💸 *Donde más se gasta:*")
+            for nombre, gasto in principales:
+                lines.append(f"• {nombre}: {format_cents(gasto)} EUR")
+        texto = "\n".join(lines)
+        if hueco:
+            texto = f"{texto}\n\n{hueco}"
+    except Exception as e:
+        texto = f"⚠️ Error en /resumen: {e}"
+    if aviso:
+        texto = f"{texto}\n\n{aviso}"
     await update.message.reply_text(texto, parse_mode="Markdown")
 
+# --- Comando /exportar ---
+@require_mention
+async def exportar(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    args = context.args or []
+    try:
+        desde, hasta = date.fromisoformat(args[0]), date.fromisoformat(args[1])
+        formato = args[2].lower() if len(args) > 2 else "csv"
+        if desde > hasta or formato not in ("csv", "parquet") or len(args) > 3:
+            raise ValueError
+    except (IndexError, ValueError):
+        return await update.message.reply_text(
+            "❌ Uso: /exportar AAAA-MM-DD AAAA-MM-DD [csv|parquet]"
+        )
+    if formato not in export.FORMATS:
+        return await update.message.reply_text("⚠️ Parquet necesita pyarrow (pip install pyarrow).")
+    path = None
+    aviso = None
+    try:
+        resp = await sync_transactions()
+        aviso = offline_notice(resp)
+        wait = None if aviso else check_rate_limit(resp)
+        if wait:
+            return await update.message.reply_text(
+                f"⚠️ Límite de peticiones excedido. Vuelve a intentarlo en {wait}."
+            )
+        if resp is not None and not aviso:
+            resp.raise_for_status()
+        hueco = await backfill_transactions(desde, fetch=not aviso)
+        path, n = await export.export(TX_STORE, desde, hasta, formato)
+        if not n:
+            return await update.message.reply_text(
+                "No hay transacciones en ese periodo." + (f"\n\n{hueco}" if hueco else ""),
+                parse_mode="Markdown",
+            )
+        # Se sube desde disco: la lista completa nunca llega a estar en memoria
+        with open(path, "rb") as f:
+            await update.message.reply_document(
+                f,
+                filename=f"transacciones_{desde}_{hasta}.{formato}",
+                caption=f"📤 {n} transacciones del {desde} al {hasta}."
+                + (f"\n{hueco}" if hueco else "")
+                + (f"\n{aviso}" if aviso else ""),
+                parse_mode="Markdown",
+            )
+    except Exception as e:
+        await update.message.reply_text(f"⚠️ Error en /exportar: {e}")
+    finally:
+        if path:
+            os.remove(path)
+
 # --- Comando /putoAntonio ---
 @require_mention
 async def putoAntonio(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -244,90 +758,79 @@ async def putoAntonio(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         primer_mes_anterior = hoy.replace(month=hoy.month-1, day=1)
     else:
         primer_mes_anterior = hoy.replace(year=hoy.year-1, month=12, day=1)
-    params = {
-        "date_from": primer_mes_anterior.strftime("%Y-%m-%d"),
-        "date_to": hoy.strftime("%Y-%m-%d")
-    }
-    resp = requests.get(TRANSACTIONS_URL, headers=HEADERS, params=params)
-    wait = check_rate_limit(resp)
-    if wait:
-        return await update.message.reply_text(
-            f"⚠️ Límite de peticiones excedido. Vuelve a intentarlo en {wait}."
-        )
+    aviso = None
     try:
-        resp.raise_for_status()
-        txs = resp.json().get("transactions", {}).get("booked", [])
-        candidatos = [
-            tx for tx in txs
-            if float(tx.get("transactionAmount",{}).get("amount","0")) == -800.0
-        ]
-        if not candidatos:
+        resp = await sync_transactions()
+        aviso = offline_notice(resp)
+        wait = None if aviso else check_rate_limit(resp)
+        if wait:
+            return await update.message.reply_text(
+                f"⚠️ Límite de peticiones excedido. Vuelve a intentarlo en {wait}."
+            )
+        if resp is not None and not aviso:
+            resp.raise_for_status()
+        # Vienen de la más reciente a la más antigua: basta con la primera
+        txs = TX_STORE.between(primer_mes_anterior.date(), hoy.date())
+        ultima = next((tx for tx in txs if tx.amount == -ALQUILER_CENTS), None)
+        if ultima is None:
             texto = "No se encontró ninguna transferencia de 800 € en el rango de este y mes anterior."
         else:
-            ultima = max(candidatos, key=lambda t: t.get("bookingDate",""))
-            fecha = ultima.get("bookingDate","")
-            contra = ultima.get("creditorName") or ultima.get("debtorName") or "—"
+            contra = ultima.counterparty or "—"
             texto = (
-                f"😈 */putoAntonio*: La última transferencia de 800 € fue el {fecha} "
-                f"a *{contra}* (ID: `{ultima.get('transactionId')}`)."
+                f"😈 */putoAntonio*: La última transferencia de 800 € fue el {ultima.date_text()} "
+                f"a *{contra}* (ID: `{ultima.id}`)."
             )
     except Exception as e:
         texto = f"⚠️ Error en /putoAntonio: {e}"
+    if aviso:
+        texto = f"{texto}\n\n{aviso}"
     await update.message.reply_text(texto, parse_mode="Markdown")
 
 # --- Comando /morosos ---
 @require_mention
 async def morosos(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    hoy = datetime.today()
-    hace_20 = hoy - timedelta(days=20)
-    params = {"date_from": hace_20.strftime("%Y-%m-%d"), "date_to": hoy.strftime("%Y-%m-%d")}
-    resp = requests.get(TRANSACTIONS_URL, headers=HEADERS, params=params)
-    wait = check_rate_limit(resp)
-    if wait:
+    # /morosos [meses]: sin argumento, los últimos días; con él, mes a mes
+    try:
+        meses = int(context.args[0]) if context.args else 0
+        if not 0 <= meses <= MOROSOS_MAX_MESES:
+            raise ValueError
+    except ValueError:
         return await update.message.reply_text(
-            f"⚠️ Límite de peticiones excedido. Vuelve a intentarlo en {wait}."
+            f"❌ Uso: /morosos [meses] (como mucho {MOROSOS_MAX_MESES})"
         )
-
+    aviso = None
     try:
-        resp.raise_for_status()
-        txs = resp.json().get("transactions", {}).get("booked", [])
-        personas = {"Marco": False, "Alejandro": False, "Luis Miguel": False}
-        for tx in txs:
-            amt = float(tx.get("transactionAmount",{}).get("amount","0"))
-            if amt >= 200.0:
-                nombre = tx.get("debtorName","").upper()
-                if "LUIS MIGUEL" in nombre:
-                    personas["Luis Miguel"] = True
-                elif "ALEJANDRO" in nombre:
-                    personas["Alejandro"] = True
-                elif "MARCO" in nombre:
-                    personas["Marco"] = True
-
-        hechos  = [p for p,v in personas.items() if v]
-        morosos= [p for p,v in personas.items() if not v]
-        lines  = ["📋 */morosos* (últimos 20 días y 200 €):"]
-        if hechos:
-            lines.append("• Han pagado:")
-            for p in hechos: lines.append(f"   – {p}")
+        resp = await sync_transactions()
+        aviso = offline_notice(resp)
+        wait = None if aviso else check_rate_limit(resp)
+        if wait:
+            return await update.message.reply_text(
+                f"⚠️ Límite de peticiones excedido. Vuelve a intentarlo en {wait}."
+            )
+        if resp is not None and not aviso:
+            resp.raise_for_status()
+        if meses:
+            hueco = await backfill_transactions(months_back(meses), fetch=not aviso)
+            texto = get_morosos_history(meses)
+            if hueco:
+                texto = f"{texto}\n\n{hueco}"
         else:
-            lines.append("• Nadie ha pagado aún.")
-        if morosos:
-            lines.append("• Morosos:")
-            for p in morosos: lines.append(f"   – {p}")
-        texto = "\n".join(lines)
+            texto = get_morosos_text(f"📋 */morosos* (últimos {MOROSOS_DIAS} días):")
     except Exception as e:
         texto = f"⚠️ Error en /morosos: {e}"
+    if aviso:
+        texto = f"{texto}\n\n{aviso}"
     await update.message.reply_text(texto, parse_mode="Markdown")
 
 
 # --- Comando /recordatorio (modificado) ---
 @require_mention
 async def recordatorio(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    global REMINDER_COUNTER, REMINDERS
-    # Límite de recordatorios
-    if len(REMINDERS) >= MAX_REMINDERS:
+    sync_reminders(context.application.job_queue)
+    # Límite de recordatorios por chat
+    if REMINDERS.count_for_chat(update.effective_chat.id) >= MAX_REMINDERS:
         return await update.message.reply_text(
-            f"❌ Has alcanzado el límite de {MAX_REMINDERS} recordatorios."
+            f"❌ Has alcanzado el límite de {MAX_REMINDERS} recordatorios en este chat."
         )
 
     try:
@@ -359,18 +862,8 @@ async def recordatorio(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         ahora_str = ahora.strftime("%d/%m/%Y %H:%M")
 
         # Generar ID y programar recordatorio
-        REMINDER_COUNTER += 1
-        reminder_id = REMINDER_COUNTER
-        segundos_espera = delta.total_seconds()
-        job = context.application.job_queue.run_once(
-            alarm_callback,
-            when=segundos_espera,
-            chat_id=update.effective_chat.id,
-            data=mensaje,
-            name=f"recordatorio_{update.effective_chat.id}_{int(dt_record.timestamp())}"
-        )
-        REMINDERS[reminder_id] = job
-        save_reminders()
+        reminder_id = REMINDERS.add(update.effective_chat.id, dt_record, mensaje).id
+        arm_reminder_timer(context.application.job_queue)
 
         await update.message.reply_text(
             "👌 Recordatorio programado correctamente:\n"
@@ -385,146 +878,310 @@ async def recordatorio(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
             "❌ Uso: /recordatorio YYYY-MM-DD HH:MM <tu mensaje>"
         )
 
+# --- Comando /recordatorioRecurrente ---
+@require_mention
+async def recordatorio_recurrente(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    sync_reminders(context.application.job_queue)
+    chat_id = update.effective_chat.id
+    if REMINDERS.count_for_chat(chat_id) >= MAX_REMINDERS:
+        return await update.message.reply_text(
+            f"❌ Has alcanzado el límite de {MAX_REMINDERS} recordatorios en este chat."
+        )
+
+    try:
+        regla, resto = parse_rule_args(context.args)
+        hora, minuto = (int(x) for x in resto[0].split(":"))
+        mensaje = " ".join(resto[1:])
+        if not mensaje:
+            raise ValueError("Falta el mensaje")
+        primero = regla.first(hora, minuto, datetime.now())
+    except Exception:
+        return await update.message.reply_text(
+            "❌ Uso: /recordatorioRecurrente mensual <día> HH:MM <mensaje>\n"
+            "      /recordatorioRecurrente cada <n> HH:MM <mensaje>  (cada n días)\n"
+            "      /recordatorioRecurrente diario|semanal HH:MM <mensaje>"
+        )
+
+    r = REMINDERS.add(chat_id, primero, mensaje, rule=regla)
+    arm_reminder_timer(context.application.job_queue)
+    await update.message.reply_text(
+        "🔁 Recordatorio recurrente programado:\n"
+        f"• ID: {r.id}\n"
+        f"• Repetición: {regla.describe()}\n"
+        f"• Próximo: {primero.strftime('%d/%m/%Y %H:%M')}\n"
+        f"• Mensaje: “{mensaje}”"
+    )
+
 # --- Nuevo comando /ListaRecordatorios ---
 @require_mention
 async def lista_recordatorios(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    if not REMINDERS:
+    sync_reminders(context.application.job_queue)
+    chat_id = update.effective_chat.id
+    try:
+        pagina = max(1, int(context.args[0])) if context.args else 1
+    except ValueError:
+        return await update.message.reply_text("❌ Uso: /ListaRecordatorios [página]")
+
+    total = REMINDERS.count_for_chat(chat_id)
+    paginas = max(1, -(-total // REMINDERS_PAGE_SIZE))
+    pagina = min(pagina, paginas)
+    pendientes = REMINDERS.for_chat(
+        chat_id, offset=(pagina - 1) * REMINDERS_PAGE_SIZE, limit=REMINDERS_PAGE_SIZE
+    )
+    if not pendientes:
         texto = "No hay recordatorios programados."
     else:
         lines = ["📋 *Recordatorios pendientes:*"]
-        for rid, job in REMINDERS.items():
-            run_at = job.next_t.strftime("%d/%m/%Y %H:%M")
-            msg    = job.data
-            lines.append(f"• ID {rid}: Para {run_at} — “{msg}”")
+        for r in pendientes:
+            run_at = r.run_at.strftime("%d/%m/%Y %H:%M")
+            repeticion = f" ({r.rule.describe()})" if r.rule else ""
+            lines.append(f"• ID {r.id}: Para {run_at}{repeticion} — “{r.message}”")
+        if paginas > 1:
+            lines.append(f"Página {pagina}/{paginas} — /ListaRecordatorios <página>")
         texto = "\n".join(lines)
     await update.message.reply_text(texto, parse_mode="Markdown")
 
 # --- Nuevo comando /borrarRecordatorio ---
 @require_mention
 async def borrar_recordatorio(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    global REMINDERS
     try:
         # 1. Convertir el argumento a entero
         rid = int(context.args[0])
     except (IndexError, ValueError):
         return await update.message.reply_text("❌ Uso: /borrarRecordatorio <id>")
 
-    # 2. Buscar el job en memoria
-    job = REMINDERS.get(rid)
-    if job is None:
-        # Si no existe, informamos y no tocamos el fichero
+    # 2. Buscar el recordatorio (sólo los de este chat; con varios procesos,
+    #    quizá lo creó otro)
+    sync_reminders(context.application.job_queue)
+    r = REMINDERS.get(rid)
+    if r is None or r.chat_id != update.effective_chat.id:
+        # Si no existe, informamos y no tocamos la base
         texto = f"❌ No existe un recordatorio con ID {rid}."
     else:
-        # 3. Desprogramar el job y eliminar de REMINDERS
-        job.schedule_removal()
-        del REMINDERS[rid]
-
-        # 4. Actualizar el JSON con la lista restante
-        save_reminders()
+        # 3. Eliminarlo de memoria y de la base; el temporizador se reajusta
+        REMINDERS.remove(rid)
+        arm_reminder_timer(context.application.job_queue)
 
         texto = f"🗑️ Recordatorio ID {rid} eliminado."
 
     await update.message.reply_text(texto)
 
 
+# --- Comando /stats (solo administrador) ---
+
+def describe_quantile(histogram, q, **labels) -> str:
+    """
+    Cuantil aproximado de un histograma como cota de su bucket ("≤50 ms", ">30 s").
+    """
+    seconds = histogram.quantile(q, **labels)
+    if seconds is None:
+        return "-"
+    if seconds == float("inf"):
+        return f">{histogram.buckets[-1]:g} s"
+    if seconds < 1:
+        return f"≤{seconds * 1000:g} ms"
+    return f"≤{seconds:g} s"
+
+def md(value) -> str:
+    """
+    Etiqueta (handler, endpoint, motivo...) lista para un mensaje en
+    Markdown: `token_new` sin escapar deja un `_` abierto y Telegram
+    rechaza el mensaje entero.
+    """
+    return escape_markdown(str(value))
+
+@require_mention
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if update.effective_chat.id != ADMIN_CHAT_ID:
+        return await update.message.reply_text("⛔ Este comando es solo para el administrador.")
+
+    lines = ["📊 *Estadísticas del bot*", "", "*Handlers* (veces · p50 · p99):"]
+    for (handler,) in sorted(HANDLER_LATENCY.series):
+        lines.append(
+            f"• {md(handler)}: {HANDLER_LATENCY.count(handler=handler)} · "
+            f"{describe_quantile(HANDLER_LATENCY, 0.5, handler=handler)} · "
+            f"{describe_quantile(HANDLER_LATENCY, 0.99, handler=handler)}"
+        )
+
+    lines += ["", "*Banco* (endpoint · estado · origen):"]
+    for (endpoint, status, origin), n in sorted(UPSTREAM_REQUESTS.values.items()):
+        lines.append(f"• {md(endpoint)} · {md(status)} · {md(origin)}: {n}")
+    lines.append(f"429 mostrados al usuario: {int(sum(RATE_LIMITED.values.values()))}")
+    descartados = ", ".join(f"{md(motivo)} {n}" for (motivo,), n in sorted(UPDATES_DROPPED.values.items()))
+    lines.append(f"Updates descartados: {descartados or 'ninguno'}")
+    enviados = ", ".join(f"{md(r)} {n}" for (r,), n in sorted(OUTBOUND_MESSAGES.values.items()))
+    lines.append(f"Cola de salida: {len(OUTBOX)} pendientes ({enviados or 'sin envíos'})")
+    if LEADER is not None:
+        papel = "líder" if LEADER.is_leader else f"de apoyo (líder: {LEADER.holder()})"
+        lines.append(f"Proceso {os.getpid()}: {papel}")
+    for (account, endpoint), b in sorted(GC_CLIENT.breakers.items()):
+        if b.state != CLOSED:
+            lines.append(f"⛔ Circuito {md(endpoint)} ({md(account)}) {b.state}, prueba en {b.retry_in()} s")
+
+    cache = RESPONSE_CACHE.counters
+    lines += ["", "*Caché*: " + ", ".join(
+        f"{resultado} {sum(n for (_, r), n in cache.items() if r == resultado)}"
+        for resultado in ("hit", "stale", "miss")
+    )]
+    lines.append(
+        f"*Recordatorios*: {len(REMINDERS)} pendientes, "
+        f"retraso p99 {describe_quantile(REMINDER_LAG, 0.99)}"
+    )
+    await update.message.reply_text("\n".join(lines), parse_mode="Markdown")
+
+
 # --- Comando desconocido ---
 
 async def unknown(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await update.message.reply_text(
         "Comando no reconocido. Prueba con alguno de estos:\n"
-        "/hola, /fecha, /saldo, /iban, /transacciones, /putoAntonio, /morosos,\n"
-        "/recordatorio, /ListaRecordatorios, /borrarRecordatorio,\n"
-        "/Rata, /InsultarMarco, /Huevos, /QuienEsElMejorBotDelMundo"
+        "/hola, /fecha, /saldo, /iban, /transacciones, /buscar, /resumen, /exportar, /putoAntonio, /morosos,\n"
+        "/recordatorio, /recordatorioRecurrente, /ListaRecordatorios, /borrarRecordatorio,\n"
+        "/stats, /Rata, /InsultarMarco, /Huevos, /QuienEsElMejorBotDelMundo"
     )
 
 
 # --- Lógica auxiliar para morosos ---
 
-def get_morosos_text() -> str:
-    hoy = datetime.today()
-    hace_20 = hoy - timedelta(days=20)
-    params = {
-        "date_from": hace_20.strftime("%Y-%m-%d"),
-        "date_to": hoy.strftime("%Y-%m-%d")
-    }
-    personas = {"Marco": False, "Alejandro": False, "Luis Miguel": False}
-    resp = requests.get(TRANSACTIONS_URL, headers=HEADERS, params=params)
-    resp.raise_for_status()
-    txs = resp.json().get("transactions", {}).get("booked", [])
-    for tx in txs:
-        amt = float(tx["transactionAmount"]["amount"])
-        if amt >= 200.0:
-            nombre = tx.get("debtorName","").upper()
-            if "LUIS MIGUEL" in nombre:
-                personas["Luis Miguel"] = True
-            elif "ALEJANDRO" in nombre:
-                personas["Alejandro"] = True
-            elif "MARCO" in nombre:
-                personas["Marco"] = True
-    hechos = [p for p,v in personas.items() if v]
-    morosos = [p for p,v in personas.items() if not v]
-    lines = ["📋 *Morosos* (automático):"]
+def get_morosos_text(titulo="📋 *Morosos* (automático):") -> str:
+    """
+    Informe de morosos de los últimos MOROSOS_DIAS días a partir de los
+    datos locales (el llamante sincroniza).
+    """
+    hoy = date.today()
+    desde = hoy - timedelta(days=MOROSOS_DIAS)
+    txs = TX_STORE.between(desde, hoy)
+    totals = PAYMENTS.evaluate(txs, [(desde.toordinal(), hoy.toordinal())])[0]
+    hechos, morosos = PAYMENTS.paid(totals)
+    lines = [titulo]
     if hechos:
         lines.append("• Han pagado:")
-        for p in hechos: lines.append(f"   – {p}")
+        for r in hechos: lines.append(f"   – {r.name}")
     else:
         lines.append("• Nadie ha pagado aún.")
     if morosos:
         lines.append("• Morosos:")
-        for p in morosos: lines.append(f"   – {p}")
+        for r in morosos:
+            lines.append(f"   – {r.name} ({format_cents(totals.get(r, 0))} de {r.describe_amount()})")
+    return "\n".join(lines)
+
+def get_morosos_history(meses) -> str:
+    """
+    Quién ha pagado en cada uno de los últimos `meses` meses naturales
+    (el actual incluido), evaluados todos en una sola pasada.
+    """
+    hoy = date.today()
+    periodos, etiquetas = [], []
+    year, month = hoy.year, hoy.month
+    for _ in range(meses):
+        inicio = date(year, month, 1)
+        fin = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+        periodos.append((inicio.toordinal(), min(fin, hoy).toordinal()))
+        etiquetas.append(f"{year}-{month:02d}")
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    txs = TX_STORE.between(date.fromordinal(periodos[-1][0]), hoy)
+    lines = [f"📋 */morosos* (últimos {meses} meses):"]
+    for etiqueta, totals in zip(etiquetas, PAYMENTS.evaluate(txs, periodos)):
+        hechos, morosos = PAYMENTS.paid(totals)
+        estado = ", ".join(f"✅ {r.name}" for r in hechos)
+        if morosos:
+            estado += (" · " if estado else "") + ", ".join(f"❌ {r.name}" for r in morosos)
+        lines.append(f"• {etiqueta}: {estado}")
     return "\n".join(lines)
 
-# --- Callback programado: morosos el día 29 (y 26 feb) ---
+# --- Instantánea de transacciones compartida por las tareas programadas ---
+async def prefetch_transactions():
+    """
+    Sincronización forzada con el banco, una sola vez al día para todas las
+    tareas programadas que se disparen ese día. Devuelve la respuesta
+    upstream, o None si otra tarea ya la hizo.
+    """
+    async with SNAPSHOT_LOCK:
+        hoy = date.today()
+        # Si una cuenta falló, al reintentar sólo se vuelve a pedir ésa
+        pendientes = [a for a in ACCOUNTS if SNAPSHOT_DAYS.get(a.id) != hoy]
+        if not pendientes:
+            return None
+        resps = await sync_accounts(pendientes, force=True, priority=PRIORITY_SCHEDULED)
+        for account, resp in zip(pendientes, resps):
+            if resp is not None and resp.status_code == 200:
+                SNAPSHOT_DAYS[account.id] = hoy
+        return worst_response(resps)
+
+async def retry_if_rate_limited(context, resp, callback, name) -> bool:
+    """
+    Si el banco devolvió 429, avisa y reprograma `callback` para cuando
+    indique Retry-After. Devuelve True si hubo que reprogramar.
+    """
+    if resp is None or resp.status_code != 429:
+        return False
+    retry = int(resp.headers.get("Retry-After", 60))
+    OUTBOX.send(
+        ADMIN_CHAT_ID,
+        "⚠️ *Mensaje automático:* Límite de peticiones alcanzado. "
+        f"Reintentando en {retry}s…",
+        parse_mode="Markdown",
+    )
+    # reprogamamos este mismo callback para dentro de `retry` segundos
+    context.job_queue.run_once(callback, when=retry, name=name)
+    return True
+
+def schedule_monthly(job_queue, trigger, callback, name, after=None):
+    """
+    Programa `callback` para el próximo disparo de `trigger` y, tras
+    ejecutarse, vuelve a programarlo para el siguiente.
+    """
+    now = datetime.now()
+    fire = trigger.next_fire(max(after, now) if after else now)
+
+    async def run(context: ContextTypes.DEFAULT_TYPE) -> None:
+        try:
+            await callback(context)
+        finally:
+            schedule_monthly(context.job_queue, trigger, callback, name, after=fire)
+
+    # La hora de `fire` es la local de ese día: con zona horaria, el cambio
+    # de hora entre hoy y el disparo no lo adelanta ni lo retrasa
+    job_queue.run_once(run, when=fire.astimezone(), name=name)
+
+# --- Callback programado: morosos el día 29 (26 en febrero) ---
+# Envueltas ya al definirlas: el reintento tras un 429 reprograma este mismo
+# nombre y debe seguir cronometrado y ejecutándose sólo en el líder
+@leader_only
+@timed
 async def scheduled_morosos(context: ContextTypes.DEFAULT_TYPE) -> None:
-    hoy = datetime.now()
-    if hoy.day == 29 or (hoy.month == 2 and hoy.day == 26):
+    try:
+        resp = await prefetch_transactions()
+        if await retry_if_rate_limited(context, resp, scheduled_morosos, "morosos_retry"):
+            return
+        if resp is not None:
+            resp.raise_for_status()
         texto = get_morosos_text()
-        await context.bot.send_message(
-            chat_id=ADMIN_CHAT_ID,
-            text="⏰ *Mensaje automático:*\n" + texto,
-            parse_mode="Markdown"
-        )
+        OUTBOX.send(ADMIN_CHAT_ID, "⏰ *Mensaje automático:*\n" + texto, parse_mode="Markdown")
+    except httpx.HTTPError as e:
+        OUTBOX.send(ADMIN_CHAT_ID, f"⚠️ *Error automático:* {e}", parse_mode="Markdown")
 
 # --- Callback programado: chequeo mensual de alquiler ---
-from requests.exceptions import HTTPError
-
+@leader_only
+@timed
 async def scheduled_rent(context: ContextTypes.DEFAULT_TYPE) -> None:
-    # Solo corremos si es día 13 (en producción sería == 1)
+    # El disparador mensual garantiza que hoy toca (día 1)
     hoy = datetime.today()
-    if hoy.day != 1:
-        return
-
     hace_10 = hoy - timedelta(days=10)
-    params = {
-        "date_from": hace_10.strftime("%Y-%m-%d"),
-        "date_to": hoy.strftime("%Y-%m-%d")
-    }
 
     try:
-        resp = requests.get(TRANSACTIONS_URL, headers=HEADERS, params=params)
+        # El informe automático parte de la instantánea fresca del día
+        resp = await prefetch_transactions()
         # Si la cabecera indica Retry-After, reprogramamos el mismo job
-        if resp.status_code == 429:
-            retry = int(resp.headers.get("Retry-After", 60))
-            await context.bot.send_message(
-                chat_id=ADMIN_CHAT_ID,
-                text=(
-                    "⚠️ *Mensaje automático:* Límite de peticiones alcanzado. "
-                    f"Reintentando en {retry}s…"
-                ),
-                parse_mode="Markdown"
-            )
-            # reprogamamos este mismo callback para dentro de `retry` segundos
-            context.job_queue.run_once(scheduled_rent, when=retry, name="rent_retry")
+        if await retry_if_rate_limited(context, resp, scheduled_rent, "rent_retry"):
             return
 
         # Esto lanzará HTTPError para otros 4xx/5xx
-        resp.raise_for_status()
+        if resp is not None:
+            resp.raise_for_status()
 
-        txs = resp.json().get("transactions", {}).get("booked", [])
-        paid = any(
-            abs(float(tx["transactionAmount"]["amount"])) > 800.0
-            for tx in txs
-        )
+        txs = TX_STORE.between(hace_10.date(), hoy.date())
+        paid = any(abs(tx.amount) > ALQUILER_CENTS for tx in txs)
 
         if paid:
             texto = "⏰ *Mensaje automático:* Ya se ha pagado la mensualidad al casero."
@@ -534,52 +1191,80 @@ async def scheduled_rent(context: ContextTypes.DEFAULT_TYPE) -> None:
                 + get_morosos_text()
             )
 
-        await context.bot.send_message(
-            chat_id=ADMIN_CHAT_ID, text=texto, parse_mode="Markdown"
-        )
+        OUTBOX.send(ADMIN_CHAT_ID, texto, parse_mode="Markdown")
 
-    except HTTPError as e:
+    except httpx.HTTPError as e:
         # Captura errores distintos a 429
-        await context.bot.send_message(
-            chat_id=ADMIN_CHAT_ID,
-            text=f"⚠️ *Error automático:* {e}",
-            parse_mode="Markdown"
-        )
+        OUTBOX.send(ADMIN_CHAT_ID, f"⚠️ *Error automático:* {e}", parse_mode="Markdown")
     except Exception as e:
         # Cualquier otra cosa inesperada
-        await context.bot.send_message(
-            chat_id=ADMIN_CHAT_ID,
-            text=f"❌ *Error inesperado:* {e}",
-            parse_mode="Markdown"
-        )
+        OUTBOX.send(ADMIN_CHAT_ID, f"❌ *Error inesperado:* {e}", parse_mode="Markdown")
+
+# --- Sondeo de transacciones nuevas y avisos ---
+def balance_cents(data):
+    """
+    Saldo disponible (céntimos, moneda) de una respuesta de `balances`.
+    """
+    balances = data.get("balances", [])
+    if not balances:
+        return None
+    preferidos = ("interimAvailable", "closingBooked", "expected")
+    bal = min(
+        balances,
+        key=lambda b: preferidos.index(b.get("balanceType")) if b.get("balanceType") in preferidos else 99,
+    )
+    importe = bal.get("balanceAmount", {})
+    return parse_cents(importe.get("amount", "0")), importe.get("currency", "EUR")
+
+async def poll_transactions(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Sondeo periódico: sincroniza si los datos tienen más de un intervalo
+    (como mucho POLL_PER_DAY llamadas al día) y pasa por EVENT_RULES las
+    transacciones que han llegado desde la última marca, la hayan traído
+    el sondeo o un comando. Los avisos van a ADMIN_CHAT_ID.
+    """
+    intervalo = 86400 / POLL_PER_DAY
+    resp = await sync_transactions(max_age=intervalo * 0.9)
+    if resp is not None and resp.status_code != 200:
+        print(f"Sondeo de transacciones: el banco respondió {resp.status_code}")
+
+    marca = TX_STORE.event_mark()
+    if marca is None:
+        # Primera vez: no se avisa de todo el histórico, sólo de lo que llegue
+        TX_STORE.set_event_mark(TX_STORE.latest_seen())
+        nuevas = []
+    else:
+        nuevas = TX_STORE.seen_since(marca)
+    events = [TransactionEvent(tx) for _, tx in nuevas]
+
+    if MIN_BALANCE_CENTS is not None:
+        # El saldo mínimo se vigila en la cuenta principal
+        url = ACCOUNTS[0].balances_url
+        resp_saldo, _ = await RESPONSE_CACHE.get(url, lambda: GC_CLIENT.get(url))
+        saldo = balance_cents(resp_saldo.json()) if resp_saldo.status_code == 200 else None
+        if saldo is not None:
+            events.append(BalanceEvent(*saldo))
+
+    for aviso in EVENT_RULES.process(events):
+        OUTBOX.send(ADMIN_CHAT_ID, aviso, parse_mode="Markdown")
+    if nuevas:
+        TX_STORE.set_event_mark(nuevas[-1][0])
 
 # --- Callback de alarma ---
 async def alarm_callback(context: ContextTypes.DEFAULT_TYPE) -> None:
-    global REMINDERS
-    job = context.job
-    chat_id = job.chat_id
-    mensaje = job.data
-
-    # 1. Enviar la notificación
-    await context.bot.send_message(chat_id, f"⏰ Recordatorio: {mensaje}")
-
-    # 2. Quitarlo de la lista en memoria
-    rid_to_remove = None
-    for rid, j in REMINDERS.items():
-        if j is job:
-            rid_to_remove = rid
-            break
-
-    if rid_to_remove is not None:
-        del REMINDERS[rid_to_remove]
-        save_reminders()
-
-    # 3. Intentar desprogramarlo en APScheduler
-    try:
-        job.schedule_removal()
-    except JobLookupError:
-        # Ya no estaba en el scheduler, pero no pasa nada
-        pass
+    global REMINDER_TIMER
+    REMINDER_TIMER = None
+
+    # 1. Sacar todos los recordatorios vencidos (los recurrentes ya reprogramados)
+    now = datetime.now()
+    for rid, chat_id, mensaje, run_at in REMINDERS.pop_due(now):
+        REMINDER_LAG.observe(max(0.0, (now - run_at).total_seconds()))
+        # 2. A la cola de salida: los del mismo chat y minuto se envían juntos
+        #    y, si Telegram frena o falla, se reintentan
+        OUTBOX.send(chat_id, f"⏰ Recordatorio: {mensaje}")
+
+    # 3. Programar el siguiente
+    arm_reminder_timer(context.job_queue)
 
 @require_mention
 async def get_id(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -670,57 +1355,231 @@ async def quien_es_mejor_bot(update: Update, context: ContextTypes.DEFAULT_TYPE)
     await update.message.reply_text(random.choice(respuestas))
 
 
-def main() -> None:
-    global TELEGRAM_TOKEN, GO_CARDLESS_TOKEN, ACCOUNT_ID
-    app = ApplicationBuilder().token(TELEGRAM_TOKEN).build()
+async def on_startup(app) -> None:
+    """
+    Arranca la cola de salida y el servidor de métricas si se pidió un
+    puerto, y obtiene el primer token de GoCardless (así unas credenciales
+    malas se ven al arrancar).
+    """
+    global METRICS_SERVER
+    OUTBOX.start(app.bot)
+    if METRICS_PORT:
+        METRICS_SERVER = await start_metrics_server(METRICS_LISTEN, METRICS_PORT)
+        print(f"Métricas en http://{METRICS_LISTEN}:{METRICS_PORT}/metrics")
+    try:
+        if GC_CLIENT.auth is not None:
+            await GC_CLIENT.auth.token()
+    except (TokenError, httpx.HTTPError) as e:
+        print(f"⚠️ No se pudo obtener el token de GoCardless: {e}")
+
+
+async def on_stop(app) -> None:
+    """
+    Envía lo que quede en la cola de salida mientras el bot aún puede hablar
+    con Telegram (las tareas programadas ya están paradas).
+    """
+    await OUTBOX.stop()
+
+
+async def on_shutdown(app) -> None:
+    """
+    Cierra el pool de conexiones con GoCardless y la base local al apagar el bot.
+    """
+    global METRICS_SERVER
+    if METRICS_SERVER is not None:
+        METRICS_SERVER.close()
+        METRICS_SERVER = None
+    await GC_CLIENT.aclose()
+    TX_STORE.close()
+    if is_leader():
+        REMINDER_STORE.compact()
+    REMINDER_STORE.close()
+    if LEADER is not None:
+        # Relevo inmediato: los procesos de reserva no esperan a que muera éste
+        LEADER.release()
+
+
+def build_application(token, base_url=None, workers=UPDATE_WORKERS,
+                      processor_class=PerChatUpdateProcessor):
+    """
+    Crea la Application con todos los handlers y tareas programadas.
+    `base_url` permite apuntar a una Bot API distinta (p. ej. un stub local).
+    Los updates de chats distintos se procesan en paralelo (hasta `workers`)
+    y los de un mismo chat en orden.
+    """
+    builder = (
+        ApplicationBuilder()
+        .token(token)
+        .concurrent_updates(processor_class(workers))
+        .post_init(on_startup)
+        .post_stop(on_stop)
+        .post_shutdown(on_shutdown)
+    )
+    if base_url:
+        builder = builder.base_url(base_url)
+    app = builder.build()
     load_reminders(app)
 
-    # Registro de handlers
-    app.add_handler(CommandHandler("recordatorio", recordatorio))
-    app.add_handler(CommandHandler("ListaRecordatorios", lista_recordatorios))
-    app.add_handler(CommandHandler("borrarRecordatorio", borrar_recordatorio))
-    app.add_handler(CommandHandler("hola", hola))
-    app.add_handler(CommandHandler("fecha", fecha))
-    app.add_handler(CommandHandler("saldo", saldo))
-    app.add_handler(CommandHandler("iban", iban))
-    app.add_handler(CommandHandler("transacciones", transacciones))
-    app.add_handler(CommandHandler("putoAntonio", putoAntonio))
-    app.add_handler(CommandHandler("morosos", morosos))
-    app.add_handler(CommandHandler("chatid", get_id))
-    app.add_handler(CommandHandler("Rata", rata))
-    app.add_handler(CommandHandler("InsultarMarco", insultar_marco))
-    app.add_handler(CommandHandler("Huevos", huevos))
-    app.add_handler(CommandHandler("QuienEsElMejorBotDelMundo", quien_es_mejor_bot))
-    app.add_handler(MessageHandler(filters.COMMAND, unknown))
+    # Antes que ningún handler: fuera lo que no va dirigido al bot en grupos
+    # y las órdenes de quien (o del chat que) supere su cubeta de fichas
+    app.add_handler(MessageHandler(filters.ChatType.GROUPS & ~Addressed(), drop_unaddressed), group=-2)
+    app.add_handler(MessageHandler(filters.COMMAND, throttle_commands), group=-1)
+
+    # Registro de handlers (cada uno cronometrado para /stats y /metrics)
+    app.add_handler(CommandHandler("recordatorio", timed(recordatorio)))
+    app.add_handler(CommandHandler("recordatorioRecurrente", timed(recordatorio_recurrente)))
+    app.add_handler(CommandHandler("ListaRecordatorios", timed(lista_recordatorios)))
+    app.add_handler(CommandHandler("borrarRecordatorio", timed(borrar_recordatorio)))
+    app.add_handler(CommandHandler("hola", timed(hola)))
+    app.add_handler(CommandHandler("fecha", timed(fecha)))
+    app.add_handler(CommandHandler("saldo", timed(saldo)))
+    app.add_handler(CommandHandler("iban", timed(iban)))
+    app.add_handler(CommandHandler("transacciones", timed(transacciones)))
+    app.add_handler(CommandHandler("buscar", timed(buscar)))
+    app.add_handler(CommandHandler("resumen", timed(resumen)))
+    app.add_handler(CommandHandler("exportar", timed(exportar)))
+    app.add_handler(CommandHandler("putoAntonio", timed(putoAntonio)))
+    app.add_handler(CommandHandler("morosos", timed(morosos)))
+    app.add_handler(CommandHandler("stats", timed(stats)))
+    app.add_handler(CommandHandler("chatid", timed(get_id)))
+    app.add_handler(CommandHandler("Rata", timed(rata)))
+    app.add_handler(CommandHandler("InsultarMarco", timed(insultar_marco)))
+    app.add_handler(CommandHandler("Huevos", timed(huevos)))
+    app.add_handler(CommandHandler("QuienEsElMejorBotDelMundo", timed(quien_es_mejor_bot)))
+    app.add_handler(MessageHandler(filters.COMMAND, timed(unknown)))
     # PROGRAMACIÓN DE TAREAS
     job_queue = app.job_queue
-    # Morosos: todos los días a las 09:00, pero solo envía si es día 29 o 26-feb
-    job_queue.run_daily(scheduled_morosos, time=time(hour=9, minute=0))
-    # Alquiler: todos los días a las 09:05, pero solo actúa si es día 1
-    job_queue.run_daily(scheduled_rent,   time=time(hour=9, minute=5))
+    # Morosos: el día 29 a las 09:00 (26 en febrero)
+    schedule_monthly(job_queue, MOROSOS_TRIGGER, scheduled_morosos, "morosos")
+    # Alquiler: el día 1 a las 09:05
+    schedule_monthly(job_queue, RENT_TRIGGER, scheduled_rent, "rent")
+    # Sondeo de transacciones nuevas y avisos al administrador
+    global EVENT_RULES
+    rules = [RoommatePaid(PAYMENTS), RentSent(ALQUILER_CENTS)]
+    if MIN_BALANCE_CENTS is not None:
+        rules.append(BalanceBelow(MIN_BALANCE_CENTS))
+    EVENT_RULES = RuleEngine(rules)
+    if POLL_PER_DAY:
+        job_queue.run_repeating(
+            leader_only(timed(poll_transactions)),
+            interval=86400 / POLL_PER_DAY, first=60, name="sondeo",
+        )
+    # Compactación del journal de recordatorios cada hora
+    job_queue.run_repeating(leader_only(timed(compact_reminders)), interval=3600, first=3600)
+    # Con varios procesos: relevo del líder y recordatorios de los demás
+    if LEADER is not None:
+        job_queue.run_repeating(elect_leader, interval=LEADER_INTERVAL, first=LEADER_INTERVAL)
     # Solo para pruebas
     # job_queue.run_once(scheduled_rent, when=5)
-
-    print("Bot de Telegram iniciado. Esperando comandos...")
-    app.run_polling()
+    return app
+
+
+def main(args) -> None:
+    global GC_CLIENT, TX_STORE, METRICS_LISTEN, METRICS_PORT, PAYMENTS
+    global POLL_PER_DAY, MIN_BALANCE_CENTS, LEADER, RESPONSE_CACHE
+    PAYMENTS = PaymentMatcher(load_roommates(args.roommates))
+    POLL_PER_DAY = args.poll_per_day
+    if args.saldo_minimo is not None:
+        MIN_BALANCE_CENTS = parse_cents(args.saldo_minimo)
+    METRICS_LISTEN, METRICS_PORT = args.metrics_listen, args.metrics_port
+    if args.secret_id:
+        auth = TokenManager(args.secret_id, args.secret_key)
+    else:
+        auth = StaticToken(args.go_cardless_token)
+    quota = None
+    if args.leader_lock:
+        LEADER = LeaderLock(args.leader_lock)
+        RESPONSE_CACHE = ResponseCache(CACHE_TTLS, shared=SharedResponses(CACHE_DB))
+        # La cuota del banco es una para todos los procesos
+        quota = QuotaManager(shared=SharedQuota(CACHE_DB))
+        if not LEADER.try_acquire() and args.mode == "polling":
+            # Telegram sólo admite un getUpdates a la vez: en polling los demás
+            # procesos esperan de reserva y toman el relevo cuando el líder muere
+            print(f"El líder es el proceso {LEADER.holder()}; esperando para tomar el relevo...")
+            LEADER.acquire()
+        print(f"Proceso {os.getpid()}: {'líder' if LEADER.is_leader else 'de apoyo'}")
+    GC_CLIENT = GoCardlessClient(HEADERS, quota=quota, auth=auth)
+    TX_STORE = TransactionStore(TRANSACTIONS_DB)
+    # Lo guardado cuando sólo había una cuenta es de la principal
+    TX_STORE.adopt(ACCOUNTS[0].id)
+    app = build_application(TELEGRAM_TOKEN, workers=args.workers)
+
+    if args.mode == "webhook":
+        # Telegram nos empuja los updates; el servidor embebido responde 200
+        # al momento y los handlers se ejecutan después en el bucle de eventos
+        # Con varios procesos el secreto es el compartido (obligatorio): todos
+        # deben aceptar el que el líder registró en Telegram
+        secret = args.webhook_secret or secrets.token_urlsafe(32)
+        print(f"Bot de Telegram iniciado (webhook en {args.webhook_listen}:{args.webhook_port}).")
+        if not is_leader():
+            # Sólo el líder registra el webhook en Telegram: los de apoyo
+            # reciben lo que les reparte el proxy sin llamar a setWebhook
+            asyncio.run(serve_standby(
+                app, args.webhook_listen, args.webhook_port, args.webhook_path, secret,
+            ))
+            return
+        app.run_webhook(
+            listen=args.webhook_listen,
+            port=args.webhook_port,
+            url_path=args.webhook_path,
+            secret_token=secret,
+            webhook_url=f"{args.webhook_url.rstrip('/')}/{args.webhook_path}",
+        )
+    else:
+        print("Bot de Telegram iniciado. Esperando comandos...")
+        app.run_polling()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="App segura con parámetros externos")
     parser.add_argument("--telegram_token", required=True, help="Token del bot de Telegram")
-    parser.add_argument("--go_cardless_token", required=True, help="Token de GoCardless")
-    parser.add_argument("--account_id", required=True, help="Account ID")
+    parser.add_argument("--go_cardless_token",
+                        help="Token de acceso fijo de GoCardless (caduca; mejor --secret_id/--secret_key)")
+    parser.add_argument("--secret_id", help="Secret ID de GoCardless (los tokens se renuevan solos)")
+    parser.add_argument("--secret_key", help="Secret key de GoCardless")
+    parser.add_argument("--account_id", required=True, action="append",
+                        help="Account ID, o Nombre=ID; se repite para consultar varias cuentas")
+    parser.add_argument("--workers", type=int, default=UPDATE_WORKERS,
+                        help="Updates procesados a la vez (de chats distintos)")
+    parser.add_argument("--mode", choices=("polling", "webhook"), default="polling",
+                        help="Cómo recibir updates de Telegram")
+    parser.add_argument("--webhook_url", help="URL pública (https) que Telegram llamará en modo webhook")
+    parser.add_argument("--webhook_listen", default="127.0.0.1", help="Interfaz del servidor webhook")
+    parser.add_argument("--webhook_port", type=int, default=8443, help="Puerto del servidor webhook")
+    parser.add_argument("--webhook_path", default="telegram", help="Ruta del webhook")
+    parser.add_argument("--webhook_secret",
+                        help="Secreto que Telegram envía en cada petición (por defecto, uno aleatorio; "
+                             "con --leader_lock, obligatorio y el mismo en todos los procesos)")
+    parser.add_argument("--roommates", default=ROOMMATES_FILE,
+                        help="JSON con los compañeros de piso (alias, importe y tolerancia)")
+    parser.add_argument("--poll_per_day", type=int, default=POLL_PER_DAY,
+                        help="Sondeos al banco por día para avisar de transacciones nuevas (0 = ninguno)")
+    parser.add_argument("--saldo_minimo",
+                        help="Avisar al administrador si el saldo baja de estos euros")
+    parser.add_argument("--metrics_port", type=int,
+                        help="Puerto del endpoint /metrics de Prometheus (desactivado si no se indica)")
+    parser.add_argument("--metrics_listen", default="127.0.0.1", help="Interfaz del endpoint de métricas")
+    parser.add_argument("--leader_lock",
+                        help="Fichero de cerrojo para varios procesos con las mismas bases: "
+                             "sólo el que lo tiene ejecuta tareas programadas y recordatorios")
 
     args = parser.parse_args()
+    if args.mode == "webhook" and not args.webhook_url:
+        parser.error("--webhook_url es obligatorio en modo webhook")
+    if args.mode == "webhook" and args.leader_lock and not args.webhook_secret:
+        parser.error("con --leader_lock en modo webhook, --webhook_secret es obligatorio "
+                     "(el mismo en todos los procesos)")
+    if bool(args.secret_id) != bool(args.secret_key):
+        parser.error("--secret_id y --secret_key van juntos")
+    if not args.secret_id and not args.go_cardless_token:
+        parser.error("hace falta --secret_id/--secret_key o --go_cardless_token")
     
     TELEGRAM_TOKEN = args.telegram_token
-    GO_CARDLESS_TOKEN = args.go_cardless_token
-    ACCOUNT_ID = args.account_id
-    BASE_URL           = f"https://bankaccountdata.gocardless.com/api/v2/accounts/{ACCOUNT_ID}"
-    BALANCES_URL       = f"{BASE_URL}/balances/"
-    DETAILS_URL        = f"{BASE_URL}/details/"
-    TRANSACTIONS_URL   = f"{BASE_URL}/transactions/"
+    try:
+        ACCOUNTS = parse_accounts(args.account_id)
+    except ValueError as e:
+        parser.error(str(e))
+    # La autorización la pone GoCardlessClient con el token vigente
     HEADERS = {
-    "Authorization": f"Bearer {GO_CARDLESS_TOKEN}",
     "Accept": "application/json"
 }
-    main()
+    main(args)
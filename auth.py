@@ -0,0 +1,138 @@
+"""
+Tokens de acceso de GoCardless a partir del secret id/key.
+
+GoCardless da un token de acceso (`access`, ~24 h) y otro de refresco
+(`refresh`, ~30 días) en `/token/new/`; con el de refresco se pide un acceso
+nuevo en `/token/refresh/`. `TokenManager` renueva el acceso antes de que
+caduque (al pasar el 90 % de su vida, o 5 minutos antes si es largo), de modo
+que los comandos no llegan a usar un token caducado.
+
+Sólo hay una renovación en vuelo: las peticiones que llegan mientras tanto
+esperan a esa misma en vez de lanzar la suya.
+"""
+import asyncio
+import time
+
+import httpx
+
+from metrics import UPSTREAM_LATENCY, UPSTREAM_REQUESTS
+
+API_URL = "https://bankaccountdata.gocardless.com/api/v2"
+# Antelación máxima con la que se renueva el token (segundos)
+REFRESH_MARGIN = 300
+
+
+class TokenError(Exception):
+    """
+    GoCardless rechazó las credenciales. Lleva su respuesta para mostrarla
+    como cualquier otro error del banco.
+    """
+
+    def __init__(self, response):
+        super().__init__(f"GoCardless rechazó el token ({response.status_code})")
+        self.response = response
+
+
+class StaticToken:
+    """
+    Token fijo (`--go_cardless_token`): no caduca ni se renueva desde aquí.
+    """
+
+    def __init__(self, access):
+        self.access = access
+
+    async def token(self) -> str:
+        return self.access
+
+    def invalidate(self, access) -> None:
+        pass
+
+    async def aclose(self) -> None:
+        pass
+
+
+class TokenManager:
+    def __init__(self, secret_id, secret_key, api_url=API_URL, margin=REFRESH_MARGIN,
+                 timeout=httpx.Timeout(15.0, connect=5.0)):
+        self.secret_id = secret_id
+        self.secret_key = secret_key
+        self.api_url = api_url.rstrip("/")
+        self.margin = margin
+        self.timeout = timeout
+        self.access = None
+        self.renew_at = 0.0          # cuándo pedir un acceso nuevo
+        self.refresh = None
+        self.refresh_until = 0.0     # hasta cuándo vale el token de refresco
+        self._renewing = None        # tarea de renovación en curso (compartida)
+        self._client = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+        return self._client
+
+    def _renew_at(self, now, ttl) -> float:
+        return now + ttl - min(self.margin, ttl / 10)
+
+    async def _post(self, endpoint, payload):
+        t0 = time.perf_counter()
+        resp = await self._get_client().post(
+            f"{self.api_url}/token/{endpoint}/", json=payload,
+            headers={"Accept": "application/json"},
+        )
+        name = f"token_{endpoint}"
+        UPSTREAM_LATENCY.observe(time.perf_counter() - t0, endpoint=name)
+        UPSTREAM_REQUESTS.inc(endpoint=name, status=resp.status_code, origin="banco")
+        return resp
+
+    async def _renew(self):
+        now = time.time()
+        if self.refresh and now < self.refresh_until:
+            resp = await self._post("refresh", {"refresh": self.refresh})
+            if resp.status_code == 200:
+                data = resp.json()
+                self.access = data["access"]
+                self.renew_at = self._renew_at(now, data.get("access_expires", 86400))
+                return
+            # Refresco revocado o caducado antes de tiempo: se piden tokens nuevos
+            self.refresh = None
+        resp = await self._post("new", {"secret_id": self.secret_id, "secret_key": self.secret_key})
+        if resp.status_code != 200:
+            raise TokenError(resp)
+        data = resp.json()
+        self.access = data["access"]
+        self.renew_at = self._renew_at(now, data.get("access_expires", 86400))
+        self.refresh = data.get("refresh")
+        self.refresh_until = self._renew_at(now, data.get("refresh_expires", 30 * 86400))
+
+    async def token(self) -> str:
+        """
+        Token de acceso vigente, renovándolo antes si está a punto de caducar.
+        """
+        if self.access is not None and time.time() < self.renew_at:
+            return self.access
+        if self._renewing is None:
+            self._renewing = asyncio.ensure_future(self._renew())
+            self._renewing.add_done_callback(self._renewed)
+        # shield: si quien espera se cancela, la renovación sigue para los demás
+        await asyncio.shield(self._renewing)
+        return self.access
+
+    def _renewed(self, task):
+        self._renewing = None
+        if not task.cancelled():
+            # La excepción la recogen quienes esperaban; aquí sólo se marca como vista
+            task.exception()
+
+    def invalidate(self, access) -> None:
+        """
+        El banco rechazó `access` (401): se renovará en la próxima petición.
+        Si ya se había renovado entre tanto, no hace nada.
+        """
+        if access == self.access:
+            self.renew_at = 0.0
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,64 @@
+"""
+Peticiones al banco mientras caducan los tokens de acceso: un token fijo
+(como `--go_cardless_token`) frente a `auth.TokenManager`, que lo renueva
+antes de tiempo y con una sola renovación para todas las peticiones.
+
+    python -m benchmarks.bench_auth --ttl 2 --segundos 6 --concurrentes 20
+"""
+import argparse
+import asyncio
+import time
+from collections import Counter
+
+import httpx
+
+from auth import StaticToken, TokenManager
+from benchmarks.stubs import GoCardlessStub
+from gocardless import GoCardlessClient
+from quota import QuotaManager
+
+
+async def run(stub, auth, segundos, concurrentes):
+    client = GoCardlessClient({}, auth=auth, quota=QuotaManager(max_in_flight=concurrentes))
+    url = f"{stub.base_url}/balances/"
+    estados = Counter()
+    fin = time.time() + segundos
+    ronda = 0
+    while time.time() < fin:
+        # Parámetros distintos para que no se agrupen en una sola petición
+        resps = await asyncio.gather(*(
+            client.get(url, params={"r": ronda, "i": i}) for i in range(concurrentes)
+        ))
+        estados.update(r.status_code for r in resps)
+        ronda += 1
+        await asyncio.sleep(0.1)
+    await client.aclose()
+    return estados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--ttl", type=float, default=2.0, help="segundos de vida del token de acceso")
+    parser.add_argument("--segundos", type=float, default=6.0)
+    parser.add_argument("--concurrentes", type=int, default=20)
+    parser.add_argument("--latencia", type=float, default=0.02)
+    args = parser.parse_args()
+
+    print(f"{'modo':>14} {'200':>6} {'401':>6} {'token/new':>10} {'token/refresh':>14}")
+    for modo in ("token fijo", "TokenManager"):
+        stub = GoCardlessStub(latency=args.latencia, token_ttl=args.ttl).start()
+        if modo == "token fijo":
+            access = httpx.post(f"{stub.api_url}/token/new/", json={
+                "secret_id": stub.secret[0], "secret_key": stub.secret[1],
+            }).json()["access"]
+            auth = StaticToken(access)
+        else:
+            auth = TokenManager(*stub.secret, api_url=stub.api_url)
+        estados = asyncio.run(run(stub, auth, args.segundos, args.concurrentes))
+        stub.stop()
+        print(f"{modo:>14} {estados[200]:>6} {estados[401]:>6} "
+              f"{stub.calls.get('token_new', 0):>10} {stub.calls.get('token_refresh', 0):>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Latencia de los comandos con el banco caído: cada orden espera a una
+petición condenada a fallar hasta que el cortacircuitos se abre, y a partir
+de ahí responde al momento con los datos guardados.
+
+    python -m benchmarks.bench_breaker --latencia 1 --comandos 10
+"""
+import argparse
+import asyncio
+import time
+
+import app
+from benchmarks.bench_handlers import configure_app, fake_context, fake_update
+from benchmarks.stubs import GoCardlessStub
+
+
+async def run(stub, comandos):
+    # Primera sincronización con el banco funcionando
+    await app.transacciones(fake_update("/transacciones"), fake_context())
+    await app.saldo(fake_update("/saldo"), fake_context())
+    stub.down = True
+    filas = []
+    for i in range(comandos):
+        # Los datos locales caducan: cada orden intenta sincronizar
+        with app.TX_STORE.conn:
+            app.TX_STORE._set_meta(app.TX_STORE._sync_key(app.ACCOUNTS[0].id), time.time() - 86400)
+        update = fake_update("/transacciones")
+        t0 = time.perf_counter()
+        await app.transacciones(update, fake_context())
+        elapsed = time.perf_counter() - t0
+        breaker = app.GC_CLIENT.breaker(app.ACCOUNTS[0].transactions_url)
+        filas.append((i + 1, elapsed, breaker.state, update.message.replies[-1].splitlines()[-1]))
+    await app.GC_CLIENT.aclose()
+    return filas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--latencia", type=float, default=1.0,
+                        help="segundos que tarda el banco en devolver cada 503")
+    parser.add_argument("--comandos", type=int, default=10)
+    args = parser.parse_args()
+
+    stub = GoCardlessStub(latency=args.latencia).start()
+    configure_app(stub.base_url)
+    filas = asyncio.run(run(stub, args.comandos))
+    stub.stop()
+    print(f"{'orden':>5} {'ms':>8} {'circuito':>12}  última línea")
+    for i, elapsed, estado, ultima in filas:
+        print(f"{i:>5} {elapsed * 1000:>8.1f} {estado:>12}  {ultima}")
+    print(f"peticiones al banco: {stub.calls}")
+
+
+if __name__ == "__main__":
+    main()
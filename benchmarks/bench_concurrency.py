@@ -0,0 +1,59 @@
+"""
+Throughput del bot según el número de workers de updates, con una Bot API
+local lenta (cada sendMessage tarda `--latencia_telegram`).
+
+    python -m benchmarks.bench_concurrency --updates 200 --chats 20 --workers 1 2 4 8 16
+"""
+import argparse
+import asyncio
+import time
+
+import app
+from benchmarks.bench_handlers import configure_app
+from benchmarks.stubs import GoCardlessStub, TelegramStub, make_update
+
+TOKEN = "123:bench"
+
+
+async def run(telegram, n, chats, workers, first_id):
+    application = app.build_application(TOKEN, base_url=telegram.base_url, workers=workers)
+    async with application:
+        await application.start()
+        base = len(telegram.sent)
+        telegram.push_updates([
+            make_update(first_id + i, "/hola", chat_id=5000 + i % chats) for i in range(n)
+        ])
+        t0 = time.perf_counter()
+        await application.updater.start_polling(poll_interval=0.0, timeout=10)
+        await asyncio.to_thread(telegram.wait_sent, base + n)
+        elapsed = time.perf_counter() - t0
+        await application.updater.stop()
+        await application.stop()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--updates", type=int, default=200)
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--latencia_telegram", type=float, default=0.05)
+    args = parser.parse_args()
+
+    telegram = TelegramStub(latency=args.latencia_telegram).start()
+    gocardless = GoCardlessStub(latency=0.0).start()
+    app.REMINDERS_DB = ":memory:"
+    try:
+        first_id = 1
+        for workers in args.workers:
+            configure_app(gocardless.base_url)
+            elapsed = asyncio.run(run(telegram, args.updates, args.chats, workers, first_id))
+            first_id += args.updates
+            print(f"workers={workers:>3}: {args.updates / elapsed:8.1f} updates/s")
+    finally:
+        telegram.stop()
+        gocardless.stop()
+
+
+if __name__ == "__main__":
+    main()
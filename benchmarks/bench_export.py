@@ -0,0 +1,61 @@
+"""
+Memoria y tiempo de /exportar sobre varios años de histórico: pico de
+memoria de Python mientras se escribe el fichero (por páginas) frente a
+cargar antes toda la lista de transacciones.
+
+    python -m benchmarks.bench_export --anos 1 5 10 --por_dia 5
+"""
+import argparse
+import asyncio
+import gc
+import os
+import time
+import tracemalloc
+
+import export
+from benchmarks.stubs import make_transactions
+from transaction_store import TransactionStore
+
+
+def peak(func):
+    """
+    Ejecuta `func()` y devuelve (resultado, segundos, MiB de pico).
+    """
+    gc.collect()
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - t0
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, pico / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--anos", type=int, nargs="+", default=[1, 5, 10])
+    parser.add_argument("--por_dia", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'años':>5} {'formato':>8} {'transacciones':>14} {'MiB fichero':>12} "
+          f"{'pico MiB':>9} {'lista MiB':>10} {'s':>6}")
+    for anos in args.anos:
+        store = TransactionStore(":memory:")
+        txs = make_transactions(anos * 365 * args.por_dia, per_day=args.por_dia)
+        store.upsert(txs)
+        desde, hasta = min(t["bookingDate"] for t in txs), max(t["bookingDate"] for t in txs)
+        del txs
+        # Referencia: lo que ocupa tener todo el periodo en una lista
+        _, _, lista = peak(lambda: list(store.between(desde, hasta)))
+        for fmt in export.FORMATS:
+            (path, n), elapsed, pico = peak(
+                lambda: asyncio.run(export.export(store, desde, hasta, fmt))
+            )
+            size = os.path.getsize(path) / 2**20
+            os.remove(path)
+            print(f"{anos:>5} {fmt:>8} {n:>14} {size:>12.1f} {pico:>9.1f} {lista:>10.1f} {elapsed:>6.2f}")
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Trabajo que se ahorra el bot en un grupo ruidoso: mensajes y órdenes que no
+van dirigidos a él, y un usuario que repite la misma orden sin parar. Se
+compara el filtro previo (mención + límite de órdenes) con el bot sin él.
+
+    python -m benchmarks.bench_gating --ruido 300 --spam 100 --legitimos 20
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import app
+from benchmarks.bench_handlers import configure_app
+from benchmarks.stubs import GoCardlessStub, TelegramStub, make_update
+from gating import Throttle
+from metrics import HANDLER_LATENCY, UPDATES_DROPPED
+
+TOKEN = "123:bench"
+GRUPO = -1001
+
+
+def group_updates(telegram, ruido, spam, legitimos, start):
+    bot = f"@{telegram.username}"
+    otros = ["hola a todos", "/saldo", "/fecha", "/start@otro_bot", "¿quién compra pan?"]
+    updates = []
+    for i in range(ruido):
+        updates.append((otros[i % len(otros)], 2000 + i % 25))
+    for i in range(spam):
+        updates.append((f"/fecha{bot}", 1999))
+    for i in range(legitimos):
+        updates.append((f"/hola{bot}", 3000 + i))
+    # Intercalados, como llegarían en un grupo real
+    random.Random(0).shuffle(updates)
+    return [
+        make_update(start + i, text, chat_id=GRUPO, chat_type="supergroup", user_id=user)
+        for i, (text, user) in enumerate(updates)
+    ]
+
+
+def handled():
+    return sum(HANDLER_LATENCY.count(handler=h) for (h,) in HANDLER_LATENCY.series)
+
+
+async def run(telegram, updates, filtro):
+    application = app.build_application(TOKEN, base_url=telegram.base_url)
+    if not filtro:
+        for group in (-2, -1):
+            application.handlers.pop(group, None)
+    HANDLER_LATENCY.series.clear()
+    UPDATES_DROPPED.values.clear()
+    async with application:
+        await application.start()
+        base = len(telegram.sent)
+        telegram.push_updates(updates)
+        t0 = time.perf_counter()
+        await application.updater.start_polling(poll_interval=0.0, timeout=1)
+        # Hasta que se han recogido todos y los handlers han terminado
+        while telegram._updates or application.update_queue.qsize():
+            await asyncio.sleep(0.05)
+        await asyncio.sleep(0.5)
+        elapsed = time.perf_counter() - t0
+        await application.updater.stop()
+        await application.stop()
+    return elapsed, handled(), len(telegram.sent) - base, dict(UPDATES_DROPPED.values)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--ruido", type=int, default=300,
+                        help="mensajes y órdenes del grupo que no son para el bot")
+    parser.add_argument("--spam", type=int, default=100,
+                        help="órdenes seguidas de un mismo usuario")
+    parser.add_argument("--legitimos", type=int, default=20,
+                        help="órdenes dirigidas al bot, una por usuario")
+    args = parser.parse_args()
+
+    telegram = TelegramStub().start()
+    gocardless = GoCardlessStub(latency=0.0).start()
+    app.REMINDERS_DB = ":memory:"
+    try:
+        start = 1
+        print(f"{'modo':>10} {'updates':>8} {'handlers':>9} {'respuestas':>11} {'s':>6}  descartados")
+        for filtro in (False, True):
+            configure_app(gocardless.base_url)
+            # Los límites de producción, que configure_app relaja
+            app.USER_THROTTLE = Throttle(rate=1 / 10, burst=5)
+            app.CHAT_THROTTLE = Throttle(rate=1 / 2, burst=15)
+            updates = group_updates(telegram, args.ruido, args.spam, args.legitimos, start)
+            start += len(updates)
+            elapsed, n_handlers, respuestas, descartados = asyncio.run(run(telegram, updates, filtro))
+            motivos = ", ".join(f"{m} {n}" for (m,), n in sorted(descartados.items())) or "-"
+            modo = "con filtro" if filtro else "sin filtro"
+            print(f"{modo:>10} {len(updates):>8} {n_handlers:>9} {respuestas:>11} {elapsed:>6.2f}  {motivos}")
+    finally:
+        telegram.stop()
+        gocardless.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Mide la latencia de los handlers bancarios cuando llegan muchos comandos a la
+vez contra un GoCardless local con latencia simulada.
+
+    python -m benchmarks.bench_handlers --comandos 50 --latencia 0.2
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from types import SimpleNamespace
+
+import app
+from accounts import Account
+from auth import StaticToken
+from gating import Throttle
+from gocardless import GoCardlessClient
+from transaction_store import TransactionStore
+from benchmarks.stubs import GoCardlessStub
+
+
+class FakeMessage:
+    def __init__(self, text):
+        self.text = text
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+
+def fake_update(text, chat_id=1):
+    return SimpleNamespace(
+        message=FakeMessage(text),
+        effective_chat=SimpleNamespace(id=chat_id, type="private"),
+    )
+
+
+def fake_context(args=()):
+    return SimpleNamespace(
+        args=list(args),
+        bot=SimpleNamespace(username="bench_bot"),
+    )
+
+
+def configure_app(base_url):
+    """
+    Apunta los globales de app.py al servidor local.
+    """
+    api_url, account_id = base_url.rsplit("/", 1)
+    app.ACCOUNTS = [Account(account_id, api_url=api_url)]
+    app.HEADERS = {"Accept": "application/json"}
+    app.GC_CLIENT = GoCardlessClient(app.HEADERS, auth=StaticToken("bench"))
+    app.TX_STORE = TransactionStore(":memory:")
+    # Sin límite de órdenes: aquí se mide el rendimiento, no el control de abusos
+    app.USER_THROTTLE = Throttle(rate=1e9, burst=1e9)
+    app.CHAT_THROTTLE = Throttle(rate=1e9, burst=1e9)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    k = max(0, min(len(values) - 1, round(p / 100 * (len(values) - 1))))
+    return values[k]
+
+
+async def run(n, handlers):
+    async def timed(i):
+        name, handler = handlers[i % len(handlers)]
+        t0 = time.perf_counter()
+        await handler(fake_update(f"/{name}", chat_id=i), fake_context())
+        return time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    latencies = await asyncio.gather(*(timed(i) for i in range(n)))
+    total = time.perf_counter() - t0
+    await app.GC_CLIENT.aclose()
+    return latencies, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--comandos", type=int, default=50)
+    parser.add_argument("--latencia", type=float, default=0.2)
+    parser.add_argument("--cuota", type=int, default=None,
+                        help="peticiones por endpoint antes de que el stub devuelva 429")
+    args = parser.parse_args()
+
+    stub = GoCardlessStub(latency=args.latencia, quota=args.cuota).start()
+    configure_app(stub.base_url)
+    handlers = [
+        ("saldo", app.saldo),
+        ("iban", app.iban),
+        ("transacciones", app.transacciones),
+        ("putoAntonio", app.putoAntonio),
+        ("morosos", app.morosos),
+    ]
+    try:
+        latencies, total = asyncio.run(run(args.comandos, handlers))
+    finally:
+        stub.stop()
+
+    print(f"comandos:   {args.comandos} (latencia upstream {args.latencia * 1000:.0f} ms)")
+    print(f"total:      {total * 1000:.1f} ms")
+    print(f"p50:        {percentile(latencies, 50) * 1000:.1f} ms")
+    print(f"p99:        {percentile(latencies, 99) * 1000:.1f} ms")
+    print(f"media:      {statistics.mean(latencies) * 1000:.1f} ms")
+    print(f"upstream:   {stub.calls}")
+    print(f"caché:      {dict(app.RESPONSE_CACHE.counters)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Varios procesos con la misma base de recordatorios y un cerrojo de líder:
+todos crean recordatorios, sólo el líder los dispara, y a mitad de prueba se
+mata al líder (kill -9) para medir cuánto tarda otro en tomar el relevo.
+Al final se comprueba que cada recordatorio se disparó exactamente una vez.
+
+    python -m benchmarks.bench_leader --procesos 3 --recordatorios 300 --segundos 8
+"""
+import argparse
+import multiprocessing
+import os
+import signal
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from leader import LeaderLock
+from reminder_store import ReminderStore
+from reminders import ReminderEngine
+
+# Cada cuánto mira un proceso si es líder y si hay recordatorios vencidos
+TICK = 0.05
+
+
+def worker(tmp, index, n, segundos, interval):
+    lock = LeaderLock(os.path.join(tmp, "bot.lock"))
+    engine = ReminderEngine(ReminderStore(os.path.join(tmp, "reminders.db")), max_per_chat=n + 1)
+    log = sqlite3.connect(os.path.join(tmp, "disparos.db"), timeout=30)
+    engine.load(datetime.now(), prune=False)
+    inicio = time.monotonic()
+    creados = 0
+    siguiente_intento = 0.0
+    while time.monotonic() - inicio < segundos + 3:
+        now = datetime.now()
+        # Altas repartidas en el tiempo, con vencimientos de 0 a 1 s
+        while creados < n and time.monotonic() - inicio > creados * segundos / n:
+            engine.add(index, now + timedelta(seconds=(creados % 10) / 10), f"{index}-{creados}")
+            creados += 1
+        if time.monotonic() >= siguiente_intento:
+            siguiente_intento = time.monotonic() + interval
+            if not lock.is_leader and lock.try_acquire():
+                engine.load(now, prune=False)
+                with log:
+                    log.execute("INSERT INTO lideres VALUES (?, ?)", (os.getpid(), time.time()))
+        if lock.is_leader:
+            engine.refresh(now)
+            disparos = engine.pop_due(now)
+            if disparos:
+                with log:
+                    log.executemany(
+                        "INSERT INTO disparos VALUES (?, ?, ?, ?)",
+                        ((rid, os.getpid(), time.time(), (now - run_at).total_seconds())
+                         for rid, _, _, run_at in disparos),
+                    )
+        time.sleep(TICK)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--procesos", type=int, default=3)
+    parser.add_argument("--recordatorios", type=int, default=300, help="por proceso")
+    parser.add_argument("--segundos", type=float, default=8.0)
+    parser.add_argument("--intervalo", type=float, default=0.5,
+                        help="segundos entre intentos de ser líder (LEADER_INTERVAL)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log = sqlite3.connect(os.path.join(tmp, "disparos.db"))
+        log.execute("CREATE TABLE disparos (id INTEGER, pid INTEGER, t REAL, retraso REAL)")
+        log.execute("CREATE TABLE lideres (pid INTEGER, t REAL)")
+        log.commit()
+        ReminderStore(os.path.join(tmp, "reminders.db")).close()
+
+        procs = [
+            multiprocessing.Process(
+                target=worker, args=(tmp, i, args.recordatorios, args.segundos, args.intervalo)
+            )
+            for i in range(args.procesos)
+        ]
+        for p in procs:
+            p.start()
+        time.sleep(args.segundos / 2)
+        lider = log.execute("SELECT pid FROM lideres ORDER BY t LIMIT 1").fetchone()[0]
+        os.kill(lider, signal.SIGKILL)
+        muerte = time.time()
+        for p in procs:
+            p.join()
+
+        store = ReminderStore(os.path.join(tmp, "reminders.db"))
+        # Los que iba a crear el líder después de morir no existen
+        total = store.conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'reminders'").fetchone()[0]
+        pendientes = store.count()
+        relevo = log.execute("SELECT pid, t FROM lideres WHERE t > ? ORDER BY t LIMIT 1",
+                             (muerte,)).fetchone()
+        disparados, unicos = log.execute("SELECT COUNT(*), COUNT(DISTINCT id) FROM disparos").fetchone()
+        lideres = log.execute("SELECT COUNT(DISTINCT pid) FROM disparos").fetchone()[0]
+        retraso_max = log.execute("SELECT MAX(retraso) FROM disparos").fetchone()[0] or 0.0
+        print(f"procesos: {args.procesos}  recordatorios creados: {total}")
+        print(f"disparados: {disparados} ({unicos} distintos, {disparados - unicos} duplicados) "
+              f"por {lideres} líderes; pendientes en la base: {pendientes}")
+        if relevo:
+            print(f"relevo tras matar al líder {lider}: {relevo[1] - muerte:.2f} s (proceso {relevo[0]})")
+        else:
+            print("nadie tomó el relevo")
+        print(f"retraso máximo de un disparo: {retraso_max:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Ráfaga de recordatorios que vencen a la vez: enviándolos uno a uno como se
+hacía antes (los que reciben 429 se pierden) frente a la cola de salida
+(`outbox.py`), contra una Bot API local que aplica control de flujo por chat.
+
+    python -m benchmarks.bench_outbox --recordatorios 60 --chats 5 --tasa_429 0.05
+"""
+import argparse
+import asyncio
+import time
+
+from telegram import Bot
+
+from benchmarks.stubs import TelegramStub
+from outbox import Outbox
+
+TOKEN = "123:bench"
+
+
+def delivered(telegram, base):
+    return sum(text.count("⏰ Recordatorio") for _, text in telegram.sent[base:])
+
+
+async def run(telegram, mensajes, cola):
+    bot = Bot(TOKEN, base_url=telegram.base_url)
+    perdidos = 0
+    async with bot:
+        base, llamadas = len(telegram.sent), telegram.calls.get("sendMessage", 0)
+        t0 = time.perf_counter()
+        if cola:
+            outbox = Outbox()
+            outbox.start(bot)
+            for chat_id, texto in mensajes:
+                outbox.send(chat_id, texto)
+            await outbox.flush()
+            await outbox.stop()
+        else:
+            for chat_id, texto in mensajes:
+                try:
+                    await bot.send_message(chat_id, texto)
+                except Exception:
+                    perdidos += 1
+        elapsed = time.perf_counter() - t0
+    llamadas = telegram.calls.get("sendMessage", 0) - llamadas
+    return delivered(telegram, base), perdidos, llamadas, len(telegram.sent) - base, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--recordatorios", type=int, default=60)
+    parser.add_argument("--chats", type=int, default=5)
+    parser.add_argument("--tasa_429", type=float, default=0.05,
+                        help="proporción de envíos que reciben un 429 además del límite por chat")
+    parser.add_argument("--intervalo_chat", type=float, default=1.0,
+                        help="segundos mínimos entre mensajes a un mismo chat en la Bot API local")
+    parser.add_argument("--latencia_telegram", type=float, default=0.02)
+    args = parser.parse_args()
+
+    telegram = TelegramStub(latency=args.latencia_telegram, error_rate=args.tasa_429,
+                            chat_interval=args.intervalo_chat).start()
+    mensajes = [
+        (1000 + i % args.chats, f"⏰ Recordatorio: pagar la factura {i}")
+        for i in range(args.recordatorios)
+    ]
+    try:
+        print(f"{'modo':>8} {'recordatorios':>14} {'entregados':>11} {'perdidos':>9} "
+              f"{'sendMessage':>12} {'mensajes':>9} {'s':>6}")
+        for cola in (False, True):
+            # Que el límite por chat de la primera pasada no afecte a la segunda
+            time.sleep(args.intervalo_chat)
+            entregados, perdidos, llamadas, enviados, elapsed = asyncio.run(run(telegram, mensajes, cola))
+            modo = "cola" if cola else "directo"
+            print(f"{modo:>8} {len(mensajes):>14} {entregados:>11} {perdidos:>9} "
+                  f"{llamadas:>12} {enviados:>9} {elapsed:>6.2f}")
+    finally:
+        telegram.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Memoria y tiempo de filtrado de un histórico de transacciones: los dicts
+anidados de GoCardless (con `float()` en cada comparación) frente a los
+registros compactos `Transaction` (céntimos, ordinales, nombres internados).
+
+    python -m benchmarks.bench_records --tamanos 10000 100000
+"""
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from benchmarks.stubs import make_transactions
+from transaction import Transaction
+
+
+def build(func):
+    """
+    Construye la colección con `func()` y devuelve (colección, MiB retenidos).
+    """
+    gc.collect()
+    tracemalloc.start()
+    data = func()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return data, size / 2**20
+
+
+def best_of(func, repeat=5):
+    tiempos = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        tiempos.append(time.perf_counter() - t0)
+    return min(tiempos)
+
+
+def filtros_dicts(txs, desde):
+    desde = desde.isoformat()
+    return {
+        "alquiler (== 800 €)": lambda: [
+            t for t in txs if float(t["transactionAmount"]["amount"]) == -800.0
+        ],
+        "morosos (20 días)": lambda: [
+            t for t in txs
+            if t["bookingDate"] >= desde
+            and float(t["transactionAmount"]["amount"]) >= 200.0
+            and "MARCO" in t.get("debtorName", "").upper()
+        ],
+        "pagado (> 800 €)": lambda: any(
+            abs(float(t["transactionAmount"]["amount"])) > 800.0 for t in txs
+        ),
+    }
+
+
+def filtros_records(txs, desde):
+    desde = desde.toordinal()
+    return {
+        "alquiler (== 800 €)": lambda: [t for t in txs if t.amount == -80000],
+        "morosos (20 días)": lambda: [
+            t for t in txs
+            if t.booked >= desde and t.amount >= 20000 and "MARCO" in (t.debtor or "").upper()
+        ],
+        "pagado (> 800 €)": lambda: any(abs(t.amount) > 80000 for t in txs),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[10000, 100000])
+    args = parser.parse_args()
+
+    desde = date.today() - timedelta(days=20)
+    for n in args.tamanos:
+        # Cada transacción se decodifica por separado, como al leerlas del almacén
+        raws = [json.dumps(tx) for tx in make_transactions(n)]
+        dicts, mem_dicts = build(lambda: [json.loads(r) for r in raws])
+        records, mem_records = build(lambda: [Transaction.from_api(json.loads(r)) for r in raws])
+        print(f"n={n}: memoria dicts {mem_dicts:.1f} MiB, registros {mem_records:.1f} MiB "
+              f"({mem_dicts / mem_records:.1f}x)")
+        fd, fr = filtros_dicts(dicts, desde), filtros_records(records, desde)
+        for nombre in fd:
+            td, tr = best_of(fd[nombre]), best_of(fr[nombre])
+            print(f"   {nombre:<22} dicts {td * 1000:8.2f} ms  registros {tr * 1000:8.2f} ms "
+                  f"({td / tr:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Coste de dar de alta y de baja un recordatorio según cuántos hay guardados
+(el antiguo volcado completo a JSON frente al almacén SQLite en WAL) y
+tiempo de arranque del motor de recordatorios con todos ellos cargados.
+
+    python -m benchmarks.bench_reminders --tamanos 100 1000 10000 100000
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from reminder_store import ReminderStore
+from reminders import ReminderEngine
+
+
+def bench_json(path, n, ops):
+    items = [
+        {"id": i, "chat_id": 1, "datetime": (datetime.now() + timedelta(days=1)).isoformat(),
+         "message": f"recordatorio {i}"}
+        for i in range(n)
+    ]
+    t0 = time.perf_counter()
+    for k in range(ops):
+        items.append({"id": n + k, "chat_id": 1, "datetime": items[0]["datetime"], "message": "x"})
+        with open(path, "w") as f:
+            json.dump(items, f, ensure_ascii=False, indent=2)
+        items.pop()
+        with open(path, "w") as f:
+            json.dump(items, f, ensure_ascii=False, indent=2)
+    return (time.perf_counter() - t0) / (2 * ops)
+
+
+def bench_store(path, n, ops):
+    store = ReminderStore(path)
+    run_at = datetime.now() + timedelta(days=1)
+    with store.conn:
+        store.conn.executemany(
+            "INSERT INTO reminders (id, chat_id, run_at, message) VALUES (?, ?, ?, ?)",
+            ((i, 1, run_at.isoformat(), f"recordatorio {i}") for i in range(n)),
+        )
+    t0 = time.perf_counter()
+    for k in range(ops):
+        store.add(n + k, 1, run_at, "x")
+        store.remove(n + k)
+    elapsed = (time.perf_counter() - t0) / (2 * ops)
+    # Arranque: carga completa en el motor (índices + montículo)
+    t0 = time.perf_counter()
+    engine = ReminderEngine(store, max_per_chat=n + 1)
+    engine.load(datetime.now())
+    load_time = time.perf_counter() - t0
+    loaded = len(engine)
+    store.close()
+    return elapsed, load_time, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[100, 1000, 10000, 100000])
+    parser.add_argument("--ops", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'n':>8} {'json/op':>12} {'sqlite/op':>12} {'carga':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.tamanos:
+            json_op = bench_json(os.path.join(tmp, f"r{n}.json"), n, max(1, args.ops // 10))
+            store_op, load_time, _ = bench_store(os.path.join(tmp, f"r{n}.db"), n, args.ops)
+            print(f"{n:>8} {json_op * 1000:>10.2f}ms {store_op * 1000:>10.3f}ms {load_time * 1000:>8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+Tiempo de /resumen sobre varios años de histórico: construcción de la
+instantánea en columnas (sólo tras sincronizar) y agregación por mes y
+contrapartida (en cada consulta).
+
+    python -m benchmarks.bench_resumen --anos 1 5 10 --por_dia 5
+"""
+import argparse
+import time
+
+import analytics
+from benchmarks.stubs import make_transactions
+from transaction_store import TransactionStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--anos", type=int, nargs="+", default=[1, 5, 10])
+    parser.add_argument("--por_dia", type=int, default=5)
+    parser.add_argument("--meses", type=int, default=12)
+    args = parser.parse_args()
+    if not analytics.available():
+        parser.exit(1, "Hace falta NumPy (pip install numpy)\n")
+
+    print(f"{'años':>5} {'transacciones':>14} {'instantánea ms':>15} {'resumen ms':>11}")
+    for anos in args.anos:
+        store = TransactionStore(":memory:")
+        store.upsert(make_transactions(anos * 365 * args.por_dia, per_day=args.por_dia))
+        t0 = time.perf_counter()
+        snap = analytics.snapshot(store)
+        t_snap = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        for _ in range(10):
+            analytics.summarize(snap, args.meses)
+        t_sum = (time.perf_counter() - t0) / 10
+        print(f"{anos:>5} {len(snap):>14} {t_snap * 1000:>15.1f} {t_sum * 1000:>11.2f}")
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
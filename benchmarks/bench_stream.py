@@ -0,0 +1,56 @@
+"""
+Lectura de un histórico de transacciones: `json.loads` del cuerpo entero
+frente al analizador incremental de `json_stream`, en tiempo, memoria pico
+y tiempo hasta tener las primeras transacciones.
+
+    python -m benchmarks.bench_stream --tamanos 1000 10000 100000
+"""
+import argparse
+import json
+import time
+import tracemalloc
+from itertools import islice
+
+from benchmarks.stubs import make_transactions
+from json_stream import iter_array
+
+PATH = ("transactions", "booked")
+CHUNK = 64 * 1024
+
+
+def measure(func):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--primeras", type=int, default=6,
+                        help="transacciones que necesita un comando como /transacciones")
+    args = parser.parse_args()
+
+    print(f"{'n':>7} {'MiB':>6} {'método':<16} {'tiempo ms':>10} {'pico MiB':>9}")
+    for n in args.tamanos:
+        body = json.dumps({"transactions": {"booked": make_transactions(n), "pending": []}}).encode()
+        chunks = [body[i:i + CHUNK] for i in range(0, len(body), CHUNK)]
+
+        casos = [
+            ("json.loads", lambda: len(json.loads(body)["transactions"]["booked"])),
+            ("streaming", lambda: sum(1 for _ in iter_array(chunks, PATH))),
+            (f"streaming ({args.primeras})",
+             lambda: len(list(islice(iter_array(chunks, PATH), args.primeras)))),
+        ]
+        for nombre, func in casos:
+            elapsed, peak, _ = measure(func)
+            print(f"{n:>7} {len(body) / 2**20:>6.1f} {nombre:<16} "
+                  f"{elapsed * 1000:>10.1f} {peak / 2**20:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
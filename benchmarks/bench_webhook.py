@@ -0,0 +1,115 @@
+"""
+Updates por segundo en modo webhook frente a polling, con una Bot API local.
+
+En webhook se hacen POST de updates grabados al servidor embebido (con el
+secreto en la cabecera); en polling se encolan en el stub para getUpdates.
+En ambos casos se cronometra hasta que el bot ha contestado a todos.
+
+    python -m benchmarks.bench_webhook --updates 500 --modo ambos
+"""
+import argparse
+import asyncio
+import socket
+import time
+
+import httpx
+
+import app
+from benchmarks.bench_handlers import configure_app
+from benchmarks.stubs import GoCardlessStub, TelegramStub, make_update
+
+SECRET = "bench-secret"
+TOKEN = "123:bench"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def recorded_updates(n, start=1):
+    comandos = ["/hola", "/fecha", "/chatid"]
+    return [
+        make_update(start + i, comandos[i % len(comandos)], chat_id=1000 + i % 20)
+        for i in range(n)
+    ]
+
+
+async def wait_sent(telegram, n):
+    return await asyncio.to_thread(telegram.wait_sent, n)
+
+
+async def run_webhook(telegram, n):
+    application = app.build_application(TOKEN, base_url=telegram.base_url)
+    port = free_port()
+    updates = recorded_updates(n)
+    async with application:
+        await application.start()
+        await application.updater.start_webhook(
+            listen="127.0.0.1", port=port, url_path="telegram", secret_token=SECRET,
+            webhook_url=f"http://127.0.0.1:{port}/telegram",
+        )
+        url = f"http://127.0.0.1:{port}/telegram"
+        headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET}
+        async with httpx.AsyncClient() as client:
+            # Un update con secreto incorrecto debe rechazarse
+            bad = await client.post(url, json=updates[0], headers={"X-Telegram-Bot-Api-Secret-Token": "x"})
+            assert bad.status_code == 403, bad.status_code
+
+            base = len(telegram.sent)
+            t0 = time.perf_counter()
+            acks = []
+            for i in range(0, n, 50):
+                batch = updates[i:i + 50]
+                t_ack = time.perf_counter()
+                await asyncio.gather(*(client.post(url, json=u, headers=headers) for u in batch))
+                acks.append((time.perf_counter() - t_ack) / len(batch))
+            await wait_sent(telegram, base + n)
+            elapsed = time.perf_counter() - t0
+        await application.updater.stop()
+        await application.stop()
+    return elapsed, sum(acks) / len(acks)
+
+
+async def run_polling(telegram, n):
+    application = app.build_application(TOKEN, base_url=telegram.base_url)
+    async with application:
+        await application.start()
+        base = len(telegram.sent)
+        telegram.push_updates(recorded_updates(n, start=10_000))
+        t0 = time.perf_counter()
+        await application.updater.start_polling(poll_interval=0.0, timeout=10)
+        await wait_sent(telegram, base + n)
+        elapsed = time.perf_counter() - t0
+        await application.updater.stop()
+        await application.stop()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--updates", type=int, default=500)
+    parser.add_argument("--modo", choices=("webhook", "polling", "ambos"), default="ambos")
+    parser.add_argument("--latencia_telegram", type=float, default=0.0)
+    args = parser.parse_args()
+
+    telegram = TelegramStub(latency=args.latencia_telegram).start()
+    gocardless = GoCardlessStub(latency=0.0).start()
+    configure_app(gocardless.base_url)
+    app.REMINDERS_DB = ":memory:"
+    try:
+        if args.modo in ("webhook", "ambos"):
+            elapsed, ack = asyncio.run(run_webhook(telegram, args.updates))
+            print(f"webhook: {args.updates / elapsed:8.1f} updates/s  (ack medio {ack * 1000:.2f} ms)")
+        if args.modo in ("polling", "ambos"):
+            configure_app(gocardless.base_url)
+            elapsed = asyncio.run(run_polling(telegram, args.updates))
+            print(f"polling: {args.updates / elapsed:8.1f} updates/s")
+    finally:
+        telegram.stop()
+        gocardless.stop()
+
+
+if __name__ == "__main__":
+    main()
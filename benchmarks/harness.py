@@ -0,0 +1,172 @@
+"""
+Banco de pruebas completo: el bot real (Application, handlers, almacenes)
+contra una Bot API y un GoCardless locales, reproduciendo una mezcla de
+comandos. Informa de throughput, percentiles de latencia por comando,
+llamadas upstream y memoria.
+
+    python -m benchmarks.harness --updates 1000 --transacciones 100000 \\
+        --mezcla saldo:3,transacciones:2,morosos:2,recordatorio:1,hola:2 \\
+        --latencia_banco 0.2 --latencia_telegram 0.02 --tasa_429_banco 0.05
+"""
+import argparse
+import asyncio
+import os
+import random
+import resource
+import statistics
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import app
+from benchmarks.bench_handlers import configure_app, percentile
+from benchmarks.stubs import GoCardlessStub, TelegramStub, make_transactions, make_update
+from transaction_store import TransactionStore
+from update_processor import PerChatUpdateProcessor
+
+TOKEN = "123:bench"
+MEZCLA_POR_DEFECTO = "saldo:3,iban:1,transacciones:2,morosos:2,putoAntonio:1,recordatorio:1,ListaRecordatorios:1,hola:2"
+
+
+def parse_mix(text):
+    mix = []
+    for part in text.split(","):
+        name, _, weight = part.partition(":")
+        mix.append((name.strip(), int(weight or 1)))
+    return mix
+
+
+def command_text(name, i):
+    """
+    Texto de un comando con argumentos válidos.
+    """
+    if name == "recordatorio":
+        cuando = datetime.now() + timedelta(days=1, minutes=i % 1440)
+        return f"/recordatorio {cuando:%Y-%m-%d %H:%M} bench {i}"
+    if name == "borrarRecordatorio":
+        return f"/borrarRecordatorio {i}"
+    return f"/{name}"
+
+
+def script(mix, n, chats, seed):
+    """
+    Lista de (comando, update) con la mezcla pedida, repartida entre chats.
+    """
+    rnd = random.Random(seed)
+    names = [name for name, _ in mix]
+    weights = [w for _, w in mix]
+    out = []
+    for i in range(n):
+        name = rnd.choices(names, weights)[0]
+        update = make_update(i + 1, command_text(name, i), chat_id=7000 + rnd.randrange(chats))
+        out.append((name, update))
+    return out
+
+
+def make_processor_class(latencies, names):
+    """
+    Procesador que cronometra cada update desde que se despacha hasta que
+    termina su handler (incluida la espera tras otros del mismo chat).
+    """
+    class TimedProcessor(PerChatUpdateProcessor):
+        async def do_process_update(self, update, coroutine):
+            t0 = time.perf_counter()
+            name = names.get(update.update_id, "?")
+
+            async def timed():
+                try:
+                    await coroutine
+                finally:
+                    latencies[name].append(time.perf_counter() - t0)
+
+            await super().do_process_update(update, timed())
+
+    return TimedProcessor
+
+
+async def run(telegram, updates, workers, latencies, names):
+    processor = make_processor_class(latencies, names)
+    application = app.build_application(
+        TOKEN, base_url=telegram.base_url, workers=workers, processor_class=processor
+    )
+    async with application:
+        await application.start()
+        telegram.push_updates([u for _, u in updates])
+        t0 = time.perf_counter()
+        await application.updater.start_polling(poll_interval=0.0, timeout=10)
+        total = len(updates)
+        while sum(len(v) for v in latencies.values()) < total:
+            await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - t0
+        await application.updater.stop()
+        await application.stop()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--updates", type=int, default=500)
+    parser.add_argument("--chats", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=app.UPDATE_WORKERS)
+    parser.add_argument("--mezcla", default=MEZCLA_POR_DEFECTO,
+                        help="comando:peso separados por comas")
+    parser.add_argument("--transacciones", type=int, default=1000,
+                        help="tamaño del histórico del banco simulado (10 a 100000)")
+    parser.add_argument("--por_dia", type=int, default=3, help="transacciones por día")
+    parser.add_argument("--latencia_banco", type=float, default=0.2)
+    parser.add_argument("--latencia_telegram", type=float, default=0.0)
+    parser.add_argument("--tasa_429_banco", type=float, default=0.0)
+    parser.add_argument("--tasa_429_telegram", type=float, default=0.0)
+    parser.add_argument("--semilla", type=int, default=0)
+    args = parser.parse_args()
+
+    txs = make_transactions(args.transacciones, seed=args.semilla, per_day=args.por_dia)
+    gocardless = GoCardlessStub(
+        latency=args.latencia_banco, transactions=txs,
+        error_rate=args.tasa_429_banco, seed=args.semilla,
+    ).start()
+    telegram = TelegramStub(
+        latency=args.latencia_telegram, error_rate=args.tasa_429_telegram, seed=args.semilla,
+    ).start()
+
+    updates = script(parse_mix(args.mezcla), args.updates, args.chats, args.semilla)
+    names = {u["update_id"]: name for name, u in updates}
+    latencies = defaultdict(list)
+
+    tmp = tempfile.TemporaryDirectory()
+    configure_app(gocardless.base_url)
+    # Primera sincronización con todo el histórico generado
+    dias = args.transacciones // max(1, args.por_dia) + 1
+    app.TX_STORE = TransactionStore(os.path.join(tmp.name, "tx.db"), initial_days=dias)
+    app.REMINDERS_DB = os.path.join(tmp.name, "reminders.db")
+    app.MAX_REMINDERS = args.updates
+
+    tracemalloc.start()
+    try:
+        elapsed = asyncio.run(run(telegram, updates, args.workers, latencies, names))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        telegram.stop()
+        gocardless.stop()
+        tmp.cleanup()
+
+    todas = [x for v in latencies.values() for x in v]
+    print(f"updates:     {len(todas)} en {elapsed:.2f} s -> {len(todas) / elapsed:.1f} updates/s")
+    print(f"latencia:    p50 {percentile(todas, 50) * 1000:.1f} ms  "
+          f"p95 {percentile(todas, 95) * 1000:.1f} ms  p99 {percentile(todas, 99) * 1000:.1f} ms")
+    print(f"{'comando':<20} {'n':>5} {'p50 ms':>9} {'p99 ms':>9} {'media ms':>9}")
+    for name in sorted(latencies):
+        v = latencies[name]
+        print(f"{name:<20} {len(v):>5} {percentile(v, 50) * 1000:>9.1f} "
+              f"{percentile(v, 99) * 1000:>9.1f} {statistics.mean(v) * 1000:>9.1f}")
+    print(f"banco:       {dict(sorted(gocardless.calls.items()))}")
+    print(f"telegram:    {dict(sorted(telegram.calls.items()))}")
+    print(f"memoria:     pico Python {peak / 2**20:.1f} MiB, "
+          f"RSS máx {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
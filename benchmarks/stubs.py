@@ -0,0 +1,400 @@
+"""
+Servidores locales que imitan las APIs externas para poder medir el bot
+sin tocar el banco real.
+"""
+import json
+import math
+import random
+import re
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, parse_qsl
+
+
+def make_transactions(n, start=None, seed=0, per_day=3):
+    """
+    Genera `n` transacciones con la forma de GoCardless (`per_day` por día),
+    de la más reciente a la más antigua (como las devuelve el banco).
+    """
+    rnd = random.Random(seed)
+    start = start or date.today()
+    nombres = ["MARCO PEREZ", "ALEJANDRO RUIZ", "LUIS MIGUEL GOMEZ", "IBERDROLA", "MOVISTAR"]
+    txs = []
+    for i in range(n):
+        dia = start - timedelta(days=i // per_day)
+        amt = rnd.choice(["-800.00", "250.00", "-45.30", "-29.99", "300.00"])
+        tx = {
+            "transactionId": f"tx-{i}",
+            "bookingDate": dia.isoformat(),
+            "transactionAmount": {"amount": amt, "currency": "EUR"},
+            "remittanceInformationUnstructuredArray": [f"Concepto {i}"],
+        }
+        if amt.startswith("-"):
+            tx["creditorName"] = rnd.choice(nombres)
+        else:
+            tx["debtorName"] = rnd.choice(nombres)
+        txs.append(tx)
+    return txs
+
+
+class GoCardlessStub:
+    """
+    Imita los endpoints de cuenta de GoCardless (`balances`, `details`,
+    `transactions`) con una latencia configurable, una cuota por endpoint y
+    una proporción de 429 aleatorios.
+
+    Con `token_ttl` también imita la autenticación (`/token/new/` y
+    `/token/refresh/`): los tokens caducan a los `token_ttl` segundos y las
+    peticiones sin un token vigente reciben 401.
+    """
+
+    def __init__(self, latency=0.2, transactions=None, quota=None, error_rate=0.0,
+                 seed=0, host="127.0.0.1", port=0, token_ttl=None, refresh_ttl=3600,
+                 secret=("bench-id", "bench-key")):
+        self.latency = latency
+        self.down = False               # True = el banco responde 503 (tras la latencia)
+        self.token_ttl = token_ttl      # None = no se comprueba el token
+        self.refresh_ttl = refresh_ttl
+        self.secret = secret
+        self.tokens = {}                # token -> (tipo, caduca)
+        self._token_seq = 0
+        self.quota = quota  # peticiones por endpoint antes de devolver 429 (None = sin límite)
+        self.error_rate = error_rate  # proporción de peticiones que reciben un 429
+        self._rnd = random.Random(seed)
+        self.transactions = transactions if transactions is not None else make_transactions(50)
+        self.calls = {}
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Sin esto, Nagle + ACK retardado añaden ~40 ms por respuesta
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                stub._handle(self)
+
+            def do_POST(self):
+                stub._handle_token(self)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        # Clientes que cortan la conexión (p. ej. al parar el polling) no son errores
+        self.server.handle_error = lambda request, client_address: None
+        self._thread = None
+
+    @property
+    def api_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/api/v2"
+
+    @property
+    def base_url(self):
+        return f"{self.api_url}/accounts/bench"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _count(self, endpoint):
+        with self._lock:
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+            return self.calls[endpoint]
+
+    def _chance(self, p):
+        with self._lock:
+            return self._rnd.random() < p
+
+    def _issue(self, kind, ttl):
+        with self._lock:
+            self._token_seq += 1
+            token = f"{kind}-{self._token_seq}"
+            self.tokens[token] = (kind, time.time() + ttl)
+        return token
+
+    def _valid(self, token, kind):
+        entry = self.tokens.get(token)
+        return entry is not None and entry[0] == kind and time.time() < entry[1]
+
+    def _handle_token(self, req):
+        endpoint = urlparse(req.path).path.rstrip("/").rsplit("/", 1)[-1]
+        self._count(f"token_{endpoint}")
+        length = int(req.headers.get("Content-Length", 0))
+        body = json.loads(req.rfile.read(length) or b"{}")
+        time.sleep(self.latency)
+        ttl = self.token_ttl or 86400
+        if endpoint == "new":
+            if (body.get("secret_id"), body.get("secret_key")) != tuple(self.secret):
+                return self._send(req, 401, {"summary": "Authentication failed", "status_code": 401})
+            return self._send(req, 200, {
+                "access": self._issue("access", ttl), "access_expires": ttl,
+                "refresh": self._issue("refresh", self.refresh_ttl), "refresh_expires": self.refresh_ttl,
+            })
+        if endpoint == "refresh":
+            if not self._valid(body.get("refresh"), "refresh"):
+                return self._send(req, 401, {"summary": "Invalid token", "status_code": 401})
+            return self._send(req, 200, {"access": self._issue("access", ttl), "access_expires": ttl})
+        self._send(req, 404, {"detail": "Not found"})
+
+    def _handle(self, req):
+        url = urlparse(req.path)
+        endpoint = url.path.rstrip("/").rsplit("/", 1)[-1]
+        if self.token_ttl is not None:
+            auth = req.headers.get("Authorization", "")
+            if not self._valid(auth.removeprefix("Bearer "), "access"):
+                self._count("401")
+                return self._send(req, 401, {
+                    "summary": "Invalid token", "detail": "Token is invalid or expired",
+                    "status_code": 401,
+                })
+        n = self._count(endpoint)
+        time.sleep(self.latency)
+        if self.down:
+            return self._send(req, 503, {"summary": "Service Unavailable", "status_code": 503})
+        headers = {}
+        if self.quota is not None:
+            remaining = max(0, self.quota - n)
+            headers = {
+                "HTTP_X_RATELIMIT_ACCOUNT_SUCCESS_LIMIT": self.quota,
+                "HTTP_X_RATELIMIT_ACCOUNT_SUCCESS_REMAINING": remaining,
+                "HTTP_X_RATELIMIT_ACCOUNT_SUCCESS_RESET": 86400,
+            }
+            if n > self.quota:
+                return self._send(req, 429, {
+                    "detail": "Request was throttled. Expected available in 86400 seconds."
+                }, headers)
+        if self.error_rate and self._chance(self.error_rate):
+            self._count("429")
+            return self._send(req, 429, {
+                "detail": "Request was throttled. Expected available in 60 seconds."
+            }, {"Retry-After": 60})
+        if endpoint == "balances":
+            body = {"balances": [{
+                "balanceType": "interimAvailable",
+                "balanceAmount": {"amount": "1234.56", "currency": "EUR"},
+                "referenceDate": date.today().isoformat(),
+            }]}
+        elif endpoint == "details":
+            body = {"account": {"iban": "ES0000000000000000000000", "currency": "EUR"}}
+        elif endpoint == "transactions":
+            qs = parse_qs(url.query)
+            desde = qs.get("date_from", [""])[0]
+            hasta = qs.get("date_to", ["9999-12-31"])[0]
+            booked = [
+                tx for tx in self.transactions
+                if desde <= tx["bookingDate"] <= hasta
+            ]
+            body = {"transactions": {"booked": booked, "pending": []}}
+        else:
+            return self._send(req, 404, {"detail": "Not found"})
+        self._send(req, 200, body, headers)
+
+    def _send(self, req, status, body, headers=None):
+        payload = json.dumps(body).encode()
+        req.send_response(status)
+        req.send_header("Content-Type", "application/json")
+        req.send_header("Content-Length", str(len(payload)))
+        for k, v in (headers or {}).items():
+            req.send_header(k, str(v))
+        req.end_headers()
+        req.wfile.write(payload)
+
+
+def make_update(update_id, text, chat_id=1, chat_type="private", user_id=None):
+    """
+    Update de Telegram con un mensaje de texto (y sus entidades de orden y
+    de mención). El remitente es `user_id` o, si no se indica, el chat.
+    """
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": chat_type},
+        "from": {"id": user_id or chat_id, "is_bot": False, "first_name": "Bench"},
+        "text": text,
+    }
+    entities = []
+    if text.startswith("/"):
+        length = len(text.split()[0])
+        entities.append({"type": "bot_command", "offset": 0, "length": length})
+    for m in re.finditer(r"(?<!\S)@\w+", text):
+        entities.append({"type": "mention", "offset": m.start(), "length": len(m.group())})
+    if entities:
+        message["entities"] = entities
+    return {"update_id": update_id, "message": message}
+
+
+class TelegramStub:
+    """
+    Imita la Bot API de Telegram lo justo para el bot: getMe, getUpdates
+    (long polling), setWebhook/deleteWebhook y sendMessage. Se usa con
+    `ApplicationBuilder().base_url(stub.base_url)`. `error_rate` es la
+    proporción de sendMessage que reciben un 429 de control de flujo;
+    con `chat_interval`, también los que llegan a un chat antes de que pasen
+    esos segundos desde el anterior (como hace Telegram).
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0, retry_after=1, seed=0,
+                 username="bench_bot", host="127.0.0.1", port=0, chat_interval=0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.chat_interval = chat_interval
+        self._last_sent = {}    # chat_id -> último sendMessage aceptado
+        self._rnd = random.Random(seed)
+        self.username = username
+        self.calls = {}
+        self.sent = []          # (chat_id, texto) de cada sendMessage
+        self._updates = []      # cola para getUpdates
+        self._cond = threading.Condition()
+        self._message_id = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Sin esto, Nagle + ACK retardado añaden ~40 ms por respuesta
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                stub._handle(self)
+
+            do_GET = do_POST
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        # Clientes que cortan la conexión (p. ej. al parar el polling) no son errores
+        self.server.handle_error = lambda request, client_address: None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/bot"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._cond.notify_all()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def push_updates(self, updates):
+        """
+        Encola updates para que los recoja getUpdates.
+        """
+        with self._cond:
+            self._updates.extend(updates)
+            self._cond.notify_all()
+
+    def wait_sent(self, n, timeout=60.0):
+        """
+        Espera (en un hilo) a que el bot haya enviado `n` mensajes.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while len(self.sent) < n:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return False
+                self._cond.wait(left)
+        return True
+
+    def _params(self, req):
+        length = int(req.headers.get("Content-Length", 0) or 0)
+        body = req.rfile.read(length) if length else b""
+        ctype = req.headers.get("Content-Type", "")
+        if "json" in ctype:
+            return json.loads(body or b"{}")
+        params = {}
+        for k, v in parse_qsl(body.decode(errors="replace")):
+            try:
+                params[k] = json.loads(v)
+            except ValueError:
+                params[k] = v
+        return params
+
+    def _handle(self, req):
+        method = urlparse(req.path).path.rsplit("/", 1)[-1]
+        params = self._params(req)
+        with self._cond:
+            self.calls[method] = self.calls.get(method, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Bench", "username": self.username}
+        elif method == "getUpdates":
+            result = self._get_updates(params)
+        elif method == "sendMessage":
+            retry_after = self.retry_after
+            with self._cond:
+                flood = bool(self.error_rate) and self._rnd.random() < self.error_rate
+                if self.chat_interval and not flood:
+                    now = time.monotonic()
+                    last = self._last_sent.get(params.get("chat_id"))
+                    if last is not None and now - last < self.chat_interval:
+                        flood = True
+                        retry_after = max(1, math.ceil(self.chat_interval - (now - last)))
+                    else:
+                        self._last_sent[params.get("chat_id")] = now
+            if flood:
+                with self._cond:
+                    self.calls["429"] = self.calls.get("429", 0) + 1
+                return self._reply(req, 429, {
+                    "ok": False, "error_code": 429,
+                    "description": f"Too Many Requests: retry after {retry_after}",
+                    "parameters": {"retry_after": retry_after},
+                })
+            result = self._send_message(params)
+        else:
+            result = True
+        self._reply(req, 200, {"ok": True, "result": result})
+
+    def _get_updates(self, params):
+        offset = int(params.get("offset") or 0)
+        timeout = float(params.get("timeout") or 0)
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                self._updates = [u for u in self._updates if u["update_id"] >= offset]
+                if self._updates or time.monotonic() >= deadline:
+                    return self._updates[:int(params.get("limit") or 100)]
+                self._cond.wait(deadline - time.monotonic())
+
+    def _send_message(self, params):
+        chat_id = params.get("chat_id")
+        with self._cond:
+            self._message_id += 1
+            self.sent.append((chat_id, params.get("text", "")))
+            self._cond.notify_all()
+            message_id = self._message_id
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": params.get("text", ""),
+        }
+
+    def _reply(self, req, status, body):
+        payload = json.dumps(body).encode()
+        req.send_response(status)
+        req.send_header("Content-Type", "application/json")
+        req.send_header("Content-Length", str(len(payload)))
+        req.end_headers()
+        req.wfile.write(payload)
@@ -0,0 +1,100 @@
+"""
+Cortacircuitos para los endpoints del banco.
+
+Tras `threshold` fallos seguidos (5xx, timeouts o errores de conexión) el
+circuito de ese endpoint se abre: durante `cooldown` segundos las peticiones
+ni siquiera salen y los comandos responden al momento con lo último que se
+guardó. Pasado ese tiempo se deja salir una única petición de prueba
+(semiabierto): si va bien se cierra, y si falla se vuelve a abrir con el doble
+de espera (hasta `max_cooldown`).
+
+Cada petición autorizada recibe un número (`allow`) que luego pasa a
+`success`, `failure` o `release`. Así una petición que salió antes de abrirse
+el circuito y termina tarde no se confunde con la de prueba.
+"""
+import time
+
+CLOSED = "cerrado"
+OPEN = "abierto"
+HALF_OPEN = "semiabierto"
+
+
+class CircuitBreaker:
+    __slots__ = ("threshold", "base_cooldown", "max_cooldown", "cooldown",
+                 "state", "failures", "open_until", "probe", "issued")
+
+    def __init__(self, threshold=3, cooldown=30.0, max_cooldown=600.0):
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.failures = 0          # fallos seguidos
+        self.open_until = 0.0
+        self.probe = 0             # número de la petición de prueba en vuelo (0 = ninguna)
+        self.issued = 0            # último número dado por `allow`
+
+    def allow(self, now=None) -> int:
+        """
+        ¿Puede salir una petición? 0 si no; si sí, su número (nunca 0). En
+        semiabierto sólo sale la primera, que es la de prueba.
+        """
+        if self.state == CLOSED:
+            return self._issue()
+        now = time.time() if now is None else now
+        if self.state == OPEN:
+            if now < self.open_until:
+                return 0
+            self.state = HALF_OPEN
+        if self.probe:
+            return 0
+        self.probe = self._issue()
+        return self.probe
+
+    def _issue(self):
+        self.issued += 1
+        return self.issued
+
+    def success(self, ticket) -> None:
+        # Con el circuito abierto sólo cuenta lo que diga la prueba
+        if self.state != CLOSED and ticket != self.probe:
+            return
+        self.state = CLOSED
+        self.failures = 0
+        self.cooldown = self.base_cooldown
+        self.probe = 0
+
+    def failure(self, ticket, now=None) -> None:
+        if self.state != CLOSED and ticket != self.probe:
+            return
+        now = time.time() if now is None else now
+        if self.state == HALF_OPEN:
+            # La prueba ha fallado: otra vez abierto, esperando el doble
+            self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+            self._open(now)
+            return
+        self.failures += 1
+        if self.failures >= self.threshold:
+            self._open(now)
+
+    def release(self, ticket) -> None:
+        """
+        La petición `ticket` ha terminado (o no llegó a salir: cuota local,
+        cancelación): si era la prueba y sigue pendiente, se deja paso a otra.
+        """
+        if ticket and ticket == self.probe:
+            self.probe = 0
+
+    def _open(self, now):
+        self.state = OPEN
+        self.open_until = now + self.cooldown
+        self.probe = 0
+
+    def retry_in(self, now=None) -> int:
+        """
+        Segundos hasta la próxima petición de prueba (0 si el circuito está cerrado).
+        """
+        if self.state == CLOSED:
+            return 0
+        now = time.time() if now is None else now
+        return max(1, int(self.open_until - now + 0.999))
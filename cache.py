@@ -0,0 +1,134 @@
+"""
+Caché de respuestas del banco con TTL por endpoint y límite LRU.
+
+Si la entrada está caducada se devuelve igualmente al momento y se refresca
+en segundo plano (stale-while-revalidate); sólo un fallo de caché completo
+espera al banco.
+
+Con varios procesos, `SharedResponses` guarda además las respuestas en
+SQLite: lo que descarga un proceso les vale a los demás, que lo consultan
+cuando no tienen nada en memoria o lo suyo está caducado.
+"""
+import asyncio
+import json
+import sqlite3
+import time
+from collections import Counter, OrderedDict
+
+import httpx
+
+from quota import endpoint_key
+
+# Cabeceras que no se guardan: el cuerpo se guarda ya descomprimido
+_DROP_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+
+class SharedResponses:
+    def __init__(self, path="cache.db"):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "url TEXT PRIMARY KEY, status INTEGER NOT NULL, headers TEXT NOT NULL, "
+            "body BLOB NOT NULL, fetched_at REAL NOT NULL)"
+        )
+
+    def get(self, url):
+        """
+        `(respuesta, instante de descarga)` guardada para `url`, o None.
+        """
+        row = self.conn.execute(
+            "SELECT status, headers, body, fetched_at FROM responses WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        status, headers, body, fetched_at = row
+        resp = httpx.Response(
+            status, headers=json.loads(headers), content=body, request=httpx.Request("GET", url)
+        )
+        return resp, fetched_at
+
+    def put(self, url, resp, fetched_at):
+        headers = [(k, v) for k, v in resp.headers.items() if k.lower() not in _DROP_HEADERS]
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (url, status, headers, body, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (url, resp.status_code, json.dumps(headers), resp.content, fetched_at),
+            )
+
+    def close(self):
+        self.conn.close()
+
+
+class ResponseCache:
+    def __init__(self, ttls=None, default_ttl=300, max_entries=64, shared=None):
+        self.ttls = dict(ttls or {})  # endpoint -> segundos
+        self.shared = shared          # SharedResponses entre procesos (o None)
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # url -> (respuesta, instante de descarga)
+        self.counters = Counter()     # (endpoint, "hit" | "stale" | "miss") -> veces
+        self._refreshing = {}         # url -> tarea de refresco en curso
+
+    def ttl_for(self, url) -> float:
+        return self.ttls.get(endpoint_key(url)[1], self.default_ttl)
+
+    def _store(self, url, resp):
+        # Sólo se guardan respuestas buenas: un 429 o un 500 no deben cachearse
+        if resp.status_code != 200:
+            return
+        self._remember(url, (resp, time.time()))
+        if self.shared is not None:
+            self.shared.put(url, resp, self.entries[url][1])
+
+    def _remember(self, url, entry):
+        self.entries[url] = entry
+        self.entries.move_to_end(url)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _refresh(self, url, fetch):
+        if url in self._refreshing:
+            return
+
+        async def refresh():
+            try:
+                self._store(url, await fetch())
+            except Exception:
+                # Si falla, seguimos sirviendo lo que había
+                pass
+            finally:
+                self._refreshing.pop(url, None)
+
+        self._refreshing[url] = asyncio.create_task(refresh())
+
+    async def get(self, url, fetch):
+        """
+        Devuelve `(respuesta, edad_en_segundos)`. `fetch` es una corrutina sin
+        argumentos que descarga la respuesta del banco.
+        """
+        endpoint = endpoint_key(url)[1]
+        entry = self.entries.get(url)
+        if self.shared is not None and (entry is None or time.time() - entry[1] > self.ttl_for(url)):
+            # Quizá otro proceso lo tiene más reciente
+            shared = self.shared.get(url)
+            if shared is not None and (entry is None or shared[1] > entry[1]):
+                entry = shared
+                self._remember(url, entry)
+        if entry is not None:
+            resp, fetched_at = entry
+            self.entries.move_to_end(url)
+            age = time.time() - fetched_at
+            if age <= self.ttl_for(url):
+                self.counters[(endpoint, "hit")] += 1
+            else:
+                self.counters[(endpoint, "stale")] += 1
+                self._refresh(url, fetch)
+            return resp, age
+
+        self.counters[(endpoint, "miss")] += 1
+        resp = await fetch()
+        self._store(url, resp)
+        return resp, 0.0
@@ -0,0 +1,42 @@
+"""
+Disparadores mensuales para las tareas programadas.
+
+En lugar de despertar cada día y salir si no toca, se calcula la fecha
+exacta del próximo disparo (teniendo en cuenta meses cortos y excepciones
+por mes) y se programa un único job para ese instante.
+"""
+import calendar
+from datetime import datetime, timedelta
+
+
+class MonthlyTrigger:
+    def __init__(self, day, at, overrides=None):
+        """
+        `day`: día del mes; `at`: hora (datetime.time); `overrides`: día
+        distinto para meses concretos, p. ej. `{2: 26}`. Si el mes no tiene
+        ese día se usa el último.
+        """
+        self.day = day
+        self.at = at
+        self.overrides = dict(overrides or {})
+
+    def fire_date(self, year, month) -> datetime:
+        day = self.overrides.get(month, self.day)
+        day = min(day, calendar.monthrange(year, month)[1])
+        return datetime(year, month, day, self.at.hour, self.at.minute, self.at.second)
+
+    def next_fire(self, now) -> datetime:
+        """
+        Primer disparo estrictamente posterior a `now`.
+        """
+        year, month = now.year, now.month
+        while True:
+            fire = self.fire_date(year, month)
+            if fire > now:
+                return fire
+            month += 1
+            if month > 12:
+                year, month = year + 1, 1
+
+    def seconds_until_next(self, now) -> float:
+        return max(0.0, (self.next_fire(now) - now) / timedelta(seconds=1))
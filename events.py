@@ -0,0 +1,100 @@
+"""
+Avisos automáticos a partir de lo que llega del banco.
+
+El sondeo periódico convierte las transacciones nuevas (y, si hace falta, el
+saldo) en eventos, y cada regla decide si un evento merece un aviso. Las
+reglas son objetos pequeños con un método `check(event)` que devuelve el
+texto del aviso o None, así que añadir una nueva no toca el sondeo.
+"""
+from transaction import format_cents
+
+
+class TransactionEvent:
+    __slots__ = ("tx",)
+    kind = "transaction"
+
+    def __init__(self, tx):
+        self.tx = tx
+
+
+class BalanceEvent:
+    __slots__ = ("amount", "currency")
+    kind = "balance"
+
+    def __init__(self, amount, currency="EUR"):
+        self.amount = amount        # céntimos
+        self.currency = currency
+
+
+class RoommatePaid:
+    """
+    Un ingreso de un compañero de piso (según `roommates.PaymentMatcher`).
+    """
+
+    def __init__(self, matcher):
+        self.matcher = matcher
+
+    def check(self, event):
+        if event.kind != "transaction" or event.tx.amount <= 0:
+            return None
+        r = self.matcher.match(event.tx.debtor)
+        if r is None:
+            return None
+        return (f"💶 *{r.name}* ha ingresado {format_cents(event.tx.amount)} "
+                f"{event.tx.currency} ({event.tx.date_text()}).")
+
+
+class RentSent:
+    """
+    Un cargo de al menos el importe del alquiler.
+    """
+
+    def __init__(self, amount):
+        self.amount = amount        # céntimos
+
+    def check(self, event):
+        if event.kind != "transaction" or event.tx.amount > -self.amount:
+            return None
+        return (f"🏠 Alquiler enviado: {format_cents(-event.tx.amount)} {event.tx.currency} "
+                f"a *{event.tx.counterparty or '—'}* ({event.tx.date_text()}).")
+
+
+class BalanceBelow:
+    """
+    El saldo baja de un umbral. Sólo avisa al cruzarlo, no en cada sondeo.
+    """
+
+    def __init__(self, threshold):
+        self.threshold = threshold  # céntimos
+        self.below = False
+
+    def check(self, event):
+        if event.kind != "balance":
+            return None
+        was_below, self.below = self.below, event.amount < self.threshold
+        if self.below and not was_below:
+            return (f"⚠️ Saldo bajo: {format_cents(event.amount)} {event.currency} "
+                    f"(umbral {format_cents(self.threshold)}).")
+        return None
+
+
+class RuleEngine:
+    def __init__(self, rules=()):
+        self.rules = list(rules)
+
+    def process(self, events):
+        """
+        Avisos que generan los eventos, en orden. Una regla que falla no
+        impide evaluar las demás.
+        """
+        avisos = []
+        for event in events:
+            for rule in self.rules:
+                try:
+                    aviso = rule.check(event)
+                except Exception as e:
+                    print(f"Error en la regla {type(rule).__name__}: {e}")
+                    continue
+                if aviso:
+                    avisos.append(aviso)
+        return avisos
@@ -0,0 +1,109 @@
+"""
+Exportación del histórico de transacciones a CSV o Parquet (/exportar).
+
+Las transacciones se leen del almacén por páginas (`TransactionStore.pages`)
+y cada página se escribe en el fichero antes de pedir la siguiente, así que
+en memoria sólo hay una página a la vez aunque se exporten varios años.
+
+Parquet necesita pyarrow, que es opcional: sin él, `FORMATS` sólo tiene csv.
+Cada página se escribe como un grupo de filas.
+"""
+import asyncio
+import csv
+import os
+import tempfile
+from decimal import Decimal
+
+from transaction import format_cents
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # dependencia opcional
+    pa = pq = None
+
+PAGE_SIZE = 2000
+HEADER = ("fecha", "importe", "moneda", "contrapartida", "concepto", "acreedor", "deudor", "id",
+          "cuenta")
+FORMATS = ("csv", "parquet") if pa is not None else ("csv",)
+
+
+def _row(tx):
+    return (
+        tx.booking_date, format_cents(tx.amount), tx.currency, tx.counterparty or "",
+        tx.concept or "", tx.creditor or "", tx.debtor or "", tx.id, tx.account or "",
+    )
+
+
+async def _write_csv(path, pages):
+    n = 0
+    with open(path, "w", newline="", encoding="utf-8") as out:
+        writer = csv.writer(out)
+        writer.writerow(HEADER)
+        for page in pages:
+            writer.writerows(_row(tx) for tx in page)
+            n += len(page)
+            # Entre página y página se atiende al resto de chats
+            await asyncio.sleep(0)
+    return n
+
+
+def _schema():
+    return pa.schema([
+        ("fecha", pa.date32()),
+        ("importe", pa.decimal128(18, 2)),
+        ("moneda", pa.string()),
+        ("contrapartida", pa.string()),
+        ("concepto", pa.string()),
+        ("acreedor", pa.string()),
+        ("deudor", pa.string()),
+        ("id", pa.string()),
+        ("cuenta", pa.string()),
+    ])
+
+
+async def _write_parquet(path, pages):
+    schema = _schema()
+    n = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for page in pages:
+            columns = [
+                [tx.booking_date for tx in page],
+                [Decimal(tx.amount).scaleb(-2) for tx in page],
+                [tx.currency for tx in page],
+                [tx.counterparty for tx in page],
+                [tx.concept for tx in page],
+                [tx.creditor for tx in page],
+                [tx.debtor for tx in page],
+                [tx.id for tx in page],
+                [tx.account for tx in page],
+            ]
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(col, type=field.type) for col, field in zip(columns, schema)],
+                schema=schema,
+            ))
+            n += len(page)
+            await asyncio.sleep(0)
+    return n
+
+
+async def export(store, date_from, date_to, fmt="csv", page_size=PAGE_SIZE):
+    """
+    Escribe en un fichero temporal las transacciones de `store` con fecha en
+    [date_from, date_to] y devuelve (ruta, cuántas). Quien llama borra el
+    fichero cuando ya no lo necesita.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"formato no disponible: {fmt}")
+    fd, path = tempfile.mkstemp(prefix="transacciones_", suffix=f".{fmt}")
+    os.close(fd)
+    pages = store.pages(date_from, date_to, page_size)
+    try:
+        if fmt == "csv":
+            n = await _write_csv(path, pages)
+        else:
+            n = await _write_parquet(path, pages)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, n
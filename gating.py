@@ -0,0 +1,105 @@
+"""
+Filtrado de updates antes de que lleguen a los handlers.
+
+- `Addressed`: filtro de PTB que deja pasar, en grupos, sólo los mensajes
+  dirigidos al bot según las entidades del mensaje (una mención `@bot` o una
+  orden `/orden@bot`), sin buscar subcadenas en el texto. En privado pasa todo.
+- `Throttle`: cubetas de fichas por usuario y por chat, para que nadie pueda
+  convertir una ráfaga de /saldo en una ráfaga de llamadas al banco.
+
+Ambos se enganchan en grupos de handlers negativos (ver `build_application`
+en app.py), que PTB evalúa antes que los normales; lo descartado se cuenta en
+`metrics.UPDATES_DROPPED`.
+"""
+import time
+from collections import OrderedDict
+
+from telegram import MessageEntity
+from telegram.ext import filters
+
+# Cubetas que se recuerdan como mucho (las menos usadas se olvidan)
+MAX_BUCKETS = 10000
+
+
+def is_addressed(message, username) -> bool:
+    """
+    ¿Va el mensaje dirigido al bot `username` (sin @)?
+    """
+    if message is None or not username:
+        return False
+    objetivo = "@" + username.lower()
+    entities = message.parse_entities([MessageEntity.MENTION, MessageEntity.BOT_COMMAND])
+    for entity, text in entities.items():
+        text = text.lower()
+        if entity.type == MessageEntity.MENTION and text == objetivo:
+            return True
+        if entity.type == MessageEntity.BOT_COMMAND and text.endswith(objetivo):
+            return True
+    return False
+
+
+class Addressed(filters.MessageFilter):
+    """
+    Mensajes privados, o de grupo dirigidos al bot.
+    """
+
+    def filter(self, message) -> bool:
+        if message.chat.type not in (message.chat.GROUP, message.chat.SUPERGROUP):
+            return True
+        return is_addressed(message, message.get_bot().username)
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "stamp", "warned")
+
+    def __init__(self, burst, now):
+        self.tokens = float(burst)
+        self.stamp = now
+        self.warned = False   # ya se avisó al vaciarse (sólo se avisa una vez)
+
+
+class Throttle:
+    def __init__(self, rate, burst, max_buckets=MAX_BUCKETS):
+        self.rate = rate              # fichas por segundo
+        self.burst = burst            # fichas como mucho (ráfaga permitida)
+        self.max_buckets = max_buckets
+        self.buckets = OrderedDict()  # clave -> TokenBucket
+
+    def _bucket(self, key, now):
+        b = self.buckets.get(key)
+        if b is None:
+            b = self.buckets[key] = TokenBucket(self.burst, now)
+            if len(self.buckets) > self.max_buckets:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+            b.tokens = min(self.burst, b.tokens + (now - b.stamp) * self.rate)
+            b.stamp = now
+        return b
+
+    def wait(self, key, now=None) -> float:
+        """
+        Segundos hasta que `key` tenga una ficha, sin gastarla.
+        """
+        now = time.monotonic() if now is None else now
+        b = self._bucket(key, now)
+        return 0.0 if b.tokens >= 1 else (1 - b.tokens) / self.rate
+
+    def take(self, key, now=None) -> bool:
+        now = time.monotonic() if now is None else now
+        b = self._bucket(key, now)
+        if b.tokens >= 1:
+            b.tokens -= 1
+            b.warned = False
+            return True
+        return False
+
+    def should_warn(self, key) -> bool:
+        """
+        True la primera vez que se rechaza a `key` desde que le quedaban fichas.
+        """
+        b = self.buckets.get(key)
+        if b is None or b.warned:
+            return False
+        b.warned = True
+        return True
@@ -0,0 +1,238 @@
+"""
+Cliente asíncrono para la API de GoCardless (Bank Account Data).
+
+Todas las llamadas al banco pasan por aquí en lugar de usar `requests.get`
+directamente desde los handlers: así no se bloquea el bucle de eventos del
+bot durante el viaje HTTPS y se reutilizan las conexiones keep-alive.
+La cuota del banco se controla en `quota.QuotaManager`, el token de acceso
+en `auth` (`TokenManager` o `StaticToken`) y las caídas del banco con un
+cortacircuitos por cuenta y endpoint (`breaker.CircuitBreaker`).
+"""
+import time
+
+import httpx
+
+from auth import TokenError
+from breaker import CLOSED, CircuitBreaker
+from metrics import UPSTREAM_LATENCY, UPSTREAM_REQUESTS
+from quota import PRIORITY_INTERACTIVE, QuotaExceeded, QuotaManager, endpoint_key
+
+# Tiempos máximos: conectar rápido o fallar, pero dar margen a la respuesta
+DEFAULT_TIMEOUT = httpx.Timeout(15.0, connect=5.0)
+# Pool compartido: pocas conexiones, todas al mismo host
+DEFAULT_LIMITS = httpx.Limits(
+    max_connections=10,
+    max_keepalive_connections=5,
+    keepalive_expiry=60.0,
+)
+
+
+class GoCardlessClient:
+    """
+    Envoltorio fino sobre un único `httpx.AsyncClient` compartido por todos
+    los comandos y tareas programadas.
+    """
+
+    def __init__(self, headers, timeout=DEFAULT_TIMEOUT, limits=DEFAULT_LIMITS, quota=None,
+                 auth=None):
+        self.headers = dict(headers)
+        self.timeout = timeout
+        self.limits = limits
+        self.quota = quota or QuotaManager()
+        self.auth = auth   # None = la autorización ya va en `headers`
+        self.breakers = {}  # (cuenta, endpoint) -> CircuitBreaker
+        self._client = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # Se crea perezosamente para que nazca dentro del bucle de eventos
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                headers=self.headers,
+                timeout=self.timeout,
+                limits=self.limits,
+            )
+        return self._client
+
+    def breaker(self, url) -> CircuitBreaker:
+        key = endpoint_key(url)
+        b = self.breakers.get(key)
+        if b is None:
+            b = self.breakers[key] = CircuitBreaker()
+        return b
+
+    def is_down(self, url) -> bool:
+        """
+        ¿Está abierto (o probando) el circuito del endpoint de `url`?
+        """
+        b = self.breakers.get(endpoint_key(url))
+        return b is not None and b.state != CLOSED
+
+    async def _send(self, url, params, stream):
+        client = self._get_client()
+        if self.auth is None:
+            return await client.send(client.build_request("GET", url, params=params), stream=stream)
+        access = await self.auth.token()
+        for _ in range(2):
+            request = client.build_request(
+                "GET", url, params=params, headers={"Authorization": f"Bearer {access}"}
+            )
+            resp = await client.send(request, stream=stream)
+            if resp.status_code != 401:
+                return resp
+            # Token rechazado antes de tiempo: se renueva (una sola vez para
+            # todas las peticiones que lo usaban) y se reintenta
+            self.auth.invalidate(access)
+            nuevo = await self.auth.token()
+            if nuevo == access:
+                return resp
+            await resp.aclose()
+            access = nuevo
+        return resp
+
+    async def get(self, url, params=None, priority=PRIORITY_INTERACTIVE,
+                  stream=False) -> httpx.Response:
+        """
+        GET asíncrono. Devuelve la respuesta tal cual (también los 429) para
+        que el llamante decida con `check_rate_limit`. Si la cuota local ya
+        está agotada no se llama al banco y se devuelve un 429 equivalente;
+        si el banco no responde (error de red o circuito abierto), un 503.
+
+        Con `stream=True` un 200 se devuelve sin leer el cuerpo, para
+        recorrerlo con `resp.aiter_bytes()`; el llamante debe cerrarlo con
+        `await resp.aclose()`. Estas peticiones no se agrupan con otras, y
+        para el cortacircuitos sólo salen bien si el cuerpo llega entero.
+        """
+        endpoint = endpoint_key(url)[1]
+        breaker = self.breaker(url)
+        ticket = breaker.allow()
+        if not ticket:
+            UPSTREAM_REQUESTS.inc(endpoint=endpoint, status=503, origin="local")
+            return local_unavailable(url, breaker.retry_in())
+
+        handed_off = []
+
+        async def fetch():
+            t0 = time.perf_counter()
+            try:
+                resp = await self._send(url, params, stream)
+            except httpx.TransportError:
+                breaker.failure(ticket)
+                raise
+            if resp.status_code >= 500:
+                breaker.failure(ticket)
+            elif stream and resp.status_code == 200:
+                # El resultado se sabe al terminar de leer el cuerpo
+                resp.stream = WatchedStream(resp.stream, breaker, ticket)
+                handed_off.append(ticket)
+            else:
+                breaker.success(ticket)
+            if stream and resp.status_code != 200:
+                # Los errores se leen enteros: son pequeños y el llamante los inspecciona
+                try:
+                    await resp.aread()
+                finally:
+                    await resp.aclose()
+            UPSTREAM_LATENCY.observe(time.perf_counter() - t0, endpoint=endpoint)
+            UPSTREAM_REQUESTS.inc(endpoint=endpoint, status=resp.status_code, origin="banco")
+            return resp
+
+        try:
+            return await self.quota.run(url, params, priority, fetch, coalesce=not stream)
+        except QuotaExceeded as e:
+            UPSTREAM_REQUESTS.inc(endpoint=endpoint, status=429, origin="local")
+            return local_rate_limited(url, e.retry_after)
+        except TokenError as e:
+            # Credenciales rechazadas: el llamante lo ve como un error del banco
+            return e.response
+        except httpx.TransportError:
+            UPSTREAM_REQUESTS.inc(endpoint=endpoint, status=503, origin="local")
+            return local_unavailable(url, breaker.retry_in())
+        finally:
+            # Si era la petición de prueba y no llegó a salir, se deja paso a
+            # otra (la de un cuerpo en streaming la suelta `WatchedStream`)
+            if not handed_off:
+                breaker.release(ticket)
+
+    def stream_failed(self, url, error) -> httpx.Response:
+        """
+        El cuerpo de una respuesta en streaming se cortó a medias (`error` de
+        red al leerlo, ya fuera de `get`; el fallo ya lo anotó
+        `WatchedStream`): el mismo 503 local que da `get` cuando el banco no
+        responde.
+        """
+        print(f"GoCardless: respuesta cortada leyendo {url}: {error!r}")
+        breaker = self.breaker(url)
+        UPSTREAM_REQUESTS.inc(endpoint=endpoint_key(url)[1], status=503, origin="local")
+        return local_unavailable(url, breaker.retry_in())
+
+    async def aclose(self) -> None:
+        """
+        Cierra el pool de conexiones (al apagar el bot).
+        """
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        if self.auth is not None:
+            await self.auth.aclose()
+
+
+def local_rate_limited(url, seconds) -> httpx.Response:
+    """
+    Respuesta 429 generada localmente, con la misma forma que la del banco.
+    """
+    return httpx.Response(
+        429,
+        headers={"Retry-After": str(seconds), "X-Local-Quota": "1"},
+        json={"detail": f"Request was throttled. Expected available in {seconds} seconds."},
+        request=httpx.Request("GET", url),
+    )
+
+
+class WatchedStream(httpx.AsyncByteStream):
+    """
+    Cuerpo de una respuesta en streaming que avisa al cortacircuitos al
+    acabar: bien si se leyó entero, fallo si se cortó por la red. Al
+    cerrarlo se suelta la petición (si era la de prueba, deja paso a otra).
+    """
+
+    def __init__(self, stream, breaker, ticket):
+        self.stream = stream
+        self.breaker = breaker
+        self.ticket = ticket
+
+    async def __aiter__(self):
+        try:
+            async for chunk in self.stream:
+                yield chunk
+        except httpx.TransportError:
+            self._done(self.breaker.failure)
+            raise
+        self._done(self.breaker.success)
+
+    async def aclose(self):
+        try:
+            await self.stream.aclose()
+        finally:
+            self._done(None)
+
+    def _done(self, result):
+        if self.ticket is None:
+            return
+        if result is not None:
+            result(self.ticket)
+        self.breaker.release(self.ticket)
+        self.ticket = None
+
+
+def local_unavailable(url, seconds) -> httpx.Response:
+    """
+    Respuesta 503 generada localmente cuando el banco no responde.
+    """
+    return httpx.Response(
+        503,
+        headers={"Retry-After": str(seconds), "X-Circuit-Open": "1"},
+        json={"detail": "GoCardless no responde" + (
+            f"; se reintentará en {seconds} segundos." if seconds else "."
+        )},
+        request=httpx.Request("GET", url),
+    )
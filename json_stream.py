@@ -0,0 +1,183 @@
+"""
+Lectura incremental de los elementos de un array JSON dentro de un
+documento que llega a trozos (p. ej. el cuerpo de una respuesta HTTP).
+
+Sólo se decodifica, elemento a elemento, el array que hay en la ruta pedida
+(`("transactions", "booked")`); el resto del documento se recorre sin
+construirlo. La memoria queda acotada por el tamaño del trozo y del mayor
+elemento, no por el del documento, y el consumidor puede dejar de iterar en
+cualquier momento.
+"""
+import codecs
+import json
+import re
+
+_WS = re.compile(r"[ \t\n\r]*")
+_DECODER = json.JSONDecoder()
+
+# Un elemento más grande que esto se considera un documento malformado
+MAX_ITEM_CHARS = 1 << 20
+
+
+class ArrayStream:
+    """
+    Analizador "push": se le pasan trozos con `feed()` y devuelve los
+    elementos completos del array en `path` que ya se pueden entregar.
+    """
+
+    def __init__(self, path, max_item=MAX_ITEM_CHARS):
+        self.path = tuple(path)
+        self.max_item = max_item
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buf = ""
+        self._pos = 0
+        # Pila de contenedores abiertos: [tipo, estado, ruta, clave actual]
+        self._stack = []
+        self._started = False
+        self._finished = False
+
+    def feed(self, chunk):
+        """
+        Añade un trozo (bytes o str) y devuelve la lista de elementos nuevos.
+        """
+        if isinstance(chunk, bytes):
+            chunk = self._decoder.decode(chunk)
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return self._parse()
+
+    def close(self):
+        """
+        Fin del documento: entrega lo pendiente y comprueba que esté completo.
+        """
+        self._buf = self._buf[self._pos:] + self._decoder.decode(b"", final=True)
+        self._pos = 0
+        self._finished = True
+        items = self._parse()
+        if self._stack or not self._started or _WS.match(self._buf, self._pos).end() != len(self._buf):
+            raise ValueError("JSON incompleto o con datos de más")
+        return items
+
+    # --- Máquina de estados ---
+
+    def _decode(self):
+        """
+        Decodifica un valor en la posición actual. Devuelve `(valor, fin)` o
+        None si el trozo aún no lo contiene entero.
+        """
+        try:
+            value, end = _DECODER.raw_decode(self._buf, self._pos)
+        except json.JSONDecodeError:
+            if self._finished:
+                raise
+            if len(self._buf) - self._pos > self.max_item:
+                raise ValueError("Elemento JSON demasiado grande")
+            return None
+        # Un número al final del trozo puede seguir en el siguiente
+        if end == len(self._buf) and not self._finished:
+            return None
+        return value, end
+
+    def _parse(self):
+        items = []
+        buf = self._buf
+        while True:
+            self._pos = _WS.match(buf, self._pos).end()
+            if self._pos == len(buf):
+                return items
+            c = buf[self._pos]
+
+            if not self._stack:
+                if self._started:
+                    raise ValueError("Datos tras el final del documento JSON")
+                self._started = True
+                if not self._open(c, ()):
+                    decoded = self._decode()
+                    if decoded is None:
+                        self._started = False
+                        return items
+                    self._pos = decoded[1]
+                continue
+
+            frame = self._stack[-1]
+            kind, state, path, key = frame
+
+            if state == "end_or_first":
+                if c == ("}" if kind == "{" else "]"):
+                    self._stack.pop()
+                    self._pos += 1
+                    continue
+                frame[1] = state = "key" if kind == "{" else "value"
+
+            if state == "key":
+                if c != '"':
+                    raise ValueError(f"Se esperaba una clave en la posición {self._pos}")
+                decoded = self._decode()
+                if decoded is None:
+                    return items
+                frame[3], self._pos = decoded
+                frame[1] = "colon"
+            elif state == "colon":
+                if c != ":":
+                    raise ValueError(f"Se esperaba ':' en la posición {self._pos}")
+                self._pos += 1
+                frame[1] = "value"
+            elif state == "value":
+                child = path + (key,) if kind == "{" else path
+                if kind == "[" and path == self.path:
+                    # Elemento del array buscado: se decodifica entero
+                    decoded = self._decode()
+                    if decoded is None:
+                        return items
+                    value, self._pos = decoded
+                    items.append(value)
+                    frame[1] = "comma_or_end"
+                elif c in "{[":
+                    frame[1] = "comma_or_end"
+                    self._open(c, child)
+                else:
+                    decoded = self._decode()
+                    if decoded is None:
+                        return items
+                    self._pos = decoded[1]
+                    frame[1] = "comma_or_end"
+            elif state == "comma_or_end":
+                if c == ",":
+                    frame[1] = "key" if kind == "{" else "value"
+                elif c == ("}" if kind == "{" else "]"):
+                    self._stack.pop()
+                else:
+                    raise ValueError(f"Carácter inesperado {c!r} en la posición {self._pos}")
+                self._pos += 1
+
+    def _open(self, c, path):
+        if c not in "{[":
+            return False
+        # Los contenedores fuera de la ruta también se recorren por estructura
+        # (sin construirlos), para no tener que leerlos enteros de una vez
+        self._stack.append([c, "end_or_first", path, None])
+        self._pos += 1
+        return True
+
+
+def iter_array(chunks, path):
+    """
+    Generador con los elementos del array en `path` a partir de un iterable
+    de trozos. Si el consumidor deja de iterar, no se lee nada más.
+    """
+    stream = ArrayStream(path)
+    for chunk in chunks:
+        yield from stream.feed(chunk)
+    yield from stream.close()
+
+
+async def aiter_array(chunks, path):
+    """
+    Versión asíncrona de `iter_array` (p. ej. sobre `resp.aiter_bytes()`).
+    """
+    stream = ArrayStream(path)
+    async for chunk in chunks:
+        for item in stream.feed(chunk):
+            yield item
+    for item in stream.close():
+        yield item
@@ -0,0 +1,82 @@
+"""
+Elección de líder entre varios procesos del bot que comparten las bases
+locales.
+
+Todos los procesos atienden comandos, pero sólo el líder ejecuta las tareas
+programadas (morosos, alquiler, sondeo) y dispara los recordatorios; si no,
+cada informe saldría tantas veces como procesos haya. El líder es quien
+tiene el cerrojo `flock` del fichero `path`. El sistema lo suelta si el
+proceso muere (incluso con kill -9), y otro lo coge en su siguiente intento.
+
+Sin `fcntl` (Windows) no hay cerrojo: el proceso se considera siempre líder,
+que es lo correcto con un único proceso.
+"""
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+class LeaderLock:
+    def __init__(self, path="bot.lock"):
+        self.path = path
+        self.fd = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self.fd is not None
+
+    def try_acquire(self) -> bool:
+        """
+        Intenta ser líder sin esperar. True si ya lo era o acaba de serlo.
+        """
+        return self._lock(fcntl.LOCK_NB if fcntl is not None else 0)
+
+    def acquire(self) -> None:
+        """
+        Bloquea hasta ser líder (al morir el actual, en el acto).
+        """
+        self._lock(0)
+
+    def _lock(self, flags) -> bool:
+        if self.fd is not None:
+            return True
+        if fcntl is None:
+            self.fd = -1
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | flags)
+        except OSError:
+            # Otro proceso es el líder
+            os.close(fd)
+            return False
+        except BaseException:
+            # Ctrl+C mientras se esperaba
+            os.close(fd)
+            raise
+        # Quién es el líder, para /stats y para quien mire el fichero
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{os.getpid()}\n".encode())
+        self.fd = fd
+        return True
+
+    def holder(self):
+        """
+        PID del líder actual según el fichero (None si no se sabe).
+        """
+        try:
+            with open(self.path) as f:
+                return int(f.read().strip() or 0) or None
+        except (OSError, ValueError):
+            return None
+
+    def release(self) -> None:
+        if self.fd is None:
+            return
+        if self.fd >= 0:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+        self.fd = None
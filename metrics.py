@@ -0,0 +1,234 @@
+"""
+Métricas internas del bot en formato Prometheus.
+
+Contadores, gauges e histogramas mínimos (sin dependencias), un registro
+global `REGISTRY` y un servidor HTTP asíncrono que sirve `/metrics`.
+"""
+import asyncio
+import bisect
+import time
+from functools import wraps
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in sorted(self.values.items()):
+            yield self.name, key, value
+
+
+class Gauge:
+    """
+    Valor que se lee al exportar, con una función sin argumentos que devuelve
+    un número o un dict `{tupla_de_etiquetas: valor}`. Con `kind="counter"`
+    sirve para exportar contadores que ya lleva otro módulo.
+    """
+
+    def __init__(self, name, help_text, read, labelnames=(), kind="gauge"):
+        self.name = name
+        self.help = help_text
+        self.read = read
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+
+    def samples(self):
+        try:
+            value = self.read()
+        except Exception:
+            return
+        if isinstance(value, dict):
+            for key, v in sorted(value.items()):
+                yield self.name, key, v
+        elif value is not None:
+            yield self.name, (), value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.series = {}  # etiquetas -> [cuentas por bucket..., +Inf], suma
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def count(self, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        series = self.series.get(key)
+        return sum(series[0]) if series else 0
+
+    def quantile(self, q, **labels):
+        """
+        Estimación del cuantil `q` (cota superior del bucket que lo contiene).
+        """
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        series = self.series.get(key)
+        if not series:
+            return None
+        counts, total = series[0], sum(series[0])
+        acc = 0
+        for i, c in enumerate(counts):
+            acc += c
+            if acc >= q * total:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def samples(self):
+        for key, (counts, total) in sorted(self.series.items()):
+            acc = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                acc += c
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield self.name + "_bucket", key + (le,), acc
+            yield self.name + "_sum", key, total
+            yield self.name + "_count", key, acc
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self.register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name, help_text, read, labelnames=(), kind="gauge"):
+        return self.register(Gauge(name, help_text, read, labelnames, kind))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for m in self.metrics:
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            for name, key, value in m.samples():
+                labelnames = m.labelnames + (("le",) if name.endswith("_bucket") else ())
+                lines.append(f"{name}{_labels(labelnames, key)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HANDLER_LATENCY = REGISTRY.histogram(
+    "bot_handler_latency_seconds", "Duración de cada handler o tarea programada", ("handler",)
+)
+HANDLER_ERRORS = REGISTRY.counter(
+    "bot_handler_errors_total", "Excepciones no capturadas por handler", ("handler",)
+)
+UPSTREAM_REQUESTS = REGISTRY.counter(
+    "bot_upstream_requests_total",
+    "Peticiones a GoCardless por endpoint, estado y origen (banco o cuota local)",
+    ("endpoint", "status", "origin"),
+)
+UPSTREAM_LATENCY = REGISTRY.histogram(
+    "bot_upstream_latency_seconds", "Latencia de las peticiones a GoCardless", ("endpoint",)
+)
+RATE_LIMITED = REGISTRY.counter(
+    "bot_rate_limited_total", "Respuestas 429 mostradas al usuario vía check_rate_limit"
+)
+UPDATES_DROPPED = REGISTRY.counter(
+    "bot_updates_dropped_total",
+    "Updates descartados antes de llegar a los handlers (sin mención o por exceso de órdenes)",
+    ("reason",),
+)
+OUTBOUND_MESSAGES = REGISTRY.counter(
+    "bot_outbound_messages_total",
+    "Mensajes de la cola de salida por resultado (enviado, fusionado, reintento, descartado)",
+    ("result",),
+)
+REMINDER_LAG = REGISTRY.histogram(
+    "bot_reminder_lag_seconds", "Retraso entre la hora de un recordatorio y su envío",
+    buckets=(0.1, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 300.0),
+)
+
+
+def timed(func):
+    """
+    Decorador para handlers y tareas: mide su duración y cuenta excepciones,
+    etiquetado con el nombre de la función.
+    """
+    name = func.__name__
+
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        except Exception:
+            HANDLER_ERRORS.inc(handler=name)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - t0, handler=name)
+
+    return wrapper
+
+
+async def _serve(reader, writer, registry):
+    try:
+        request_line = await reader.readline()
+        # Consumimos las cabeceras
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.decode(errors="replace").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            body = registry.render().encode()
+            status = "200 OK"
+            ctype = "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            body, status, ctype = b"Not found\n", "404 Not Found", "text/plain"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {ctype}\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_metrics_server(host, port, registry=REGISTRY):
+    """
+    Arranca el servidor HTTP de `/metrics`. Devuelve el `asyncio.Server`.
+    """
+    return await asyncio.start_server(
+        lambda r, w: _serve(r, w, registry), host=host, port=port
+    )
@@ -0,0 +1,251 @@
+"""
+Cola de salida para los mensajes que el bot envía por su cuenta
+(recordatorios, informes programados y avisos).
+
+Telegram limita los envíos: más o menos un mensaje por segundo a un mismo
+chat, unos 20 por minuto a un grupo y unos 30 por segundo en total. Si se
+pasan, responde RetryAfter y el mensaje se pierde si nadie lo reintenta.
+`Outbox` los envía desde una única tarea:
+
+- por chat, un mensaje en vuelo y un mínimo de tiempo entre envíos;
+- en total, como mucho `global_rate` envíos por segundo;
+- con RetryAfter se pausa ese chat lo que diga Telegram y se reintenta;
+- con errores de red, se reintenta esperando el doble cada vez (hasta
+  `max_backoff`), sin descartar el mensaje;
+- lo que se acumula para un mismo chat con el mismo formato se fusiona en un
+  solo mensaje (hasta 4096 caracteres), p. ej. varios recordatorios del mismo
+  minuto.
+
+Sólo se descartan los errores que no se arreglan reintentando (chat que no
+existe, bot expulsado). Un Markdown mal formado se reenvía sin formato.
+"""
+import asyncio
+import random
+import time
+from collections import deque
+from datetime import timedelta
+
+from telegram.error import BadRequest, ChatMigrated, Forbidden, RetryAfter
+
+from metrics import OUTBOUND_MESSAGES
+
+MAX_LENGTH = 4096
+# Segundos entre dos envíos al mismo chat (privado / grupo)
+PRIVATE_INTERVAL = 1.0
+GROUP_INTERVAL = 3.0
+# Envíos por segundo en total
+GLOBAL_RATE = 25
+# Lo que espera un mensaje por si llegan más para el mismo chat
+MERGE_WINDOW = 0.5
+
+
+def split_text(text, limit=MAX_LENGTH):
+    """
+    Trocea `text` en partes de como mucho `limit` caracteres, por saltos de
+    línea cuando se puede.
+    """
+    parts = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = limit
+        parts.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    parts.append(text)
+    return parts
+
+
+def _seconds(value):
+    return value.total_seconds() if isinstance(value, timedelta) else float(value)
+
+
+class Outgoing:
+    __slots__ = ("text", "parse_mode", "enqueued", "parts")
+
+    def __init__(self, text, parse_mode, enqueued):
+        self.text = text
+        self.parse_mode = parse_mode
+        self.enqueued = enqueued
+        self.parts = 1          # mensajes originales fusionados en éste
+
+
+class Outbox:
+    def __init__(self, global_rate=GLOBAL_RATE, private_interval=PRIVATE_INTERVAL,
+                 group_interval=GROUP_INTERVAL, merge_window=MERGE_WINDOW,
+                 backoff=1.0, max_backoff=300.0):
+        self.global_rate = global_rate
+        self.private_interval = private_interval
+        self.group_interval = group_interval
+        self.merge_window = merge_window
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.bot = None
+        self.queues = {}        # chat_id -> deque de Outgoing pendientes
+        self.not_before = {}    # chat_id -> instante (monotonic) desde el que se puede enviar
+        self.failures = {}      # chat_id -> errores de red seguidos
+        self.inflight = set()   # chats con un envío en curso
+        self._next_slot = 0.0
+        self._task = None
+        self._sending = set()
+        self._wakeup = None
+        self._idle = None
+
+    def __len__(self):
+        return sum(len(q) for q in self.queues.values()) + len(self.inflight)
+
+    def start(self, bot) -> None:
+        """
+        Arranca la tarea de envío (dentro del bucle de eventos del bot).
+        """
+        self.bot = bot
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()
+        if not self.queues:
+            self._idle.set()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout=10.0) -> None:
+        """
+        Espera como mucho `timeout` segundos a que se vacíe la cola y para.
+        """
+        if self._task is None:
+            return
+        if not await self.flush(timeout):
+            print(f"Cola de salida: se apaga con {len(self)} mensajes sin enviar")
+        self._task.cancel()
+        for task in list(self._sending):
+            task.cancel()
+        await asyncio.gather(self._task, *self._sending, return_exceptions=True)
+        self._task = None
+
+    async def flush(self, timeout=None) -> bool:
+        """
+        Espera a que no quede nada pendiente. False si se agota `timeout`.
+        """
+        if self._idle is None:
+            return not self.queues
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def send(self, chat_id, text, parse_mode=None) -> None:
+        """
+        Encola un mensaje para `chat_id`; no espera a que se envíe.
+        """
+        now = time.monotonic()
+        queue = self.queues.setdefault(chat_id, deque())
+        for part in split_text(text):
+            queue.append(Outgoing(part, parse_mode, now))
+        if self._idle is not None:
+            self._idle.clear()
+            self._wakeup.set()
+
+    def _interval(self, chat_id):
+        # Los grupos y canales tienen id negativo
+        return self.group_interval if chat_id < 0 else self.private_interval
+
+    def _merge(self, queue):
+        """
+        Saca de `queue` el primer mensaje junto con los siguientes que
+        quepan con él (mismo formato, hasta MAX_LENGTH).
+        """
+        msg = queue.popleft()
+        while queue and queue[0].parse_mode == msg.parse_mode and \
+                len(msg.text) + 2 + len(queue[0].text) <= MAX_LENGTH:
+            nxt = queue.popleft()
+            msg.text += "\n\n" + nxt.text
+            msg.parts += nxt.parts
+        return msg
+
+    async def _run(self):
+        while True:
+            try:
+                wait = self._dispatch()
+            except Exception as e:
+                # Un fallo aquí no debe parar la cola: se reintenta en un momento
+                print(f"Cola de salida: error repartiendo envíos: {e!r}")
+                wait = 1.0
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def _dispatch(self):
+        """
+        Lanza el envío de cada chat que ya puede enviar y devuelve cuánto
+        esperar hasta el siguiente (None si no hay nada pendiente).
+        """
+        now = time.monotonic()
+        wait = None
+        # El chat que lleva más tiempo esperando, primero. Un chat con un envío
+        # en vuelo puede tener la cola vacía (lo pendiente se fusionó en él)
+        pending = sorted(
+            ((chat_id, queue) for chat_id, queue in self.queues.items()
+             if queue and chat_id not in self.inflight),
+            key=lambda item: item[1][0].enqueued,
+        )
+        for chat_id, queue in pending:
+            ready = max(self.not_before.get(chat_id, 0.0), queue[0].enqueued + self.merge_window)
+            if ready <= now and self._next_slot > now:
+                ready = self._next_slot
+            if ready > now:
+                wait = ready - now if wait is None else min(wait, ready - now)
+                continue
+            self._next_slot = max(self._next_slot, now) + 1 / self.global_rate
+            self.inflight.add(chat_id)
+            task = asyncio.create_task(self._deliver(chat_id, self._merge(queue)))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+        return wait
+
+    def _retry(self, chat_id, msg, delay):
+        self.queues.setdefault(chat_id, deque()).appendleft(msg)
+        self.not_before[chat_id] = time.monotonic() + delay
+        OUTBOUND_MESSAGES.inc(result="reintento")
+
+    async def _deliver(self, chat_id, msg):
+        try:
+            await self.bot.send_message(chat_id, msg.text, parse_mode=msg.parse_mode)
+        except RetryAfter as e:
+            self._retry(chat_id, msg, _seconds(e.retry_after))
+        except ChatMigrated as e:
+            # El grupo pasó a supergrupo: lo pendiente va al chat nuevo
+            queue = self.queues.pop(chat_id, deque())
+            queue.appendleft(msg)
+            self.queues.setdefault(e.new_chat_id, deque()).extend(queue)
+        except Forbidden as e:
+            print(f"Cola de salida: descartado un mensaje a {chat_id}: {e}")
+            OUTBOUND_MESSAGES.inc(msg.parts, result="descartado")
+        except BadRequest as e:
+            if msg.parse_mode is not None:
+                print(f"Cola de salida: Markdown no válido para {chat_id} ({e}), se reenvía sin formato")
+                msg.parse_mode = None
+                self._retry(chat_id, msg, 0.0)
+            else:
+                print(f"Cola de salida: descartado un mensaje a {chat_id}: {e}")
+                OUTBOUND_MESSAGES.inc(msg.parts, result="descartado")
+        except Exception as e:
+            # Red, timeouts o 5xx de Telegram: se reintenta con espera creciente
+            n = self.failures[chat_id] = self.failures.get(chat_id, 0) + 1
+            delay = min(self.max_backoff, self.backoff * 2 ** (n - 1)) * random.uniform(0.5, 1.0)
+            print(f"Cola de salida: error enviando a {chat_id} ({e}), reintento en {delay:.1f} s")
+            self._retry(chat_id, msg, delay)
+        else:
+            self.failures.pop(chat_id, None)
+            self.not_before[chat_id] = time.monotonic() + self._interval(chat_id)
+            OUTBOUND_MESSAGES.inc(result="enviado")
+            if msg.parts > 1:
+                OUTBOUND_MESSAGES.inc(msg.parts - 1, result="fusionado")
+        finally:
+            self.inflight.discard(chat_id)
+            if chat_id in self.queues and not self.queues[chat_id]:
+                del self.queues[chat_id]
+            if not self.queues and not self.inflight:
+                self._idle.set()
+                # Sin nada pendiente no hace falta recordar pausas ya pasadas
+                now = time.monotonic()
+                self.not_before = {k: t for k, t in self.not_before.items() if t > now}
+            self._wakeup.set()
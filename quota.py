@@ -0,0 +1,271 @@
+"""
+Gestión centralizada de la cuota de GoCardless.
+
+GoCardless limita las peticiones por cuenta y endpoint (balances, details,
+transactions) y lo anuncia en las cabeceras `HTTP_X_RATELIMIT_*`. Aquí se
+lleva la cuenta de lo que queda, se rechaza el trabajo interactivo antes de
+provocar un 429 (reservando cupo para las tareas programadas) y se da
+prioridad a éstas cuando hay cola.
+
+Con varios procesos, `SharedQuota` guarda la cuenta en SQLite (la misma base
+que `cache.SharedResponses`): lo que gasta uno lo ven los demás, y el que
+toma el relevo como líder no empieza creyendo que le queda la cuota entera.
+"""
+import asyncio
+import heapq
+import itertools
+import re
+import sqlite3
+import time
+from urllib.parse import urlparse
+
+# Prioridades: menor número = se atiende antes
+PRIORITY_SCHEDULED = 0
+PRIORITY_INTERACTIVE = 1
+
+# Cabeceras de GoCardless (con y sin el prefijo HTTP_ que a veces añaden)
+LIMIT_HEADERS = ("http_x_ratelimit_account_success_limit", "x-ratelimit-account-success-limit")
+REMAINING_HEADERS = ("http_x_ratelimit_account_success_remaining", "x-ratelimit-account-success-remaining")
+RESET_HEADERS = ("http_x_ratelimit_account_success_reset", "x-ratelimit-account-success-reset")
+
+
+def endpoint_key(url):
+    """
+    (account_id, endpoint) a partir de una URL del tipo
+    `.../accounts/<id>/transactions/`.
+    """
+    parts = urlparse(url).path.strip("/").split("/")
+    endpoint = parts[-1] if parts else ""
+    account = parts[-2] if len(parts) >= 2 else ""
+    return account, endpoint
+
+
+def _header(headers, names):
+    for name in names:
+        value = headers.get(name)
+        if value is not None:
+            try:
+                return int(value)
+            except ValueError:
+                return None
+    return None
+
+
+def retry_after_seconds(resp) -> int:
+    """
+    Segundos de espera de un 429, del `detail` del cuerpo o de Retry-After.
+    """
+    try:
+        detail = resp.json().get("detail", "")
+        m = re.search(r"(\d+)\s*seconds", detail)
+        if m:
+            return int(m.group(1))
+    except Exception:
+        pass
+    try:
+        return int(resp.headers.get("Retry-After", 0))
+    except ValueError:
+        return 0
+
+
+class EndpointQuota:
+    __slots__ = ("limit", "remaining", "reset_at")
+
+    def __init__(self):
+        self.limit = None
+        self.remaining = None   # None = aún no sabemos nada
+        self.reset_at = 0.0
+
+    def refresh(self, now):
+        # Pasado el reset, volvemos a no saber: la siguiente respuesta lo dirá
+        if self.reset_at and now >= self.reset_at:
+            self.remaining = None
+            self.reset_at = 0.0
+
+
+class SharedQuota:
+    def __init__(self, path="cache.db"):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS quotas ("
+            "account TEXT NOT NULL, endpoint TEXT NOT NULL, quota_limit INTEGER, "
+            "remaining INTEGER, reset_at REAL NOT NULL, PRIMARY KEY (account, endpoint))"
+        )
+
+    def load(self, key, q):
+        """
+        Copia en `q` lo guardado para `key` (si hay algo).
+        """
+        row = self.conn.execute(
+            "SELECT quota_limit, remaining, reset_at FROM quotas WHERE account = ? AND endpoint = ?",
+            key,
+        ).fetchone()
+        if row is not None:
+            q.limit, q.remaining, q.reset_at = row
+
+    def save(self, key, q):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO quotas (account, endpoint, quota_limit, remaining, reset_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (*key, q.limit, q.remaining, q.reset_at),
+            )
+
+    def spend(self, key):
+        """
+        Descuenta una petición en la base, sobre lo que haya escrito
+        cualquier proceso (no sobre la copia local).
+        """
+        with self.conn:
+            self.conn.execute(
+                "UPDATE quotas SET remaining = remaining - 1 "
+                "WHERE account = ? AND endpoint = ? AND remaining IS NOT NULL",
+                key,
+            )
+
+    def close(self):
+        self.conn.close()
+
+
+class QuotaExceeded(Exception):
+    def __init__(self, key, retry_after):
+        super().__init__(f"Cuota agotada para {key[1]} ({retry_after}s)")
+        self.key = key
+        self.retry_after = retry_after
+
+
+class QuotaManager:
+    def __init__(self, reserve=1, max_in_flight=4, max_queue_wait=60, shared=None):
+        self.reserve = reserve                # peticiones reservadas a tareas programadas
+        self.max_in_flight = max_in_flight    # peticiones simultáneas al banco
+        self.max_queue_wait = max_queue_wait  # segundos que una tarea programada espera al reset
+        self.shared = shared                  # SharedQuota entre procesos (o None)
+        self.quotas = {}
+        self._in_flight = {}   # clave de petición -> Future compartido
+        self._active = 0
+        self._waiters = []     # heap (prioridad, orden, Future)
+        self._seq = itertools.count()
+
+    def quota(self, key) -> EndpointQuota:
+        q = self.quotas.get(key)
+        if q is None:
+            q = self.quotas[key] = EndpointQuota()
+        if self.shared is not None:
+            # Quizá otro proceso ha gastado (o sabe más) desde la última vez
+            self.shared.load(key, q)
+        return q
+
+    # --- Contabilidad ---
+
+    def check(self, key, priority):
+        """
+        Devuelve 0 si se puede pedir ya, o los segundos hasta el reset si no
+        queda cupo para esta prioridad.
+        """
+        now = time.time()
+        q = self.quota(key)
+        q.refresh(now)
+        if q.remaining is None:
+            return 0
+        reserve = self.reserve if priority != PRIORITY_SCHEDULED else 0
+        if q.remaining - reserve > 0:
+            return 0
+        return max(1, int(q.reset_at - now)) if q.reset_at else 1
+
+    def update(self, key, resp):
+        """
+        Actualiza la cuota con las cabeceras de una respuesta del banco.
+        """
+        q = self.quota(key)
+        headers = {k.lower(): v for k, v in resp.headers.items()}
+        limit = _header(headers, LIMIT_HEADERS)
+        remaining = _header(headers, REMAINING_HEADERS)
+        reset = _header(headers, RESET_HEADERS)
+        if limit is not None:
+            q.limit = limit
+        if remaining is not None:
+            q.remaining = remaining
+        if reset is not None:
+            q.reset_at = time.time() + reset
+        if resp.status_code == 429:
+            q.remaining = 0
+            q.reset_at = time.time() + max(1, retry_after_seconds(resp))
+        if self.shared is not None:
+            self.shared.save(key, q)
+
+    # --- Cola con prioridad ---
+
+    async def _acquire(self, priority):
+        if self._active < self.max_in_flight and not self._waiters:
+            self._active += 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self._release()
+            raise
+
+    def _release(self):
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self._active -= 1
+
+    # --- Punto de entrada ---
+
+    async def run(self, url, params, priority, fetch, coalesce=True):
+        """
+        Ejecuta `fetch()` respetando la cuota del endpoint. Las peticiones
+        idénticas en curso se agrupan en una sola llamada al banco (salvo con
+        `coalesce=False`, p. ej. si el cuerpo se lee en streaming y no se
+        puede compartir).
+        """
+        key = endpoint_key(url)
+        flight_key = (url, tuple(sorted((params or {}).items())))
+        if not coalesce:
+            flight_key += (object(),)
+        pending = self._in_flight.get(flight_key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        wait = self.check(key, priority)
+        if wait and priority == PRIORITY_SCHEDULED and wait <= self.max_queue_wait:
+            await asyncio.sleep(wait)
+            wait = self.check(key, priority)
+        if wait:
+            raise QuotaExceeded(key, wait)
+        # Descontamos ya para que las peticiones concurrentes lo vean
+        q = self.quota(key)
+        if q.remaining is not None:
+            q.remaining -= 1
+            if self.shared is not None:
+                self.shared.spend(key)
+
+        fut = asyncio.get_running_loop().create_future()
+        self._in_flight[flight_key] = fut
+        try:
+            await self._acquire(priority)
+            try:
+                resp = await fetch()
+            finally:
+                self._release()
+            self.update(key, resp)
+            fut.set_result(resp)
+            return resp
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except Exception as e:
+            fut.set_exception(e)
+            # Evita el aviso de "excepción nunca recuperada" si nadie más esperaba
+            fut.exception()
+            raise
+        finally:
+            self._in_flight.pop(flight_key, None)
@@ -0,0 +1,99 @@
+"""
+Reglas de repetición para los recordatorios recurrentes.
+
+Cada regla sólo sabe calcular la siguiente ocurrencia a partir de la actual;
+nunca se generan ocurrencias por adelantado. Se guardan como texto corto
+(`cada:3`, `mensual:5`) junto al recordatorio.
+"""
+import calendar
+from datetime import datetime, timedelta
+
+
+class EveryNDays:
+    def __init__(self, days):
+        if days < 1:
+            raise ValueError("El intervalo debe ser de al menos un día")
+        self.days = days
+
+    def first(self, hour, minute, now):
+        dt = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        return dt if dt > now else dt + timedelta(days=1)
+
+    def next_after(self, current, now=None):
+        """
+        Siguiente ocurrencia posterior a `current` (y a `now`, si se da:
+        las ocurrencias perdidas con el bot parado no se repiten).
+        """
+        step = timedelta(days=self.days)
+        nxt = current + step
+        if now is not None and nxt <= now:
+            saltos = (now - current) // step + 1
+            nxt = current + saltos * step
+        return nxt
+
+    def to_str(self):
+        return f"cada:{self.days}"
+
+    def describe(self):
+        return "cada día" if self.days == 1 else f"cada {self.days} días"
+
+
+class MonthlyOnDay:
+    def __init__(self, day):
+        if not 1 <= day <= 31:
+            raise ValueError("El día del mes debe estar entre 1 y 31")
+        self.day = day
+
+    def _on_month(self, year, month, hour, minute):
+        # En meses más cortos se usa el último día (p. ej. el 31 en febrero)
+        day = min(self.day, calendar.monthrange(year, month)[1])
+        return datetime(year, month, day, hour, minute)
+
+    def first(self, hour, minute, now):
+        dt = self._on_month(now.year, now.month, hour, minute)
+        return dt if dt > now else self.next_after(dt)
+
+    def next_after(self, current, now=None):
+        year, month = current.year, current.month
+        while True:
+            month += 1
+            if month > 12:
+                year, month = year + 1, 1
+            nxt = self._on_month(year, month, current.hour, current.minute)
+            if now is None or nxt > now:
+                return nxt
+
+    def to_str(self):
+        return f"mensual:{self.day}"
+
+    def describe(self):
+        return f"cada mes el día {self.day}"
+
+
+def parse_rule(text):
+    """
+    Regla a partir de su forma guardada (`cada:3`, `mensual:5`).
+    """
+    kind, _, value = text.partition(":")
+    if kind == "cada":
+        return EveryNDays(int(value))
+    if kind == "mensual":
+        return MonthlyOnDay(int(value))
+    raise ValueError(f"Regla desconocida: {text}")
+
+
+def parse_rule_args(args):
+    """
+    Regla a partir de los argumentos del comando: `mensual <día>` o
+    `cada <n>` (días). Devuelve `(regla, argumentos_restantes)`.
+    """
+    kind = args[0].lower()
+    if kind == "mensual":
+        return MonthlyOnDay(int(args[1])), args[2:]
+    if kind == "cada":
+        return EveryNDays(int(args[1])), args[2:]
+    if kind in ("diario", "diaria"):
+        return EveryNDays(1), args[1:]
+    if kind in ("semanal", "semanalmente"):
+        return EveryNDays(7), args[1:]
+    raise ValueError(f"Regla desconocida: {args[0]}")
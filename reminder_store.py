@@ -0,0 +1,174 @@
+"""
+Persistencia de recordatorios en SQLite (modo WAL).
+
+Cada alta o baja es una única fila escrita en el journal de SQLite, así que
+el coste no depende de cuántos recordatorios haya y un corte a mitad de
+escritura no pierde el resto. La compactación periódica vuelca el WAL a la
+base y libera las páginas borradas.
+
+Varios procesos del bot pueden compartir la misma base: los ids los asigna
+SQLite (AUTOINCREMENT, así que no se reutilizan) y `data_version` dice si
+otro proceso ha escrito desde la última vez.
+"""
+import json
+import os
+import sqlite3
+from datetime import datetime
+
+TABLE = """
+CREATE TABLE IF NOT EXISTS {name} (
+    id       INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id  INTEGER NOT NULL,
+    run_at   TEXT NOT NULL,
+    message  TEXT NOT NULL,
+    rule     TEXT
+);
+"""
+
+
+def naive_local(dt: datetime) -> datetime:
+    """
+    Normaliza a datetime naive en hora local.
+    """
+    if dt.tzinfo is not None:
+        dt = dt.astimezone().replace(tzinfo=None)
+    return dt
+
+
+class ReminderStore:
+    def __init__(self, path="reminders.db"):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # En WAL, NORMAL ya es seguro ante caídas del proceso
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self._migrate()
+
+    def _migrate(self):
+        row = self.conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'reminders'"
+        ).fetchone()
+        if row is None:
+            self.conn.executescript(TABLE.format(name="reminders"))
+            return
+        if "AUTOINCREMENT" in row[0]:
+            return
+        # Bases anteriores: ids sin AUTOINCREMENT (y quizá sin `rule`). Se
+        # rehace la tabla para que un id borrado no se vuelva a dar a otro
+        columns = {r[1] for r in self.conn.execute("PRAGMA table_info(reminders)")}
+        rule = "rule" if "rule" in columns else "NULL"
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.execute(TABLE.format(name="reminders_new"))
+            self.conn.execute(
+                "INSERT INTO reminders_new (id, chat_id, run_at, message, rule) "
+                f"SELECT id, chat_id, run_at, message, {rule} FROM reminders"
+            )
+            self.conn.execute("DROP TABLE reminders")
+            self.conn.execute("ALTER TABLE reminders_new RENAME TO reminders")
+
+    def add(self, rid, chat_id, run_at, message, rule=None) -> int:
+        """
+        `rule` es la regla de repetición en texto (`cada:3`, `mensual:5`) o
+        None para un recordatorio de una sola vez. Con `rid=None` el id lo
+        asigna la base. Devuelve el id.
+        """
+        with self.conn:
+            cur = self.conn.execute(
+                "INSERT OR REPLACE INTO reminders (id, chat_id, run_at, message, rule) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (rid, chat_id, naive_local(run_at).isoformat(), message, rule),
+            )
+        return cur.lastrowid
+
+    def reschedule(self, rid, run_at):
+        """
+        Mueve un recordatorio recurrente a su siguiente ocurrencia.
+        """
+        with self.conn:
+            self.conn.execute(
+                "UPDATE reminders SET run_at = ? WHERE id = ?",
+                (naive_local(run_at).isoformat(), rid),
+            )
+
+    def remove(self, rid):
+        with self.conn:
+            self.conn.execute("DELETE FROM reminders WHERE id = ?", (rid,))
+
+    def remove_before(self, moment):
+        """
+        Borra los recordatorios de una sola vez que ya deberían haber saltado.
+        """
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM reminders WHERE rule IS NULL AND run_at <= ?",
+                (naive_local(moment).isoformat(),),
+            )
+
+    def load(self):
+        """
+        Lista de dicts `{id, chat_id, run_at, message, rule}` ordenada por id.
+        """
+        rows = self.conn.execute(
+            "SELECT id, chat_id, run_at, message, rule FROM reminders ORDER BY id"
+        )
+        items = []
+        for rid, chat_id, run_at, message, rule in rows:
+            try:
+                run_at = datetime.fromisoformat(run_at)
+            except ValueError:
+                continue
+            items.append({
+                "id": rid, "chat_id": chat_id, "run_at": run_at,
+                "message": message, "rule": rule,
+            })
+        return items
+
+    def count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM reminders").fetchone()[0]
+
+    def data_version(self) -> int:
+        """
+        Cambia cuando otra conexión (otro proceso) escribe en la base; las
+        escrituras propias no lo mueven.
+        """
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def compact(self):
+        """
+        Vuelca el WAL a la base principal y recorta el fichero de journal.
+        """
+        self.conn.execute("PRAGMA incremental_vacuum")
+        self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def import_json(self, json_path) -> int:
+        """
+        Migra el antiguo `reminders.json` (si existe y es válido) y lo
+        renombra para no importarlo dos veces. Devuelve cuántos importó.
+        """
+        if not os.path.exists(json_path):
+            return 0
+        try:
+            with open(json_path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        imported = 0
+        with self.conn:
+            for item in data:
+                try:
+                    run_at = naive_local(datetime.fromisoformat(item["datetime"]))
+                    self.conn.execute(
+                        "INSERT OR IGNORE INTO reminders (id, chat_id, run_at, message) "
+                        "VALUES (?, ?, ?, ?)",
+                        (item["id"], item["chat_id"], run_at.isoformat(), item.get("message", "")),
+                    )
+                    imported += 1
+                except (KeyError, TypeError, ValueError):
+                    continue
+        os.replace(json_path, json_path + ".migrated")
+        return imported
+
+    def close(self):
+        self.conn.close()
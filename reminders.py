@@ -0,0 +1,179 @@
+"""
+Motor de recordatorios.
+
+Mantiene en memoria los recordatorios pendientes indexados por id y por chat,
+y un montículo ordenado por hora de disparo. Así basta con un único
+temporizador (el del más próximo) en vez de un job de APScheduler por
+recordatorio, y cargar miles al arrancar es sólo un `heapify`. Los
+recurrentes sólo tienen programada su siguiente ocurrencia; al dispararse
+se calcula la próxima.
+
+Si otro proceso comparte la base, `refresh` vuelve a cargar el índice cuando
+ha escrito algo desde la última carga.
+"""
+import heapq
+import itertools
+from collections import defaultdict
+
+from recurrence import parse_rule
+
+
+class Reminder:
+    __slots__ = ("id", "chat_id", "run_at", "message", "rule")
+
+    def __init__(self, rid, chat_id, run_at, message, rule=None):
+        self.id = rid
+        self.chat_id = chat_id
+        self.run_at = run_at
+        self.message = message
+        self.rule = rule  # None = de una sola vez
+
+
+class ReminderLimitError(Exception):
+    pass
+
+
+class ReminderEngine:
+    def __init__(self, store, max_per_chat=15):
+        self.store = store
+        self.max_per_chat = max_per_chat
+        self.items = {}                  # id -> Reminder
+        self.by_chat = defaultdict(set)  # chat_id -> {id}
+        self._heap = []                  # (run_at, orden, id); las bajas se limpian al sacar
+        self._seq = itertools.count()
+        self._version = None             # data_version de la base en la última carga
+
+    def __len__(self):
+        return len(self.items)
+
+    # --- Carga ---
+
+    def load(self, now, prune=True):
+        """
+        Carga de golpe todo lo persistido. Con `prune`, descarta lo ya
+        vencido (lo que pasó con el bot parado); sin él, lo vencido se queda
+        para que lo saque `pop_due`.
+        """
+        if prune:
+            self.store.remove_before(now)
+        self.items.clear()
+        self.by_chat.clear()
+        self._heap = []
+        self._version = self.store.data_version()
+        for item in self.store.load():
+            rule = None
+            if item["rule"]:
+                try:
+                    rule = parse_rule(item["rule"])
+                except ValueError:
+                    continue
+            r = Reminder(item["id"], item["chat_id"], item["run_at"], item["message"], rule)
+            if prune and rule is not None and r.run_at <= now:
+                # Ocurrencias perdidas con el bot parado: se salta a la siguiente
+                r.run_at = rule.next_after(r.run_at, now)
+                self.store.reschedule(r.id, r.run_at)
+            self.items[r.id] = r
+            self.by_chat[r.chat_id].add(r.id)
+            self._heap.append((r.run_at, next(self._seq), r.id))
+        heapq.heapify(self._heap)
+
+    def refresh(self, now) -> bool:
+        """
+        Recarga si otro proceso ha escrito en la base. Devuelve True si recargó.
+        """
+        if self.store.data_version() == self._version:
+            return False
+        self.load(now, prune=False)
+        return True
+
+    # --- Altas y bajas ---
+
+    def add(self, chat_id, run_at, message, rule=None) -> Reminder:
+        if len(self.by_chat.get(chat_id, ())) >= self.max_per_chat:
+            raise ReminderLimitError(chat_id)
+        rid = self.store.add(None, chat_id, run_at, message, rule.to_str() if rule else None)
+        r = Reminder(rid, chat_id, run_at, message, rule)
+        self._insert(r)
+        return r
+
+    def _insert(self, r):
+        self.items[r.id] = r
+        self.by_chat[r.chat_id].add(r.id)
+        heapq.heappush(self._heap, (r.run_at, next(self._seq), r.id))
+
+    def remove(self, rid):
+        r = self.items.pop(rid, None)
+        if r is None:
+            return None
+        self._forget_chat(r)
+        self.store.remove(rid)
+        self._maybe_compact_heap()
+        return r
+
+    def _forget_chat(self, r):
+        ids = self.by_chat.get(r.chat_id)
+        if ids is not None:
+            ids.discard(r.id)
+            if not ids:
+                del self.by_chat[r.chat_id]
+
+    def _maybe_compact_heap(self):
+        # Si el montículo acumula demasiadas bajas, se reconstruye
+        if len(self._heap) > 64 and len(self._heap) > 2 * len(self.items):
+            self._heap = [e for e in self._heap if self._live(e)]
+            heapq.heapify(self._heap)
+
+    def _live(self, entry):
+        run_at, _, rid = entry
+        r = self.items.get(rid)
+        return r is not None and r.run_at == run_at
+
+    # --- Consultas ---
+
+    def get(self, rid):
+        return self.items.get(rid)
+
+    def count_for_chat(self, chat_id) -> int:
+        return len(self.by_chat.get(chat_id, ()))
+
+    def for_chat(self, chat_id, offset=0, limit=None):
+        """
+        Recordatorios del chat, del más próximo al más lejano. Con `limit`
+        sólo se ordena lo necesario para devolver esa página.
+        """
+        items = (self.items[rid] for rid in self.by_chat.get(chat_id, ()))
+        key = lambda r: (r.run_at, r.id)
+        if limit is None:
+            return sorted(items, key=key)[offset:]
+        return heapq.nsmallest(offset + limit, items, key=key)[offset:]
+
+    def next_run_at(self):
+        while self._heap and not self._live(self._heap[0]):
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    # --- Disparo ---
+
+    def pop_due(self, now):
+        """
+        Saca todos los recordatorios vencidos a `now`. Los de una sola vez se
+        borran de la base; los recurrentes se reprograman a su siguiente
+        ocurrencia. Devuelve `(id, chat_id, mensaje, hora_prevista)` de cada
+        uno.
+        """
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            entry = heapq.heappop(self._heap)
+            if not self._live(entry):
+                continue
+            r = self.items[entry[2]]
+            due.append((r.id, r.chat_id, r.message, r.run_at))
+            if r.rule is None:
+                del self.items[r.id]
+                self._forget_chat(r)
+                self.store.remove(r.id)
+            else:
+                r.run_at = r.rule.next_after(r.run_at, now)
+                self.store.reschedule(r.id, r.run_at)
+                heapq.heappush(self._heap, (r.run_at, next(self._seq), r.id))
+        return due
@@ -0,0 +1,135 @@
+"""
+Quién ha pagado: emparejamiento de transacciones con compañeros de piso.
+
+Los compañeros se leen de un fichero JSON (ver `roommates.example.json`):
+cada uno con sus alias (tal y como aparecen en el `debtorName` del banco),
+el importe que debe pagar y una tolerancia, ambos en euros.
+
+Los nombres se normalizan (sin tildes, mayúsculas, sólo letras y números) y
+se buscan en un índice de alias por palabras. El resultado se memoriza por
+nombre de contrapartida, así que cada nombre distinto se resuelve una sola
+vez aunque aparezca en miles de transacciones.
+"""
+import json
+import os
+import re
+import unicodedata
+from bisect import bisect_right
+from collections import defaultdict
+
+from transaction import format_cents, parse_cents
+
+_NO_ALNUM = re.compile(r"[^A-Z0-9]+")
+
+# Configuración por defecto (la que el bot tenía fija en el código)
+DEFAULT_ROOMMATES = [
+    {"name": "Marco", "aliases": ["MARCO"], "amount": 200, "tolerance": 0},
+    {"name": "Alejandro", "aliases": ["ALEJANDRO"], "amount": 200, "tolerance": 0},
+    {"name": "Luis Miguel", "aliases": ["LUIS MIGUEL"], "amount": 200, "tolerance": 0},
+]
+
+
+def normalize(text) -> tuple:
+    """
+    Palabras de un nombre sin tildes ni mayúsculas: "Luis Miguel Gómez" ->
+    ("LUIS", "MIGUEL", "GOMEZ").
+    """
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c)).upper()
+    return tuple(_NO_ALNUM.sub(" ", text).split())
+
+
+class Roommate:
+    __slots__ = ("name", "aliases", "amount", "tolerance")
+
+    def __init__(self, name, aliases=(), amount=0, tolerance=0):
+        self.name = name
+        self.aliases = [normalize(a) for a in (aliases or [name])]
+        self.amount = parse_cents(amount)        # céntimos
+        self.tolerance = parse_cents(tolerance)  # céntimos
+
+    @property
+    def minimum(self) -> int:
+        return self.amount - self.tolerance
+
+    def describe_amount(self) -> str:
+        return f"{format_cents(self.amount)} €"
+
+
+def load_roommates(path):
+    """
+    Lee los compañeros de `path` o, si no existe, usa DEFAULT_ROOMMATES.
+    """
+    data = DEFAULT_ROOMMATES
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)["roommates"]
+    return [
+        Roommate(r["name"], r.get("aliases"), r.get("amount", 0), r.get("tolerance", 0))
+        for r in data
+    ]
+
+
+class PaymentMatcher:
+    def __init__(self, roommates):
+        self.roommates = list(roommates)
+        # Alias normalizado (tupla de palabras) -> compañero
+        self.index = {}
+        for r in self.roommates:
+            for alias in r.aliases:
+                self.index.setdefault(alias, r)
+        self.max_words = max((len(a) for a in self.index), default=0)
+        self._cache = {}   # nombre del banco -> compañero o None
+
+    def match(self, name):
+        """
+        Compañero al que corresponde un nombre de contrapartida, o None. Gana
+        el alias más largo ("LUIS MIGUEL" antes que "MIGUEL").
+        """
+        try:
+            return self._cache[name]
+        except KeyError:
+            pass
+        words = normalize(name)
+        found = None
+        for size in range(min(self.max_words, len(words)), 0, -1):
+            for i in range(len(words) - size + 1):
+                found = self.index.get(words[i:i + size])
+                if found is not None:
+                    break
+            if found is not None:
+                break
+        self._cache[name] = found
+        return found
+
+    def evaluate(self, txs, periods):
+        """
+        Suma lo que ha ingresado cada compañero en cada periodo, en una sola
+        pasada. `periods` es una lista de (desde, hasta) en ordinales de
+        fecha, ambos incluidos y sin solaparse. Devuelve, por periodo, un
+        dict {compañero: céntimos}.
+        """
+        order = sorted(range(len(periods)), key=lambda i: periods[i][0])
+        starts = [periods[i][0] for i in order]
+        totals = [defaultdict(int) for _ in periods]
+        for tx in txs:
+            if tx.amount <= 0 or not tx.debtor:
+                continue
+            pos = bisect_right(starts, tx.booked) - 1
+            if pos < 0:
+                continue
+            i = order[pos]
+            if tx.booked > periods[i][1]:
+                continue
+            r = self.match(tx.debtor)
+            if r is not None:
+                totals[i][r] += tx.amount
+        return totals
+
+    def paid(self, totals):
+        """
+        (han pagado, morosos) según lo ingresado en un periodo.
+        """
+        hechos = [r for r in self.roommates if totals.get(r, 0) >= r.minimum]
+        morosos = [r for r in self.roommates if totals.get(r, 0) < r.minimum]
+        return hechos, morosos
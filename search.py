@@ -0,0 +1,147 @@
+"""
+Búsqueda de texto sobre las transacciones guardadas (/buscar).
+
+Índice invertido en memoria: cada palabra normalizada (sin tildes ni
+mayúsculas) de la contrapartida y del concepto apunta a las transacciones
+que la contienen. Se actualiza de forma incremental leyendo del almacén sólo
+las filas escritas desde la última vez (por `rowid`; un `INSERT OR REPLACE`
+genera un rowid nuevo, así que las corregidas también se reindexan). El hueco
+que deja la versión anterior se reutiliza para el siguiente documento, así que
+el índice no crece con las reescrituras.
+
+Todas las palabras de la consulta deben aparecer (como palabra o como
+prefijo de al menos 3 letras). Se ordena por BM25 y, a igualdad, por fecha.
+"""
+import math
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import date
+
+from roommates import normalize
+
+# Parámetros habituales de BM25
+K1 = 1.2
+B = 0.75
+MIN_PREFIX = 3
+
+
+class SearchIndex:
+    def __init__(self, store):
+        self.store = store
+        self.postings = defaultdict(dict)   # palabra -> {doc: frecuencia}
+        self.doc_ids = []                   # doc -> (cuenta, transaction_id)
+        self.doc_terms = []                 # doc -> palabras (para poder desindexar)
+        self.doc_booked = []                # doc -> ordinal de la fecha
+        self.by_id = {}                     # (cuenta, transaction_id) -> doc vigente
+        self.free = []                      # docs desindexados, para reutilizar
+        self.total_len = 0
+        self.last_rowid = 0
+        self._vocab = None                  # palabras ordenadas (para prefijos), perezoso
+
+    def __len__(self):
+        return len(self.by_id)
+
+    # --- Indexado ---
+
+    def refresh(self, limit=None) -> int:
+        """
+        Indexa las filas nuevas o reescritas del almacén (como mucho `limit`).
+        Devuelve cuántas; 0 cuando ya está al día.
+        """
+        rows = self.store.rows_since(self.last_rowid, limit)
+        for rowid, account, tx_id, booking_date, creditor, debtor, concept in rows:
+            key = (account, tx_id)
+            self._remove(key)
+            booked = date.fromisoformat(booking_date).toordinal() if booking_date else 0
+            self._add(key, booked, " ".join(filter(None, (creditor, debtor, concept))))
+            self.last_rowid = max(self.last_rowid, rowid)
+        if rows:
+            self._vocab = None
+        return len(rows)
+
+    def _add(self, key, booked, text):
+        terms = normalize(text)
+        if self.free:
+            doc = self.free.pop()
+            self.doc_ids[doc] = key
+            self.doc_terms[doc] = terms
+            self.doc_booked[doc] = booked
+        else:
+            doc = len(self.doc_ids)
+            self.doc_ids.append(key)
+            self.doc_terms.append(terms)
+            self.doc_booked.append(booked)
+        self.by_id[key] = doc
+        self.total_len += len(terms)
+        for term in terms:
+            postings = self.postings[term]
+            postings[doc] = postings.get(doc, 0) + 1
+
+    def _remove(self, key):
+        doc = self.by_id.pop(key, None)
+        if doc is None:
+            return
+        terms = self.doc_terms[doc]
+        self.total_len -= len(terms)
+        for term in set(terms):
+            postings = self.postings[term]
+            postings.pop(doc, None)
+            if not postings:
+                del self.postings[term]
+        self.doc_terms[doc] = ()
+        self.doc_ids[doc] = None
+        self.free.append(doc)
+
+    # --- Consulta ---
+
+    def _expand(self, word):
+        """
+        Palabras del índice que casan con `word`: ella misma y, si es lo
+        bastante larga, las que empiezan por ella.
+        """
+        if len(word) < MIN_PREFIX:
+            return [word] if word in self.postings else []
+        if self._vocab is None:
+            self._vocab = sorted(self.postings)
+        out = []
+        i = bisect_left(self._vocab, word)
+        while i < len(self._vocab) and self._vocab[i].startswith(word):
+            out.append(self._vocab[i])
+            i += 1
+        return out
+
+    def search(self, text, date_from=None, date_to=None):
+        """
+        Transacciones que contienen todas las palabras de `text`, con fecha
+        (ordinal) en [date_from, date_to] si se indican. Devuelve una lista
+        de ((cuenta, transaction_id), puntuación), de mejor a peor.
+        """
+        words = normalize(text)
+        if not words or not self.by_id:
+            return []
+        n_docs = len(self.by_id)
+        avg_len = self.total_len / n_docs
+        scores = None
+        for word in words:
+            word_scores = defaultdict(float)
+            for term in self._expand(word):
+                postings = self.postings[term]
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc, tf in postings.items():
+                    norm = K1 * (1 - B + B * len(self.doc_terms[doc]) / avg_len)
+                    word_scores[doc] += idf * tf * (K1 + 1) / (tf + norm)
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = {d: s + word_scores[d] for d, s in scores.items() if d in word_scores}
+            if not scores:
+                return []
+
+        booked = self.doc_booked
+        hits = [
+            (doc, score) for doc, score in scores.items()
+            if (date_from is None or booked[doc] >= date_from)
+            and (date_to is None or booked[doc] <= date_to)
+        ]
+        hits.sort(key=lambda h: (-h[1], -booked[h[0]]))
+        return [(self.doc_ids[doc], score) for doc, score in hits]
@@ -0,0 +1,51 @@
+import json
+import os
+import sys
+
+import pytest
+from telegram.request import BaseRequest
+
+# Los módulos del bot están en la raíz del repositorio
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BOT = {"id": 1, "is_bot": True, "first_name": "Piso", "username": "piso_bot"}
+
+
+class FakeBotApi(BaseRequest):
+    """
+    Bot API falsa: responde getMe y apunta los métodos llamados y los
+    mensajes que envía el bot.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.sent = []
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        endpoint = url.rsplit("/", 1)[1]
+        self.calls.append(endpoint)
+        if endpoint == "getMe":
+            result = BOT
+        elif endpoint == "sendMessage":
+            params = request_data.parameters
+            self.sent.append(params["text"])
+            result = {"message_id": len(self.sent), "date": 0, "text": params["text"],
+                      "chat": {"id": params["chat_id"], "type": "private"}, "from": BOT}
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+@pytest.fixture
+def bot_api():
+    return FakeBotApi()
@@ -0,0 +1,71 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+import app
+from accounts import Account
+from auth import StaticToken
+from cache import ResponseCache
+from gocardless import GoCardlessClient
+
+
+class FakeMessage:
+    def __init__(self, text):
+        self.text = text
+        self.entities = ()
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+
+def fake_update(text, chat_id=1, chat_type="private"):
+    return SimpleNamespace(
+        message=FakeMessage(text),
+        effective_chat=SimpleNamespace(id=chat_id, type=chat_type),
+        effective_user=SimpleNamespace(id=chat_id),
+    )
+
+
+def fake_context():
+    return SimpleNamespace(args=[], bot=SimpleNamespace(username="piso_bot"))
+
+
+@pytest.fixture
+def bank(monkeypatch):
+    """
+    Cliente de GoCardless contra un transporte falso: `bank.handler` decide
+    cada respuesta.
+    """
+    bank = SimpleNamespace(handler=lambda request: httpx.Response(200, json={}))
+    client = GoCardlessClient({}, auth=StaticToken("t"))
+    client._client = httpx.AsyncClient(
+        transport=httpx.MockTransport(lambda request: bank.handler(request))
+    )
+    monkeypatch.setattr(app, "ACCOUNTS", [Account("A", api_url="https://bank/api/v2/accounts")])
+    monkeypatch.setattr(app, "GC_CLIENT", client)
+    monkeypatch.setattr(app, "RESPONSE_CACHE", ResponseCache(app.CACHE_TTLS))
+    return bank
+
+
+def test_iban_answers_when_the_request_fails(bank):
+    def handler(request):
+        raise RuntimeError("respuesta_rota")
+
+    bank.handler = handler
+    update = fake_update("/iban")
+    asyncio.run(app.iban(update, fake_context()))
+    (texto,) = update.message.replies
+    assert texto.startswith("⚠️ Error al obtener el IBAN")
+    assert "respuesta\\_rota" in texto
+
+
+def test_iban_with_the_bank_down_says_so(bank):
+    (account,) = app.ACCOUNTS
+    breaker = app.GC_CLIENT.breaker(account.details_url)
+    for _ in range(breaker.threshold):
+        breaker.failure(breaker.allow())
+    texto = app.details_text(account, httpx.ConnectError("sin red"))
+    assert texto.startswith("⚠️ _Banco no disponible")
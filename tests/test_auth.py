@@ -0,0 +1,169 @@
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+import auth
+from auth import TokenError, TokenManager
+
+
+class FakeTokens:
+    """
+    `/token/new/` y `/token/refresh/` falsos: cada token lleva un número
+    para saber de qué llamada sale.
+    """
+
+    def __init__(self, access_expires=86400, refresh_expires=30 * 86400):
+        self.access_expires = access_expires
+        self.refresh_expires = refresh_expires
+        self.calls = []
+        self.refused = set()   # endpoints que responden 401
+        self.delay = 0.0
+
+    async def __call__(self, request):
+        endpoint = request.url.path.rstrip("/").rsplit("/", 1)[1]
+        self.calls.append((endpoint, json.loads(request.content)))
+        await asyncio.sleep(self.delay)
+        if endpoint in self.refused:
+            return httpx.Response(401, json={"detail": "token caducado"})
+        n = len(self.calls)
+        data = {"access": f"access-{n}", "access_expires": self.access_expires}
+        if endpoint == "new":
+            data.update(refresh=f"refresh-{n}", refresh_expires=self.refresh_expires)
+        return httpx.Response(200, json=data)
+
+    def endpoints(self):
+        return [endpoint for endpoint, _ in self.calls]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1_000_000.0)
+    monkeypatch.setattr(auth, "time", SimpleNamespace(
+        time=lambda: clock.now, perf_counter=time.perf_counter,
+    ))
+    return clock
+
+
+def manager(bank, **kwargs):
+    mgr = TokenManager("id", "key", api_url="https://bank/api/v2", **kwargs)
+    mgr._client = httpx.AsyncClient(transport=httpx.MockTransport(bank))
+    return mgr
+
+
+def test_first_token_is_asked_once_and_reused(clock):
+    bank = FakeTokens()
+    mgr = manager(bank)
+
+    async def run():
+        return [await mgr.token() for _ in range(3)]
+
+    assert asyncio.run(run()) == ["access-1"] * 3
+    assert bank.calls == [("new", {"secret_id": "id", "secret_key": "key"})]
+
+
+def test_access_is_refreshed_before_it_expires(clock):
+    bank = FakeTokens(access_expires=86400)
+    mgr = manager(bank, margin=300)
+    asyncio.run(mgr.token())
+    # Hasta 5 minutos antes de caducar se sigue usando el mismo
+    clock.now += 86400 - 301
+    assert asyncio.run(mgr.token()) == "access-1"
+    clock.now += 1
+    assert asyncio.run(mgr.token()) == "access-2"
+    assert bank.calls[1] == ("refresh", {"refresh": "refresh-1"})
+
+
+def test_short_lived_access_is_renewed_at_ninety_percent(clock):
+    bank = FakeTokens(access_expires=1000)
+    mgr = manager(bank, margin=300)
+    asyncio.run(mgr.token())
+    clock.now += 899
+    asyncio.run(mgr.token())
+    assert bank.endpoints() == ["new"]
+    clock.now += 1
+    asyncio.run(mgr.token())
+    assert bank.endpoints() == ["new", "refresh"]
+
+
+def test_concurrent_callers_share_one_renewal(clock):
+    bank = FakeTokens()
+    bank.delay = 0.01
+    mgr = manager(bank)
+
+    async def run():
+        first = await asyncio.gather(*(mgr.token() for _ in range(10)))
+        clock.now += 86400
+        second = await asyncio.gather(*(mgr.token() for _ in range(10)))
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first == ["access-1"] * 10 and second == ["access-2"] * 10
+    assert bank.endpoints() == ["new", "refresh"]
+
+
+def test_cancelled_caller_does_not_cancel_the_renewal(clock):
+    bank = FakeTokens()
+    bank.delay = 0.01
+    mgr = manager(bank)
+
+    async def run():
+        impatient = asyncio.ensure_future(mgr.token())
+        patient = asyncio.ensure_future(mgr.token())
+        await asyncio.sleep(0)
+        impatient.cancel()
+        return await patient
+
+    assert asyncio.run(run()) == "access-1"
+    assert bank.endpoints() == ["new"]
+
+
+def test_expired_refresh_token_falls_back_to_new(clock):
+    bank = FakeTokens(access_expires=3600, refresh_expires=7200)
+    mgr = manager(bank)
+    asyncio.run(mgr.token())
+    # El de refresco ya no vale: ni se intenta
+    clock.now += 7200
+    assert asyncio.run(mgr.token()) == "access-2"
+    assert bank.endpoints() == ["new", "new"]
+
+
+def test_refused_refresh_token_falls_back_to_new(clock):
+    bank = FakeTokens(access_expires=3600)
+    mgr = manager(bank)
+    asyncio.run(mgr.token())
+    bank.refused.add("refresh")
+    clock.now += 3600
+    assert asyncio.run(mgr.token()) == "access-3"
+    assert bank.endpoints() == ["new", "refresh", "new"]
+    assert mgr.refresh == "refresh-3"
+
+
+def test_invalidate_forces_a_renewal_only_for_the_current_token(clock):
+    bank = FakeTokens()
+    mgr = manager(bank)
+    asyncio.run(mgr.token())
+    mgr.invalidate("access-0")
+    assert asyncio.run(mgr.token()) == "access-1"
+    mgr.invalidate("access-1")
+    assert asyncio.run(mgr.token()) == "access-2"
+
+
+def test_rejected_credentials_reach_every_waiter_and_are_retried(clock):
+    bank = FakeTokens()
+    bank.refused.add("new")
+    bank.delay = 0.01
+    mgr = manager(bank)
+
+    async def run():
+        return await asyncio.gather(*(mgr.token() for _ in range(3)), return_exceptions=True)
+
+    errors = asyncio.run(run())
+    assert all(isinstance(e, TokenError) and e.response.status_code == 401 for e in errors)
+    assert bank.endpoints() == ["new"]
+    # El fallo no se queda pegado: la siguiente petición lo vuelve a intentar
+    bank.refused.clear()
+    assert asyncio.run(mgr.token()) == "access-2"
@@ -0,0 +1,49 @@
+from breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+def open_breaker(now=0.0):
+    b = CircuitBreaker(threshold=2, cooldown=10.0, max_cooldown=40.0)
+    for _ in range(2):
+        b.failure(b.allow(now), now)
+    assert b.state == OPEN
+    return b
+
+
+def test_opens_after_threshold_and_refuses_until_cooldown():
+    b = open_breaker()
+    assert not b.allow(5.0)
+    assert b.retry_in(5.0) == 5
+
+
+def test_only_one_probe_in_half_open():
+    b = open_breaker()
+    probe = b.allow(10.0)
+    assert probe and b.state == HALF_OPEN
+    assert not b.allow(10.0)
+    b.success(probe)
+    assert b.state == CLOSED and b.allow(10.0)
+
+
+def test_failed_probe_doubles_cooldown():
+    b = open_breaker()
+    b.failure(b.allow(10.0), 10.0)
+    assert b.state == OPEN and b.open_until == 30.0
+    b.failure(b.allow(30.0), 30.0)
+    b.failure(b.allow(70.0), 70.0)
+    assert b.cooldown == 40.0
+
+
+def test_late_request_does_not_release_the_probe():
+    b = CircuitBreaker(threshold=2, cooldown=10.0)
+    old = b.allow(0.0)
+    for _ in range(2):
+        b.failure(b.allow(0.0), 0.0)
+    probe = b.allow(10.0)
+    # Una petición de antes de abrirse termina ahora: no toca la prueba
+    b.success(old)
+    b.failure(old, 10.0)
+    b.release(old)
+    assert b.state == HALF_OPEN and b.probe == probe
+    assert not b.allow(10.0)
+    b.release(probe)
+    assert b.allow(10.0)
@@ -0,0 +1,149 @@
+import asyncio
+import gzip
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+import cache
+from breaker import OPEN
+from cache import ResponseCache, SharedResponses
+from gocardless import GoCardlessClient
+
+URL = "https://bank/api/v2/accounts/A/balances/"
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1_000_000.0)
+    monkeypatch.setattr(cache, "time", SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+class Bank:
+    """
+    `fetch` que cuenta llamadas y devuelve un saldo distinto cada vez.
+    """
+
+    def __init__(self, status=200):
+        self.status = status
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        return httpx.Response(self.status, json={"n": self.calls}, request=httpx.Request("GET", URL))
+
+
+def get(c, fetch, url=URL):
+    async def run():
+        resp, age = await c.get(url, fetch)
+        # Deja terminar el refresco en segundo plano, si lo hay
+        await asyncio.gather(*c._refreshing.values())
+        return resp.json(), age
+
+    return asyncio.run(run())
+
+
+def test_hit_within_ttl(clock):
+    c = ResponseCache({"balances": 60})
+    bank = Bank()
+    assert get(c, bank) == ({"n": 1}, 0.0)
+    clock.now += 30
+    assert get(c, bank) == ({"n": 1}, 30)
+    assert bank.calls == 1
+    assert c.counters[("balances", "miss")] == 1 and c.counters[("balances", "hit")] == 1
+
+
+def test_expired_entry_is_served_and_refreshed(clock):
+    c = ResponseCache({"balances": 60})
+    bank = Bank()
+    get(c, bank)
+    clock.now += 61
+    # Se responde al momento con lo caducado y se refresca detrás
+    assert get(c, bank) == ({"n": 1}, 61)
+    assert bank.calls == 2 and c.counters[("balances", "stale")] == 1
+    assert get(c, bank) == ({"n": 2}, 0)
+
+
+def test_errors_are_not_cached(clock):
+    c = ResponseCache()
+    bank = Bank(status=500)
+    get(c, bank)
+    get(c, bank)
+    assert bank.calls == 2 and URL not in c.entries
+
+
+def test_lru_limit(clock):
+    c = ResponseCache(max_entries=2)
+    bank = Bank()
+    for n in range(3):
+        get(c, bank, url=f"https://bank/api/v2/accounts/{n}/balances/")
+    assert list(c.entries) == [
+        "https://bank/api/v2/accounts/1/balances/", "https://bank/api/v2/accounts/2/balances/",
+    ]
+
+
+def test_stale_reads_while_the_breaker_is_open(clock):
+    calls = []
+
+    def handler(request):
+        calls.append(request.url)
+        if len(calls) == 1:
+            return httpx.Response(200, json={"balances": ["guardado"]})
+        raise httpx.ConnectError("sin red")
+
+    async def run():
+        client = GoCardlessClient({})
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        c = ResponseCache({"balances": 60})
+        fetch = lambda: client.get(URL)
+        results = []
+        for _ in range(6):
+            resp, age = await c.get(URL, fetch)
+            await asyncio.gather(*c._refreshing.values())
+            results.append((resp.status_code, resp.json(), age))
+            clock.now += 61
+        await client.aclose()
+        return client, results
+
+    client, results = asyncio.run(run())
+    # Con el banco caído se sigue sirviendo lo guardado, cada vez más viejo
+    assert [r[:2] for r in results] == [(200, {"balances": ["guardado"]})] * 6
+    assert [r[2] for r in results] == [0.0, 61, 122, 183, 244, 305]
+    # Los refrescos fallidos abren el circuito: a partir de ahí ni se intenta
+    assert client.is_down(URL) and client.breaker(URL).state == OPEN
+    assert len(calls) == 1 + client.breaker(URL).threshold
+
+
+def test_shared_responses_between_processes(clock, tmp_path):
+    path = str(tmp_path / "cache.db")
+    mine = ResponseCache({"balances": 60}, shared=SharedResponses(path))
+    other = ResponseCache({"balances": 60}, shared=SharedResponses(path))
+    bank = Bank()
+    get(mine, bank)
+    clock.now += 10
+    # El otro proceso no tiene nada en memoria: lo toma de la base común
+    assert get(other, bank) == ({"n": 1}, 10)
+    assert bank.calls == 1
+    # Y si lo suyo ha caducado pero el otro ya lo refrescó, usa lo más nuevo
+    clock.now += 60
+    get(mine, bank)
+    assert get(other, bank) == ({"n": 2}, 0)
+    assert bank.calls == 2
+
+
+def test_shared_response_keeps_status_and_headers(tmp_path):
+    shared = SharedResponses(str(tmp_path / "cache.db"))
+    resp = httpx.Response(
+        200, headers={"X-Ratelimit-Remaining": "3", "Content-Encoding": "gzip"},
+        content=gzip.compress(b'{"n": 1}'), request=httpx.Request("GET", URL),
+    )
+    # El cuerpo se guarda ya descomprimido: la cabecera no debe seguir ahí
+    shared.put(URL, resp, time.time())
+    stored, _ = shared.get(URL)
+    assert stored.status_code == 200 and stored.json() == {"n": 1}
+    assert stored.headers["x-ratelimit-remaining"] == "3"
+    assert "content-encoding" not in stored.headers
+    assert shared.get(URL + "otra") is None
+    shared.close()
@@ -0,0 +1,27 @@
+from datetime import datetime, time
+
+from calendar_trigger import MonthlyTrigger
+
+
+def test_day_clamped_to_end_of_short_months():
+    trigger = MonthlyTrigger(31, time(9, 0))
+    assert trigger.next_fire(datetime(2024, 2, 1)) == datetime(2024, 2, 29, 9, 0)
+    assert trigger.next_fire(datetime(2023, 2, 1)) == datetime(2023, 2, 28, 9, 0)
+    assert trigger.next_fire(datetime(2024, 4, 30, 10, 0)) == datetime(2024, 5, 31, 9, 0)
+
+
+def test_override_for_february():
+    trigger = MonthlyTrigger(29, time(9, 0), overrides={2: 26})
+    assert trigger.next_fire(datetime(2024, 2, 1)) == datetime(2024, 2, 26, 9, 0)
+    assert trigger.next_fire(datetime(2024, 2, 26, 9, 0)) == datetime(2024, 3, 29, 9, 0)
+
+
+def test_next_fire_is_strictly_after_now_and_crosses_the_year():
+    trigger = MonthlyTrigger(1, time(9, 5))
+    assert trigger.next_fire(datetime(2024, 12, 1, 9, 5)) == datetime(2025, 1, 1, 9, 5)
+    assert trigger.next_fire(datetime(2024, 12, 1, 9, 4)) == datetime(2024, 12, 1, 9, 5)
+
+
+def test_seconds_until_next():
+    trigger = MonthlyTrigger(1, time(9, 0))
+    assert trigger.seconds_until_next(datetime(2024, 3, 31, 9, 0)) == 86400
@@ -0,0 +1,148 @@
+import asyncio
+
+from telegram import Message, Update
+from telegram.ext import ApplicationBuilder, MessageHandler, filters
+
+import app
+from gating import Throttle, is_addressed
+from metrics import UPDATES_DROPPED
+
+def message_data(text, chat_id=-100, chat_type="supergroup", user_id=7, n=1):
+    data = {
+        "message_id": n, "date": 0, "text": text,
+        "chat": {"id": chat_id, "type": chat_type, "title": "Piso"},
+        "from": {"id": user_id, "is_bot": False, "first_name": "Ana"},
+    }
+    if text.startswith("/"):
+        data["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    elif "@" in text:
+        start = text.index("@")
+        data["entities"] = [{"type": "mention", "offset": start, "length": len(text) - start}]
+    return data
+
+
+def dropped(reason):
+    return UPDATES_DROPPED.values.get((reason,), 0)
+
+
+# --- gating.py ---
+def test_is_addressed_uses_entities_not_substrings():
+    def msg(text):
+        return Message.de_json(message_data(text), None)
+
+    assert is_addressed(msg("/saldo@piso_bot"), "piso_bot")
+    assert is_addressed(msg("/saldo@PISO_BOT"), "piso_bot")
+    assert is_addressed(msg("hola @piso_bot"), "piso_bot")
+    assert not is_addressed(msg("/saldo"), "piso_bot")
+    assert not is_addressed(msg("/saldo@otro_bot"), "piso_bot")
+    # Nombrarlo sin que sea una mención no cuenta
+    assert not is_addressed(msg("el piso_bot no contesta"), "piso_bot")
+    assert not is_addressed(None, "piso_bot")
+
+
+def test_throttle_allows_a_burst_then_refills():
+    t = Throttle(rate=0.5, burst=2)
+    assert t.take("u", now=0.0) and t.take("u", now=0.0)
+    assert not t.take("u", now=0.0)
+    assert t.wait("u", now=0.0) == 2.0
+    assert t.should_warn("u") and not t.should_warn("u")
+    assert t.take("u", now=2.0)
+    # Tras recuperar fichas se vuelve a avisar al vaciarse
+    assert not t.take("u", now=2.0) and t.should_warn("u")
+    # Otra clave tiene su propia cubeta
+    assert t.take("v", now=2.0)
+
+
+def test_throttle_forgets_least_used_buckets():
+    t = Throttle(rate=1, burst=1, max_buckets=2)
+    t.take("a", now=0.0)
+    t.take("b", now=0.0)
+    t.take("a", now=0.0)
+    t.take("c", now=0.0)
+    assert list(t.buckets) == ["a", "c"]
+
+
+# --- Grupos -2/-1 de la Application ---
+def run_updates(monkeypatch, tmp_path, api, messages):
+    """
+    Pasa `messages` por la Application de `build_application` y devuelve los
+    textos que llegaron a los handlers normales y lo que respondió el bot.
+    """
+    monkeypatch.setattr(app, "REMINDERS_DB", ":memory:")
+    monkeypatch.setattr(app, "REMINDERS_FILE", str(tmp_path / "reminders.json"))
+    monkeypatch.setattr(app, "ApplicationBuilder", lambda: ApplicationBuilder().request(api))
+    application = app.build_application("1:TEST")
+    handled = []
+
+    async def record(update, context):
+        handled.append(update.message.text)
+
+    application.add_handler(MessageHandler(filters.ALL, record), group=1)
+
+    async def run():
+        async with application:
+            for n, data in enumerate(messages, 1):
+                await application.process_update(
+                    Update.de_json({"update_id": n, "message": data}, application.bot)
+                )
+
+    asyncio.run(run())
+    app.REMINDER_STORE.close()
+    return handled, api.sent
+
+
+def test_unaddressed_group_messages_are_dropped_and_counted(monkeypatch, tmp_path, bot_api):
+    monkeypatch.setattr(app, "USER_THROTTLE", Throttle(rate=1, burst=10))
+    monkeypatch.setattr(app, "CHAT_THROTTLE", Throttle(rate=1, burst=10))
+    antes = dropped("sin_mencion")
+    handled, sent = run_updates(monkeypatch, tmp_path, bot_api, [
+        message_data("buenos días"),
+        message_data("/saldo"),
+        message_data("/saldo@piso_bot", n=3),
+        message_data("gracias @piso_bot", n=4),
+    ])
+    assert handled == ["/saldo@piso_bot", "gracias @piso_bot"]
+    assert dropped("sin_mencion") - antes == 2
+    # Lo descartado en el grupo -2 no llega al -1: no gasta fichas
+    assert app.USER_THROTTLE.buckets[7].tokens == 9
+    assert sent == []
+
+
+def test_private_chats_need_no_mention(monkeypatch, tmp_path, bot_api):
+    monkeypatch.setattr(app, "USER_THROTTLE", Throttle(rate=1, burst=10))
+    monkeypatch.setattr(app, "CHAT_THROTTLE", Throttle(rate=1, burst=10))
+    antes = dropped("sin_mencion")
+    handled, _ = run_updates(monkeypatch, tmp_path, bot_api, [
+        message_data("hola", chat_id=7, chat_type="private"),
+        message_data("/fecha", chat_id=7, chat_type="private", n=2),
+    ])
+    assert handled == ["hola", "/fecha"]
+    assert dropped("sin_mencion") == antes
+
+
+def test_throttled_commands_are_dropped_and_counted(monkeypatch, tmp_path, bot_api):
+    monkeypatch.setattr(app, "USER_THROTTLE", Throttle(rate=1e-6, burst=2))
+    monkeypatch.setattr(app, "CHAT_THROTTLE", Throttle(rate=1, burst=10))
+    antes = dropped("usuario")
+    handled, sent = run_updates(monkeypatch, tmp_path, bot_api, [
+        message_data(f"/fecha{'@piso_bot' if n % 2 else ''}", chat_id=7, chat_type="private", n=n)
+        for n in range(1, 6)
+    ] + [message_data("hola", chat_id=7, chat_type="private", n=6)])
+    # Dos órdenes pasan; el resto se descarta, con un solo aviso
+    assert handled == ["/fecha@piso_bot", "/fecha", "hola"]
+    assert dropped("usuario") - antes == 3
+    avisos = [texto for texto in sent if texto.startswith("⏳ Demasiadas órdenes seguidas")]
+    assert len(avisos) == 1
+
+
+def test_chat_bucket_limits_the_whole_group(monkeypatch, tmp_path, bot_api):
+    monkeypatch.setattr(app, "USER_THROTTLE", Throttle(rate=1, burst=10))
+    monkeypatch.setattr(app, "CHAT_THROTTLE", Throttle(rate=1e-6, burst=2))
+    antes = dropped("chat")
+    handled, _ = run_updates(monkeypatch, tmp_path, bot_api, [
+        message_data("/fecha@piso_bot", user_id=u, n=u) for u in range(1, 5)
+    ])
+    assert handled == ["/fecha@piso_bot"] * 2
+    assert dropped("chat") - antes == 2
+    # A quien se frena por el chat no se le cobra la ficha de usuario
+    assert app.USER_THROTTLE.buckets[3].tokens == 10
@@ -0,0 +1,66 @@
+import asyncio
+import json
+
+import pytest
+
+from json_stream import ArrayStream, aiter_array, iter_array
+
+PATH = ("transactions", "booked")
+DOC = {
+    "transactions": {
+        "pending": [{"id": "p1"}],
+        "booked": [{"id": "b1", "name": "Peña"}, {"id": "b2", "nested": {"a": [1, 2.5]}}, 3, "x"],
+    },
+    "last_updated": "2024-03-10",
+}
+
+
+def chunks_of(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("size", [1, 2, 7, 1 << 16])
+def test_items_across_chunk_boundaries(size):
+    # Con trozos de 1 byte la "ñ" (2 bytes en UTF-8) llega partida
+    data = json.dumps(DOC, ensure_ascii=False).encode()
+    assert list(iter_array(chunks_of(data, size), PATH)) == DOC["transactions"]["booked"]
+
+
+def test_stops_reading_when_consumer_stops():
+    data = json.dumps(DOC).encode()
+    read = []
+
+    def chunks():
+        for chunk in chunks_of(data, 8):
+            read.append(chunk)
+            yield chunk
+
+    first = next(iter_array(chunks(), PATH))
+    assert first == {"id": "b1", "name": "Peña"}
+    assert sum(map(len, read)) < len(data)
+
+
+def test_missing_path_yields_nothing():
+    assert list(iter_array([b'{"transactions": {"pending": []}}'], PATH)) == []
+
+
+def test_incomplete_document_is_an_error():
+    with pytest.raises(ValueError):
+        list(iter_array([b'{"transactions": {"booked": [{"id": 1}'], PATH))
+
+
+def test_item_too_large_is_an_error():
+    stream = ArrayStream(PATH, max_item=10)
+    with pytest.raises(ValueError):
+        stream.feed('{"transactions": {"booked": [{"concept": "' + "x" * 20)
+
+
+def test_async_iteration():
+    async def chunks():
+        for chunk in chunks_of(json.dumps(DOC).encode(), 5):
+            yield chunk
+
+    async def collect():
+        return [item async for item in aiter_array(chunks(), PATH)]
+
+    assert asyncio.run(collect()) == DOC["transactions"]["booked"]
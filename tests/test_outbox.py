@@ -0,0 +1,61 @@
+import asyncio
+
+from outbox import MAX_LENGTH, Outbox, split_text
+
+
+class SlowBot:
+    """
+    Bot falso: cada envío espera a `release` para poder tener uno en vuelo.
+    """
+
+    def __init__(self):
+        self.sent = []
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+
+    async def send_message(self, chat_id, text, parse_mode=None):
+        self.started.set()
+        await self.release.wait()
+        self.sent.append((chat_id, text))
+
+
+def test_send_to_other_chat_while_delivery_in_flight():
+    async def run():
+        bot = SlowBot()
+        outbox = Outbox(merge_window=0.0, private_interval=0.0)
+        outbox.start(bot)
+        outbox.send(1, "uno")
+        await asyncio.wait_for(bot.started.wait(), 1)
+        # La cola del chat 1 está vacía pero su envío sigue en vuelo
+        assert 1 in outbox.inflight and not outbox.queues[1]
+        outbox.send(2, "dos")
+        await asyncio.sleep(0.05)
+        bot.release.set()
+        assert await outbox.flush(2)
+        alive = not outbox._task.done()
+        await outbox.stop()
+        return bot.sent, alive
+
+    sent, alive = asyncio.run(run())
+    assert alive
+    assert sorted(sent) == [(1, "uno"), (2, "dos")]
+
+
+def test_pending_messages_for_same_chat_are_merged():
+    async def run():
+        bot = SlowBot()
+        bot.release.set()
+        outbox = Outbox(merge_window=0.05)
+        outbox.start(bot)
+        for i in range(3):
+            outbox.send(1, f"r{i}")
+        assert await outbox.flush(2)
+        await outbox.stop()
+        return bot.sent
+
+    assert asyncio.run(run()) == [(1, "r0\n\nr1\n\nr2")]
+
+
+def test_split_text_respects_limit():
+    parts = split_text("a" * (MAX_LENGTH + 10))
+    assert [len(p) for p in parts] == [MAX_LENGTH, 10]
@@ -0,0 +1,125 @@
+import asyncio
+
+import httpx
+import pytest
+
+from quota import (
+    PRIORITY_INTERACTIVE, PRIORITY_SCHEDULED, QuotaExceeded, QuotaManager, SharedQuota,
+    endpoint_key, retry_after_seconds,
+)
+
+URL = "https://bankaccountdata.gocardless.com/api/v2/accounts/ACC/transactions/"
+
+
+def response(status, remaining=None, reset=None, **kwargs):
+    headers = {}
+    if remaining is not None:
+        headers["HTTP_X_RATELIMIT_ACCOUNT_SUCCESS_REMAINING"] = str(remaining)
+    if reset is not None:
+        headers["HTTP_X_RATELIMIT_ACCOUNT_SUCCESS_RESET"] = str(reset)
+    return httpx.Response(status, headers={**headers, **kwargs.pop("headers", {})}, **kwargs)
+
+
+def test_endpoint_key():
+    assert endpoint_key(URL) == ("ACC", "transactions")
+
+
+def test_retry_after_from_detail_or_header():
+    assert retry_after_seconds(response(429, json={"detail": "Try again in 3600 seconds"})) == 3600
+    assert retry_after_seconds(response(429, headers={"Retry-After": "12"})) == 12
+    assert retry_after_seconds(response(429)) == 0
+
+
+def test_reserve_is_kept_for_scheduled_jobs():
+    quota = QuotaManager(reserve=1)
+    key = endpoint_key(URL)
+    assert quota.check(key, PRIORITY_INTERACTIVE) == 0
+    quota.update(key, response(200, remaining=1, reset=100))
+    assert 0 < quota.check(key, PRIORITY_INTERACTIVE) <= 100
+    assert quota.check(key, PRIORITY_SCHEDULED) == 0
+
+
+def test_429_empties_the_quota():
+    quota = QuotaManager()
+    key = endpoint_key(URL)
+    quota.update(key, response(429, json={"detail": "Try again in 60 seconds"}))
+    assert 0 < quota.check(key, PRIORITY_SCHEDULED) <= 60
+
+
+def test_interactive_request_refused_without_calling_the_bank():
+    quota = QuotaManager(reserve=1)
+    quota.update(endpoint_key(URL), response(200, remaining=1, reset=100))
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        return response(200)
+
+    with pytest.raises(QuotaExceeded):
+        asyncio.run(quota.run(URL, None, PRIORITY_INTERACTIVE, fetch))
+    assert not calls
+
+
+def test_identical_requests_are_coalesced():
+    quota = QuotaManager()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return response(200, remaining=10)
+
+    async def both():
+        return await asyncio.gather(
+            quota.run(URL, {"date_from": "2024-01-01"}, PRIORITY_INTERACTIVE, fetch),
+            quota.run(URL, {"date_from": "2024-01-01"}, PRIORITY_INTERACTIVE, fetch),
+        )
+
+    a, b = asyncio.run(both())
+    assert a is b and len(calls) == 1
+
+
+def test_scheduled_requests_jump_the_queue():
+    quota = QuotaManager(max_in_flight=1)
+    order = []
+
+    def fetch_as(name):
+        async def fetch():
+            order.append(name)
+            await asyncio.sleep(0.01)
+            return response(200)
+        return fetch
+
+    async def run():
+        first = asyncio.create_task(quota.run(URL + "?1", None, PRIORITY_INTERACTIVE, fetch_as("a")))
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(quota.run(URL + "?2", None, PRIORITY_INTERACTIVE, fetch_as("b")))
+        await asyncio.sleep(0)
+        scheduled = asyncio.create_task(quota.run(URL + "?3", None, PRIORITY_SCHEDULED, fetch_as("c")))
+        await asyncio.gather(first, interactive, scheduled)
+
+    asyncio.run(run())
+    assert order == ["a", "c", "b"]
+
+
+def test_shared_quota_is_seen_by_every_process(tmp_path):
+    path = str(tmp_path / "cache.db")
+    leader = QuotaManager(reserve=1, shared=SharedQuota(path))
+    standby = QuotaManager(reserve=1, shared=SharedQuota(path))
+    key = endpoint_key(URL)
+    leader.update(key, response(200, remaining=3, reset=100))
+
+    async def fetch():
+        return response(200)
+
+    # Cada proceso gasta de la misma cuenta
+    asyncio.run(standby.run(URL, None, PRIORITY_INTERACTIVE, fetch))
+    asyncio.run(leader.run(URL, None, PRIORITY_INTERACTIVE, fetch))
+    assert leader.quota(key).remaining == standby.quota(key).remaining == 1
+    with pytest.raises(QuotaExceeded):
+        asyncio.run(standby.run(URL, None, PRIORITY_INTERACTIVE, fetch))
+
+    # Un proceso nuevo (el que toma el relevo) no empieza con la cuota entera
+    relevo = QuotaManager(reserve=1, shared=SharedQuota(path))
+    assert 0 < relevo.check(key, PRIORITY_INTERACTIVE) <= 100
+    assert relevo.check(key, PRIORITY_SCHEDULED) == 0
@@ -0,0 +1,52 @@
+from datetime import datetime
+
+import pytest
+
+from recurrence import EveryNDays, MonthlyOnDay, parse_rule, parse_rule_args
+
+
+def test_monthly_on_31_clamps_and_returns_to_31():
+    rule = MonthlyOnDay(31)
+    jan = datetime(2024, 1, 31, 9, 0)
+    feb = rule.next_after(jan)
+    assert feb == datetime(2024, 2, 29, 9, 0)
+    assert rule.next_after(feb) == datetime(2024, 3, 31, 9, 0)
+    assert rule.next_after(datetime(2023, 1, 31, 9, 0)) == datetime(2023, 2, 28, 9, 0)
+
+
+def test_monthly_first_occurrence():
+    rule = MonthlyOnDay(30)
+    assert rule.first(9, 0, datetime(2024, 2, 10)) == datetime(2024, 2, 29, 9, 0)
+    assert rule.first(9, 0, datetime(2024, 2, 29, 10, 0)) == datetime(2024, 3, 30, 9, 0)
+
+
+def test_monthly_skips_missed_occurrences():
+    rule = MonthlyOnDay(15)
+    current = datetime(2024, 1, 15, 9, 0)
+    assert rule.next_after(current, now=datetime(2024, 4, 20)) == datetime(2024, 5, 15, 9, 0)
+
+
+def test_every_n_days_skips_missed_occurrences():
+    rule = EveryNDays(3)
+    current = datetime(2024, 1, 1, 8, 0)
+    assert rule.next_after(current) == datetime(2024, 1, 4, 8, 0)
+    assert rule.next_after(current, now=datetime(2024, 1, 10, 8, 0)) == datetime(2024, 1, 13, 8, 0)
+    assert rule.first(8, 0, datetime(2024, 1, 1, 9, 0)) == datetime(2024, 1, 2, 8, 0)
+
+
+def test_invalid_rules():
+    with pytest.raises(ValueError):
+        MonthlyOnDay(32)
+    with pytest.raises(ValueError):
+        EveryNDays(0)
+    with pytest.raises(ValueError):
+        parse_rule("anual:1")
+
+
+def test_parse_round_trip_and_args():
+    for rule in (EveryNDays(3), MonthlyOnDay(31)):
+        assert parse_rule(rule.to_str()).to_str() == rule.to_str()
+    rule, rest = parse_rule_args(["semanal", "09:00", "basura"])
+    assert rule.to_str() == "cada:7" and rest == ["09:00", "basura"]
+    rule, rest = parse_rule_args(["mensual", "5", "09:00"])
+    assert rule.to_str() == "mensual:5" and rest == ["09:00"]
@@ -0,0 +1,135 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from recurrence import EveryNDays, MonthlyOnDay
+from reminder_store import ReminderStore
+from reminders import ReminderEngine, ReminderLimitError
+
+NOW = datetime(2024, 3, 10, 12, 0)
+
+
+def engine(store=None, now=NOW, **kwargs):
+    e = ReminderEngine(store or ReminderStore(":memory:"), **kwargs)
+    e.load(now)
+    return e
+
+
+def test_due_reminders_fire_in_order_and_only_once():
+    e = engine()
+    late = e.add(1, NOW + timedelta(hours=2), "basura")
+    soon = e.add(1, NOW + timedelta(hours=1), "luz")
+    e.add(2, NOW + timedelta(days=1), "agua")
+    assert e.next_run_at() == soon.run_at
+    assert e.pop_due(NOW) == []
+    fired = e.pop_due(NOW + timedelta(hours=3))
+    assert [(rid, msg) for rid, _, msg, _ in fired] == [(soon.id, "luz"), (late.id, "basura")]
+    assert e.pop_due(NOW + timedelta(hours=3)) == []
+    assert len(e) == 1 and e.store.count() == 1
+
+
+def test_recurring_reminder_is_rescheduled_in_the_store():
+    e = engine()
+    r = e.add(1, NOW, "alquiler", MonthlyOnDay(10))
+    assert e.pop_due(NOW) == [(r.id, 1, "alquiler", NOW)]
+    assert r.run_at == datetime(2024, 4, 10, 12, 0)
+    (item,) = e.store.load()
+    assert (item["run_at"], item["rule"]) == (r.run_at, "mensual:10")
+    assert e.next_run_at() == r.run_at
+
+
+def test_removed_reminder_does_not_fire():
+    e = engine()
+    r = e.add(1, NOW, "luz")
+    assert e.remove(r.id) is r
+    assert e.remove(r.id) is None
+    assert e.pop_due(NOW) == [] and e.store.count() == 0
+    assert e.next_run_at() is None
+
+
+def test_limit_per_chat():
+    e = engine(max_per_chat=2)
+    e.add(1, NOW, "a")
+    e.add(1, NOW, "b")
+    with pytest.raises(ReminderLimitError):
+        e.add(1, NOW, "c")
+    e.add(2, NOW, "otro chat")
+    assert e.count_for_chat(1) == 2
+    assert [r.message for r in e.for_chat(1, offset=1, limit=5)] == ["b"]
+
+
+def test_restart_recovers_pending_reminders(tmp_path):
+    path = str(tmp_path / "reminders.db")
+    e = engine(ReminderStore(path))
+    once = e.add(1, NOW + timedelta(hours=1), "luz")
+    every = e.add(2, NOW + timedelta(days=1), "basura", EveryNDays(3))
+    e.store.close()
+
+    e = engine(ReminderStore(path))
+    assert sorted(e.items) == [once.id, every.id]
+    assert e.get(every.id).rule.to_str() == "cada:3"
+    assert e.next_run_at() == once.run_at
+    # Los ids no se reutilizan tras un borrado
+    e.remove(every.id)
+    assert e.add(3, NOW, "nuevo").id > every.id
+
+
+def test_reminders_missed_while_stopped_are_skipped_on_start():
+    store = ReminderStore(":memory:")
+    e = engine(store)
+    e.add(1, NOW + timedelta(hours=2), "luz")
+    every = e.add(2, NOW, "basura", EveryNDays(3))
+    e.add(3, NOW + timedelta(days=30), "pendiente")
+
+    # Vuelve a arrancar diez días después: lo de una sola vez que pasó se
+    # descarta y lo recurrente salta a su siguiente ocurrencia
+    later = NOW + timedelta(days=10)
+    e = engine(store, now=later)
+    assert [r.message for r in e.items.values()] == ["basura", "pendiente"]
+    assert e.get(every.id).run_at == NOW + timedelta(days=12)
+    assert e.pop_due(later) == []
+    assert {item["run_at"] for item in store.load()} == {NOW + timedelta(days=12),
+                                                         NOW + timedelta(days=30)}
+
+
+def test_leader_takeover_catches_up_on_missed_reminders():
+    store = ReminderStore(":memory:")
+    e = engine(store)
+    once = e.add(1, NOW + timedelta(minutes=5), "luz")
+    every = e.add(2, NOW + timedelta(minutes=10), "basura", EveryNDays(1))
+
+    # El líder se cae y otro proceso lo releva: carga sin descartar, y lo que
+    # debió sonar mientras tanto se dispara una vez, con su hora prevista
+    later = NOW + timedelta(hours=1)
+    e = ReminderEngine(store)
+    e.load(later, prune=False)
+    fired = e.pop_due(later)
+    assert fired == [(once.id, 1, "luz", once.run_at), (every.id, 2, "basura", every.run_at)]
+    assert e.pop_due(later) == []
+    assert e.get(every.id).run_at == every.run_at + timedelta(days=1)
+    assert [item["id"] for item in store.load()] == [every.id]
+
+
+def test_refresh_picks_up_writes_from_another_process(tmp_path):
+    path = str(tmp_path / "reminders.db")
+    mine, other = engine(ReminderStore(path)), engine(ReminderStore(path))
+    assert not mine.refresh(NOW)
+    r = other.add(1, NOW + timedelta(hours=1), "luz")
+    assert mine.refresh(NOW) and mine.get(r.id).message == "luz"
+    # Las escrituras propias no obligan a recargar
+    mine.add(1, NOW, "agua")
+    assert not mine.refresh(NOW)
+
+
+def test_old_json_file_is_imported_once(tmp_path):
+    path = tmp_path / "reminders.json"
+    path.write_text(json.dumps([
+        {"id": 4, "chat_id": 1, "datetime": (NOW + timedelta(hours=1)).isoformat(), "message": "luz"},
+        {"id": 5, "chat_id": 1, "datetime": "no es una fecha"},
+    ]))
+    store = ReminderStore(":memory:")
+    assert store.import_json(str(path)) == 1
+    assert store.import_json(str(path)) == 0
+    assert (tmp_path / "reminders.json.migrated").exists()
+    assert [r.id for r in engine(store).items.values()] == [4]
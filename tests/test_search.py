@@ -0,0 +1,39 @@
+from datetime import date
+
+from search import SearchIndex
+from transaction_store import TransactionStore
+
+
+def tx(tx_id, creditor, booking_date="2024-03-10"):
+    return {
+        "transactionId": tx_id,
+        "bookingDate": booking_date,
+        "transactionAmount": {"amount": "-1.00", "currency": "EUR"},
+        "creditorName": creditor,
+    }
+
+
+def test_rewritten_transactions_reuse_their_slot():
+    store = TransactionStore(":memory:")
+    store.upsert([tx("T1", "Mercadona"), tx("T2", "Lidl")], account="A")
+    index = SearchIndex(store)
+    index.refresh()
+    for i in range(5):
+        store.upsert([tx("T1", f"Mercadona {i}")], account="A")
+        index.refresh()
+    assert len(index) == 2
+    assert len(index.doc_ids) == 2
+    assert [key for key, _ in index.search("mercadona")] == [("A", "T1")]
+    assert [key for key, _ in index.search("lidl")] == [("A", "T2")]
+    assert index.search("4") and not index.search("3")
+
+
+def test_search_by_prefix_and_date():
+    store = TransactionStore(":memory:")
+    store.upsert([tx("T1", "Mercadona", "2024-03-10"), tx("T2", "Mercado Central", "2024-05-01")],
+                 account="A")
+    index = SearchIndex(store)
+    index.refresh()
+    assert {key for key, _ in index.search("merc")} == {("A", "T1"), ("A", "T2")}
+    desde = date(2024, 4, 1).toordinal()
+    assert [key for key, _ in index.search("merc", date_from=desde)] == [("A", "T2")]
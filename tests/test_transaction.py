@@ -0,0 +1,24 @@
+from datetime import date
+
+from transaction import Transaction, format_cents, parse_cents
+
+
+def test_parse_and_format_cents():
+    assert parse_cents("-800.00") == -80000
+    assert parse_cents("45.3") == 4530
+    assert parse_cents("0.125") == 12
+    assert format_cents(-5) == "-0.05"
+
+
+def test_transaction_without_booking_date():
+    t = Transaction.from_api({"transactionId": "T1", "transactionAmount": {"amount": "-1.00"}})
+    assert t.booked == 0
+    assert t.booking_date is None
+    assert t.date_text() == "—"
+    assert "—" in repr(t)
+
+
+def test_transaction_with_booking_date():
+    t = Transaction.from_api({"transactionId": "T1", "bookingDate": "2024-02-29"})
+    assert t.booking_date == date(2024, 2, 29)
+    assert t.date_text() == "2024-02-29"
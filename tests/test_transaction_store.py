@@ -0,0 +1,197 @@
+import asyncio
+import json
+import sqlite3
+import time
+from datetime import date
+
+import httpx
+
+from breaker import OPEN
+from gocardless import GoCardlessClient
+from search import SearchIndex
+from transaction_store import REFUSED_TTL, TransactionStore
+
+
+def tx(tx_id, booking_date="2024-03-10", amount="-12.50", creditor="Mercadona"):
+    return {
+        "transactionId": tx_id,
+        "bookingDate": booking_date,
+        "transactionAmount": {"amount": amount, "currency": "EUR"},
+        "creditorName": creditor,
+    }
+
+
+def test_same_id_in_two_accounts_keeps_both_rows():
+    store = TransactionStore(":memory:")
+    assert store.upsert([tx("T1", amount="-1.00")], account="A") == 1
+    assert store.upsert([tx("T1", amount="-2.00")], account="B") == 1
+    assert store.count() == 2
+    rows = dict(store.conn.execute("SELECT account, first_seen FROM transactions"))
+    assert rows["A"] != rows["B"]
+    # Volver a recibirla en A no toca la de B ni cambia su `first_seen`
+    assert store.upsert([tx("T1", amount="-1.50")], account="A") == 0
+    assert dict(store.conn.execute("SELECT account, first_seen FROM transactions")) == rows
+    found = {t.account: t.amount for t in store.by_keys([("A", "T1"), ("B", "T1")])}
+    assert found == {"A": -150, "B": -200}
+
+
+def test_undated_transaction_is_announced_once():
+    store = TransactionStore(":memory:")
+    undated = {"transactionId": "T1", "transactionAmount": {"amount": "-3.00", "currency": "EUR"}}
+    assert store.upsert([undated, tx("T2")], account="A") == 2
+    assert [t.id for _, t in store.seen_since(0)] == ["T2", "T1"]
+    mark = store.latest_seen()
+    # El siguiente sondeo la vuelve a recibir: no es un evento nuevo
+    assert store.upsert([undated, tx("T2")], account="A") == 0
+    assert store.seen_since(mark) == []
+    # Tampoco si el banco le pone fecha después
+    store.upsert([tx("T1", booking_date="2024-03-11")], account="A")
+    assert store.seen_since(mark) == []
+
+
+def test_search_keeps_same_id_from_each_account():
+    store = TransactionStore(":memory:")
+    store.upsert([tx("T1", creditor="Mercadona")], account="A")
+    store.upsert([tx("T1", creditor="Mercadona Centro")], account="B")
+    index = SearchIndex(store)
+    index.refresh()
+    keys = [key for key, _ in index.search("mercadona")]
+    assert sorted(keys) == [("A", "T1"), ("B", "T1")]
+
+
+def test_old_single_column_key_is_migrated(tmp_path):
+    path = str(tmp_path / "transactions.db")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE transactions (transaction_id TEXT PRIMARY KEY, booking_date TEXT NOT NULL, "
+        "amount TEXT NOT NULL, currency TEXT, creditor_name TEXT, debtor_name TEXT, raw TEXT NOT NULL)"
+    )
+    conn.execute(
+        "INSERT INTO transactions VALUES (?, ?, ?, ?, ?, ?, ?)",
+        ("T1", "2024-03-10", "-12.50", "EUR", "Mercadona", None, json.dumps(tx("T1"))),
+    )
+    conn.commit()
+    conn.close()
+
+    store = TransactionStore(path)
+    assert store._primary_key() == ["account", "transaction_id"]
+    (t,) = store.recent(10)
+    assert (t.id, t.account, t.amount) == ("T1", None, -1250)
+    store.adopt("A")
+    store.upsert([tx("T1")], account="B")
+    assert sorted(store.conn.execute("SELECT account, transaction_id FROM transactions")) == [
+        ("A", "T1"), ("B", "T1"),
+    ]
+
+
+class FakeResponse:
+    def __init__(self, status_code, txs=()):
+        self.status_code = status_code
+        self.body = json.dumps({"transactions": {"booked": list(txs)}}).encode()
+
+    async def aiter_bytes(self):
+        yield self.body
+
+    async def aclose(self):
+        pass
+
+
+class FakeBank:
+    """
+    Banco falso con histórico desde `oldest`: antes de esa fecha responde 400.
+    """
+
+    def __init__(self, txs, oldest):
+        self.txs = txs
+        self.oldest = oldest
+        self.calls = []
+
+    async def get(self, url, params=None, priority=None, stream=False):
+        self.calls.append((params["date_from"], params["date_to"]))
+        if params["date_from"] < self.oldest:
+            return FakeResponse(400)
+        return FakeResponse(200, [
+            t for t in self.txs if params["date_from"] <= t["bookingDate"] <= params["date_to"]
+        ])
+
+
+URL = "https://bank/api/v2/accounts/A/transactions/"
+
+
+def test_backfill_fetches_older_history_by_pages():
+    bank = FakeBank([tx(f"T{i}", booking_date=f"2024-{i:02d}-15") for i in range(1, 13)], "2023-01-01")
+    store = TransactionStore(":memory:")
+    with store.conn:
+        store._set_meta("history_from:A", "2024-10-01")
+    store.upsert([tx("T10", booking_date="2024-10-15")], account="A")
+
+    resp = asyncio.run(store.backfill(bank, URL, date(2024, 1, 1), page_days=100))
+    assert resp.status_code == 200
+    assert bank.calls == [("2024-06-23", "2024-10-01"), ("2024-03-15", "2024-06-23"),
+                          ("2024-01-01", "2024-03-15")]
+    assert store.history_start("A") == date(2024, 1, 1)
+    assert store.count() == 10
+    # Lo antiguo no cuenta como recién llegado
+    assert [t.id for _, t in store.seen_since(0)] == ["T10"]
+    # Ya completo: no se vuelve a pedir
+    assert asyncio.run(store.backfill(bank, URL, date(2024, 1, 1))) is None
+
+
+def test_backfill_stops_where_the_bank_history_ends():
+    bank = FakeBank([], "2024-06-01")
+    store = TransactionStore(":memory:")
+    with store.conn:
+        store._set_meta("history_from:A", "2024-10-01")
+    resp = asyncio.run(store.backfill(bank, URL, date(2023, 1, 1), page_days=90))
+    assert resp.status_code == 400
+    assert store.history_start("A") == date(2024, 7, 3)
+    assert len(bank.calls) == 2
+    # El rango rechazado no se vuelve a pedir (cada intento gasta cuota)
+    assert asyncio.run(store.backfill(bank, URL, date(2023, 1, 1), page_days=90)) is None
+    assert asyncio.run(store.backfill(bank, URL, date(2024, 5, 1), page_days=90)) is None
+    assert len(bank.calls) == 2
+
+
+class CutStream(httpx.AsyncByteStream):
+    """
+    Cuerpo que se corta tras el primer trozo, como una conexión caída.
+    """
+
+    async def __aiter__(self):
+        yield b'{"transactions": {"booked": [{"transactionId": "T1", "bookingDate": "2024-03-10"},'
+        raise httpx.ReadError("conexión cortada")
+
+
+def test_body_cut_midway_counts_as_bank_failure():
+    calls = []
+
+    def handler(request):
+        calls.append(request.url)
+        return httpx.Response(200, stream=CutStream())
+
+    async def run():
+        client = GoCardlessClient({})
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        store = TransactionStore(":memory:")
+        resps = [await store.sync(client, URL, force=True) for _ in range(4)]
+        await client.aclose()
+        return client, store, resps
+
+    client, store, resps = asyncio.run(run())
+    assert [r.status_code for r in resps] == [503] * 4
+    # Tras tres cortes seguidos el circuito se abre y la cuarta ni sale
+    assert len(calls) == 3
+    assert client.breaker(URL).state == OPEN
+    # No cuenta como sincronizado: la próxima orden lo vuelve a pedir
+    assert store.last_sync("A") == 0.0
+
+
+def test_refused_history_is_asked_again_after_a_while():
+    bank = FakeBank([], "2024-06-01")
+    store = TransactionStore(":memory:")
+    with store.conn:
+        store._set_meta("history_from:A", "2024-10-01")
+        store._set_meta("history_floor:A", f"2024-10-01 {time.time() - REFUSED_TTL - 1}")
+    assert store.history_floor("A") is None
+    asyncio.run(store.backfill(bank, URL, date(2024, 8, 1)))
+    assert bank.calls == [("2024-08-01", "2024-10-01")]
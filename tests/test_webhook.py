@@ -0,0 +1,102 @@
+import asyncio
+import json
+import socket
+
+from telegram.ext import ApplicationBuilder, MessageHandler, filters
+
+from webhook import serve_standby, start_webhook_server
+
+SECRET = "compartido"
+
+
+def update_data(n, text="hola"):
+    return {"update_id": n, "message": {
+        "message_id": n, "date": 0, "text": text,
+        "chat": {"id": 7, "type": "private"}, "from": {"id": 7, "is_bot": False, "first_name": "Ana"},
+    }}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def post(port, body, path="/telegram", secret=SECRET, method="POST"):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    body = body if isinstance(body, bytes) else json.dumps(body).encode()
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: bot\r\nContent-Type: application/json\r\n"
+        f"X-Telegram-Bot-Api-Secret-Token: {secret}\r\nContent-Length: {len(body)}\r\n\r\n".encode()
+        + body
+    )
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    writer.close()
+    return status
+
+
+def test_receiver_checks_path_method_and_secret(bot_api):
+    application = ApplicationBuilder().token("1:TEST").request(bot_api).build()
+
+    async def run():
+        server = await start_webhook_server(application, "127.0.0.1", 0, "telegram", SECRET)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            statuses = [
+                await post(port, update_data(1)),
+                await post(port, update_data(2), path="/otra"),
+                await post(port, update_data(3), method="PUT"),
+                await post(port, update_data(4), secret="otro"),
+                await post(port, b"{roto"),
+            ]
+        queued = []
+        while not application.update_queue.empty():
+            queued.append(application.update_queue.get_nowait().update_id)
+        return statuses, queued
+
+    statuses, queued = asyncio.run(run())
+    assert statuses == [200, 404, 405, 403, 400]
+    assert queued == [1]
+
+
+def test_standby_handles_updates_without_registering_the_webhook(bot_api):
+    hooks = []
+
+    async def hook(application):
+        hooks.append(len(hooks))
+
+    application = (
+        ApplicationBuilder().token("1:TEST").request(bot_api)
+        .post_init(hook).post_stop(hook).post_shutdown(hook).build()
+    )
+    handled = asyncio.Queue()
+
+    async def record(update, context):
+        await handled.put(update.message.text)
+
+    application.add_handler(MessageHandler(filters.TEXT, record))
+
+    async def run():
+        stop = asyncio.Event()
+        port = free_port()
+        task = asyncio.create_task(
+            serve_standby(application, "127.0.0.1", port, "telegram", SECRET, stop=stop)
+        )
+        # Espera a que el receptor esté escuchando
+        for _ in range(100):
+            try:
+                status = await post(port, update_data(1, "/saldo"))
+                break
+            except OSError:
+                await asyncio.sleep(0.01)
+        texto = await asyncio.wait_for(handled.get(), 5)
+        stop.set()
+        await task
+        return status, texto
+
+    status, texto = asyncio.run(run())
+    assert (status, texto) == (200, "/saldo")
+    assert hooks == [0, 1, 2]
+    assert "setWebhook" not in bot_api.calls and "deleteWebhook" not in bot_api.calls
+    assert not application.running
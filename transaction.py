@@ -0,0 +1,90 @@
+"""
+Representación compacta de una transacción.
+
+Los comandos y tareas programadas trabajan con `Transaction` en lugar de con
+el dict anidado que devuelve GoCardless: el importe va en céntimos enteros
+(sin errores de coma flotante al comparar con 800 €), la fecha como ordinal
+y los nombres de contrapartida internados, de modo que los repetidos
+comparten la misma cadena.
+"""
+import sys
+from datetime import date
+from decimal import ROUND_HALF_EVEN, Decimal
+
+
+def parse_cents(text) -> int:
+    """
+    Importe del banco ("-800.00", "45.3", "12") en céntimos enteros.
+    """
+    text = str(text).strip()
+    entero, _, decimales = text.partition(".")
+    if len(decimales) <= 2 and entero.lstrip("+-").isdigit() and (not decimales or decimales.isdigit()):
+        cents = int(entero.lstrip("+-") or 0) * 100 + int(decimales.ljust(2, "0") or 0)
+        return -cents if entero.startswith("-") else cents
+    # Más de dos decimales o formatos raros: redondeo exacto
+    return int((Decimal(text) * 100).to_integral_value(ROUND_HALF_EVEN))
+
+
+def format_cents(cents) -> str:
+    """
+    Céntimos a texto con dos decimales ("-800.00").
+    """
+    sign = "-" if cents < 0 else ""
+    euros, resto = divmod(abs(cents), 100)
+    return f"{sign}{euros}.{resto:02d}"
+
+
+def _intern(name):
+    return sys.intern(name) if name else None
+
+
+class Transaction:
+    __slots__ = ("id", "booked", "amount", "currency", "creditor", "debtor", "concept", "account")
+
+    def __init__(self, id, booked, amount, currency="EUR", creditor=None, debtor=None, concept="",
+                 account=None):
+        self.id = id
+        self.booked = booked          # date.toordinal() de bookingDate
+        self.amount = amount          # céntimos (negativo = cargo)
+        self.currency = sys.intern(currency or "EUR")
+        self.creditor = _intern(creditor)
+        self.debtor = _intern(debtor)
+        self.concept = concept or ""
+        self.account = _intern(account)   # id de la cuenta en GoCardless
+
+    @classmethod
+    def from_api(cls, tx, id=None, account=None):
+        """
+        Construye el registro a partir de una transacción de GoCardless.
+        """
+        importe = tx.get("transactionAmount", {})
+        return cls(
+            id if id is not None else tx.get("transactionId"),
+            date.fromisoformat(tx["bookingDate"]).toordinal() if tx.get("bookingDate") else 0,
+            parse_cents(importe.get("amount", "0")),
+            importe.get("currency", "EUR"),
+            tx.get("creditorName"),
+            tx.get("debtorName"),
+            "; ".join(tx.get("remittanceInformationUnstructuredArray", [])),
+            account,
+        )
+
+    @property
+    def booking_date(self):
+        """
+        Fecha del apunte, o None si el banco no la dio (`booked` == 0).
+        """
+        return date.fromordinal(self.booked) if self.booked else None
+
+    @property
+    def counterparty(self):
+        return self.creditor or self.debtor
+
+    def amount_text(self) -> str:
+        return format_cents(self.amount)
+
+    def date_text(self) -> str:
+        return self.booking_date.isoformat() if self.booked else "—"
+
+    def __repr__(self):
+        return f"Transaction({self.id!r}, {self.date_text()}, {self.amount_text()} {self.currency})"
@@ -0,0 +1,561 @@
+"""
+Almacén local (SQLite) de las transacciones de las cuentas.
+
+En vez de descargar una ventana de fechas en cada comando, se guarda todo lo
+ya visto indexado por (cuenta, `transactionId`) y sólo se pide al banco lo posterior a
+la última `bookingDate` conocida (con un solape para apuntes tardíos). Los
+comandos consultan la base local y sólo gastan cuota si los datos han caducado.
+
+La respuesta del banco se lee en streaming (`json_stream`) y se guarda por
+lotes, así que ni un histórico enorme se tiene entero en memoria ni bloquea
+el bucle de eventos mientras se procesa.
+
+La primera sincronización sólo trae `initial_days`; lo anterior se pide por
+tramos (`backfill`) cuando una consulta lo necesita, y `history_start`
+recuerda hasta dónde se ha descargado cada cuenta.
+
+Con varias cuentas todas comparten la tabla (columna `account`), así que las
+consultas ven el histórico ya mezclado; la sincronización, la ventana de
+fechas y la caducidad van por cuenta.
+"""
+import asyncio
+import hashlib
+import json
+import sqlite3
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+import httpx
+
+from json_stream import aiter_array
+from quota import PRIORITY_INTERACTIVE, endpoint_key
+from transaction import Transaction
+
+# Transacciones que se escriben de una vez al sincronizar
+SYNC_BATCH = 1000
+# Ids por consulta al buscar las ya guardadas (límite de parámetros de SQLite)
+LOOKUP_BATCH = 500
+# Días que se piden de una vez al completar el histórico hacia atrás
+BACKFILL_DAYS = 90
+# Segundos durante los que no se vuelve a pedir un histórico que el banco rechazó
+REFUSED_TTL = 7 * 86400
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    transaction_id TEXT NOT NULL,
+    booking_date   TEXT NOT NULL,
+    amount         TEXT NOT NULL,
+    currency       TEXT,
+    creditor_name  TEXT,
+    debtor_name    TEXT,
+    raw            TEXT NOT NULL,
+    seq            INTEGER,
+    amount_cents   INTEGER,
+    concept        TEXT,
+    first_seen     INTEGER,
+    account        TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (account, transaction_id)
+);
+CREATE INDEX IF NOT EXISTS idx_transactions_booking_date
+    ON transactions (booking_date);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Orden del banco: por fecha y, dentro del día, por posición en la respuesta
+ORDER = "booking_date DESC, seq, rowid DESC"
+# Todas las columnas de la tabla, en el orden de SCHEMA
+TABLE_COLUMNS = ("transaction_id, booking_date, amount, currency, creditor_name, debtor_name, "
+                 "raw, seq, amount_cents, concept, first_seen, account")
+# Columnas con las que se construye un `Transaction`
+COLUMNS = ("transaction_id, booking_date, amount_cents, currency, creditor_name, debtor_name, "
+           "concept, account")
+
+
+def tx_key(tx) -> str:
+    """
+    Clave estable de una transacción: `transactionId` si el banco lo da y, si
+    no, un hash del contenido.
+    """
+    key = tx.get("transactionId") or tx.get("internalTransactionId")
+    if key:
+        return key
+    raw = json.dumps(tx, sort_keys=True, ensure_ascii=False)
+    return "sha1:" + hashlib.sha1(raw.encode()).hexdigest()
+
+
+class TransactionStore:
+    def __init__(self, path="transactions.db", max_age=6 * 3600,
+                 overlap_days=5, initial_days=90):
+        self.path = path
+        self.max_age = max_age            # segundos hasta considerar los datos viejos
+        self.overlap_days = overlap_days  # días que se vuelven a pedir por apuntes tardíos
+        self.initial_days = initial_days  # ventana de la primera sincronización
+        self.conn = sqlite3.connect(path)
+        # WAL: varios procesos del bot pueden leer mientras otro escribe
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+        # Varias órdenes a la vez comparten una única sincronización por cuenta
+        self._sync_locks = defaultdict(asyncio.Lock)
+        self._writes = 0
+
+    def _migrate(self):
+        # Bases antiguas sin `seq`: sus filas se ordenan por rowid como antes
+        cols = {row[1] for row in self.conn.execute("PRAGMA table_info(transactions)")}
+        with self.conn:
+            for col, kind in (("seq", "INTEGER"), ("amount_cents", "INTEGER"),
+                              ("concept", "TEXT"), ("first_seen", "INTEGER"),
+                              ("account", "TEXT")):
+                if col not in cols:
+                    self.conn.execute(f"ALTER TABLE transactions ADD COLUMN {col} {kind}")
+        self._rekey()
+        with self.conn:
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_transactions_first_seen ON transactions (first_seen)"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_transactions_account_date "
+                "ON transactions (account, booking_date)"
+            )
+            # Filas guardadas antes de tener importe en céntimos: se rellenan desde `raw`
+            pendientes = self.conn.execute(
+                "SELECT rowid, transaction_id, raw FROM transactions WHERE amount_cents IS NULL"
+            ).fetchall()
+            for rowid, key, raw in pendientes:
+                t = Transaction.from_api(json.loads(raw), id=key)
+                self.conn.execute(
+                    "UPDATE transactions SET amount_cents = ?, concept = ? WHERE rowid = ?",
+                    (t.amount, t.concept, rowid),
+                )
+
+    def _primary_key(self):
+        return [row[1] for row in sorted(
+            (row for row in self.conn.execute("PRAGMA table_info(transactions)") if row[5]),
+            key=lambda row: row[5],
+        )]
+
+    def _rekey(self):
+        """
+        Bases de antes de tener varias cuentas: la clave era sólo
+        `transaction_id`, así que el mismo id en dos cuentas dejaba una única
+        fila. SQLite no permite cambiar la clave primaria, así que la tabla se
+        reconstruye (conservando los rowid, que usa el índice de /buscar).
+        """
+        if self._primary_key() == ["account", "transaction_id"]:
+            return
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            # Otro proceso puede haberla migrado mientras se esperaba
+            if self._primary_key() == ["account", "transaction_id"]:
+                return
+            self.conn.execute("ALTER TABLE transactions RENAME TO transactions_old")
+            self.conn.execute("DROP INDEX IF EXISTS idx_transactions_booking_date")
+            self.conn.execute("DROP INDEX IF EXISTS idx_transactions_first_seen")
+            self.conn.execute("DROP INDEX IF EXISTS idx_transactions_account_date")
+            for statement in SCHEMA.split(";"):
+                if "transactions" in statement:
+                    self.conn.execute(statement)
+            columns = TABLE_COLUMNS.replace("account", "COALESCE(account, '')")
+            self.conn.execute(
+                f"INSERT INTO transactions (rowid, {TABLE_COLUMNS}) "
+                f"SELECT rowid, {columns} FROM transactions_old"
+            )
+            self.conn.execute("DROP TABLE transactions_old")
+
+    # --- Metadatos ---
+
+    def _get_meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value))
+        )
+
+    @staticmethod
+    def _sync_key(account):
+        return f"last_sync:{account}" if account else "last_sync"
+
+    def history_start(self, account=None):
+        """
+        Primer día descargado del histórico de `account` (None si nunca se
+        ha sincronizado). En bases anteriores a guardarlo, la fecha más
+        antigua que haya.
+        """
+        value = self._get_meta(f"history_from:{account or ''}")
+        if value:
+            return date.fromisoformat(value)
+        row = self.conn.execute(
+            "SELECT MIN(booking_date) FROM transactions WHERE account = ? AND booking_date != ''",
+            (account or "",),
+        ).fetchone()
+        return date.fromisoformat(row[0]) if row and row[0] else None
+
+    def history_floor(self, account=None):
+        """
+        Día a partir del cual el banco rechazó dar más histórico de
+        `account` (None si no lo ha rechazado en los últimos REFUSED_TTL
+        segundos): lo anterior no se vuelve a pedir.
+        """
+        value = self._get_meta(f"history_floor:{account or ''}")
+        if not value:
+            return None
+        day, _, when = value.partition(" ")
+        if time.time() - float(when or 0) > REFUSED_TTL:
+            return None
+        return date.fromisoformat(day)
+
+    def _extend_history(self, account, desde):
+        start = self.history_start(account)
+        if start is None or desde < start:
+            self._set_meta(f"history_from:{account or ''}", desde.isoformat())
+
+    def last_sync(self, account=None) -> float:
+        value = self._get_meta(self._sync_key(account))
+        return float(value) if value else 0.0
+
+    def is_stale(self, max_age=None, account=None) -> bool:
+        max_age = self.max_age if max_age is None else max_age
+        return time.time() - self.last_sync(account) > max_age
+
+    def adopt(self, account):
+        """
+        Asigna a `account` las filas (y la última sincronización) guardadas
+        cuando el bot sólo conocía una cuenta.
+        """
+        with self.conn:
+            # Si alguna ya se ha vuelto a descargar con la cuenta, se queda esa
+            self.conn.execute("UPDATE OR IGNORE transactions SET account = ? WHERE account = ''", (account,))
+            self.conn.execute("DELETE FROM transactions WHERE account = ''")
+            legacy = self._get_meta("last_sync")
+            if legacy is not None and self._get_meta(self._sync_key(account)) is None:
+                self._set_meta(self._sync_key(account), legacy)
+            self.conn.execute("DELETE FROM meta WHERE key = 'last_sync'")
+            legacy = self._get_meta("history_from:")
+            if legacy is not None and self._get_meta(f"history_from:{account}") is None:
+                self._set_meta(f"history_from:{account}", legacy)
+            self.conn.execute("DELETE FROM meta WHERE key = 'history_from:'")
+
+    def event_mark(self):
+        """
+        Último `first_seen` ya notificado (None si nunca se ha notificado).
+        """
+        value = self._get_meta("event_mark")
+        return int(value) if value is not None else None
+
+    def set_event_mark(self, mark):
+        with self.conn:
+            self._set_meta("event_mark", mark)
+
+    def latest_seen(self) -> int:
+        """
+        Último `first_seen` asignado (cada transacción nueva recibe el
+        siguiente, y así se sabe qué ha llegado desde una marca).
+        """
+        return self.conn.execute("SELECT COALESCE(MAX(first_seen), 0) FROM transactions").fetchone()[0]
+
+    @property
+    def version(self):
+        """
+        Cambia con cada escritura, propia o de otro proceso que comparta la
+        base (para invalidar vistas derivadas).
+        """
+        return self._writes, self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def latest_booking_date(self, account=None):
+        if account is None:
+            row = self.conn.execute("SELECT MAX(booking_date) FROM transactions").fetchone()
+        else:
+            row = self.conn.execute(
+                "SELECT MAX(booking_date) FROM transactions WHERE account = ?", (account,)
+            ).fetchone()
+        return date.fromisoformat(row[0]) if row and row[0] else None
+
+    # --- Escritura ---
+
+    def upsert(self, txs, start=0, account=None, fresh=True) -> int:
+        """
+        Inserta o actualiza las transacciones de `account`, que vienen en el
+        orden del banco (la más reciente primero). Devuelve cuántas eran nuevas.
+        `seq` guarda la posición en la respuesta (a partir de `start`) para
+        respetar ese orden dentro de un mismo día, y `first_seen` se conserva
+        para las que ya estaban y se asigna a las nuevas. Con `fresh=False`
+        (histórico antiguo) las nuevas reciben 0: no cuentan como llegadas.
+        """
+        records = [Transaction.from_api(tx, id=tx_key(tx), account=account) for tx in txs]
+        # Lectura y escritura en la misma transacción de escritura: si otro
+        # proceso sincroniza a la vez, no pueden repetirse valores de `first_seen`
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            before = self.count()
+            existing = self._first_seen(account, [t.id for t in records])
+            seen = self.latest_seen()
+            # Las nuevas se numeran de la más antigua a la más reciente
+            for t in reversed(records):
+                if t.id in existing:
+                    continue
+                if fresh:
+                    seen += 1
+                existing[t.id] = seen if fresh else 0
+            self._insert(txs, records, existing, start, account)
+            nuevas = self.count() - before
+        self._writes += 1
+        return nuevas
+
+    def _first_seen(self, account, ids):
+        """
+        `first_seen` de las que ya estaban guardadas, por id. Se buscan por
+        clave y no por fecha: las que llegan sin `bookingDate` también.
+        """
+        found = {}
+        for i in range(0, len(ids), LOOKUP_BATCH):
+            chunk = ids[i:i + LOOKUP_BATCH]
+            found.update(self.conn.execute(
+                "SELECT transaction_id, first_seen FROM transactions "
+                f"WHERE account = ? AND transaction_id IN ({', '.join('?' * len(chunk))})",
+                [account or "", *chunk],
+            ))
+        return found
+
+    def _insert(self, txs, records, existing, start, account):
+        rows = []
+        for seq, (tx, t) in enumerate(zip(txs, records), start):
+            rows.append((
+                t.id,
+                tx.get("bookingDate", ""),
+                tx.get("transactionAmount", {}).get("amount", "0"),
+                t.currency,
+                t.creditor,
+                t.debtor,
+                json.dumps(tx, ensure_ascii=False),
+                seq,
+                t.amount,
+                t.concept,
+                existing[t.id],
+                account or "",
+            ))
+        self.conn.executemany(
+            f"INSERT OR REPLACE INTO transactions ({TABLE_COLUMNS}) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+
+    async def ingest(self, chunks, account=None, fresh=True) -> int:
+        """
+        Guarda las transacciones de un cuerpo de respuesta que llega a trozos
+        (`resp.aiter_bytes()`), por lotes de SYNC_BATCH y cediendo el bucle
+        de eventos entre lote y lote. Devuelve cuántas eran nuevas.
+        """
+        nuevas = seq = 0
+        batch = []
+        async for tx in aiter_array(chunks, ("transactions", "booked")):
+            batch.append(tx)
+            if len(batch) >= SYNC_BATCH:
+                nuevas += self.upsert(batch, seq, account, fresh)
+                seq += len(batch)
+                batch = []
+                await asyncio.sleep(0)
+        if batch:
+            nuevas += self.upsert(batch, seq, account, fresh)
+        return nuevas
+
+    def sync_window(self, today=None, account=None):
+        """
+        Rango de fechas a pedir al banco en la próxima sincronización.
+        """
+        today = today or date.today()
+        latest = self.latest_booking_date(account)
+        if latest is None:
+            desde = today - timedelta(days=self.initial_days)
+        else:
+            desde = min(latest, today) - timedelta(days=self.overlap_days)
+        return {"date_from": desde.isoformat(), "date_to": today.isoformat()}
+
+    async def sync(self, client, url, force=False, priority=PRIORITY_INTERACTIVE, max_age=None):
+        """
+        Trae del banco las transacciones nuevas de la cuenta de `url` si sus
+        datos locales han caducado (tras `max_age` segundos, por defecto los
+        del almacén). Devuelve la respuesta upstream (también un 429, para
+        que el llamante lo formatee; un 503 local si el cuerpo se cortó a
+        medias) o None si no hizo falta pedir nada.
+        """
+        account = endpoint_key(url)[0]
+        if not force and not self.is_stale(max_age, account):
+            return None
+        async with self._sync_locks[account]:
+            # Quien esperaba al candado puede encontrarse ya los datos al día
+            if not force and not self.is_stale(max_age, account):
+                return None
+            window = self.sync_window(account=account)
+            resp = await client.get(url, params=window, priority=priority, stream=True)
+            try:
+                if resp.status_code == 200:
+                    try:
+                        await self.ingest(resp.aiter_bytes(), account)
+                    except httpx.TransportError as e:
+                        # Lo ya guardado se queda; la próxima vez se vuelve a pedir
+                        return client.stream_failed(url, e)
+                    with self.conn:
+                        self._set_meta(self._sync_key(account), time.time())
+                        self._extend_history(account, date.fromisoformat(window["date_from"]))
+            finally:
+                await resp.aclose()
+            return resp
+
+    async def backfill(self, client, url, date_from, priority=PRIORITY_INTERACTIVE,
+                       page_days=BACKFILL_DAYS):
+        """
+        Pide al banco, en tramos de `page_days` días y del más reciente al más
+        antiguo, lo que falte del histórico de la cuenta de `url` hasta
+        `date_from`. Para en cuanto un tramo falla (p. ej. el banco no guarda
+        tanto histórico) y devuelve esa respuesta; la última si todo fue
+        bien, o None si no hacía falta pedir nada (o la cuenta aún no se ha
+        sincronizado nunca). Si el banco rechaza un tramo (4xx que no sea un
+        429), se recuerda y durante REFUSED_TTL no se pide nada anterior: cada
+        intento gastaría cuota en un rango que el banco no va a dar.
+        """
+        account = endpoint_key(url)[0]
+        resp = None
+        async with self._sync_locks[account]:
+            start = self.history_start(account)
+            floor = self.history_floor(account)
+            if floor is not None:
+                date_from = max(date_from, floor)
+            while start is not None and start > date_from:
+                desde = max(date_from, start - timedelta(days=page_days))
+                # El día de `start` se repite por si estaba a medias
+                params = {"date_from": desde.isoformat(), "date_to": start.isoformat()}
+                resp = await client.get(url, params=params, priority=priority, stream=True)
+                try:
+                    if resp.status_code != 200:
+                        if 400 <= resp.status_code < 500 and resp.status_code != 429:
+                            with self.conn:
+                                self._set_meta(f"history_floor:{account}", f"{start} {time.time()}")
+                        return resp
+                    try:
+                        await self.ingest(resp.aiter_bytes(), account, fresh=False)
+                    except httpx.TransportError as e:
+                        return client.stream_failed(url, e)
+                    with self.conn:
+                        self._extend_history(account, desde)
+                finally:
+                    await resp.aclose()
+                start = desde
+        return resp
+
+    # --- Consultas ---
+
+    def count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+
+    @staticmethod
+    def _record(row) -> Transaction:
+        key, booking_date, cents, currency, creditor, debtor, concept, account = row
+        booked = date.fromisoformat(booking_date).toordinal() if booking_date else 0
+        return Transaction(key, booked, cents, currency, creditor, debtor, concept, account or None)
+
+    def recent(self, limit):
+        """
+        Las `limit` transacciones (`Transaction`) más recientes, en el orden del banco.
+        """
+        rows = self.conn.execute(
+            f"SELECT {COLUMNS} FROM transactions ORDER BY {ORDER} LIMIT ?", (limit,)
+        )
+        return [self._record(row) for row in rows]
+
+    def between(self, date_from, date_to):
+        """
+        Transacciones (`Transaction`) con `bookingDate` en [date_from,
+        date_to] (fechas o cadenas ISO), de la más reciente a la más antigua.
+        Es un generador: las filas se leen según se piden, así que quien
+        busca una sola coincidencia puede parar en cuanto la encuentra.
+        """
+        rows = self.conn.execute(
+            f"SELECT {COLUMNS} FROM transactions WHERE booking_date BETWEEN ? AND ? ORDER BY {ORDER}",
+            (str(date_from), str(date_to)),
+        )
+        for row in rows:
+            yield self._record(row)
+
+    def pages(self, date_from, date_to, size=1000):
+        """
+        Transacciones (`Transaction`) con `bookingDate` en [date_from,
+        date_to], de la más antigua a la más reciente, en listas de como
+        mucho `size`. Cada página es una consulta aparte que sigue a la
+        anterior por (fecha, rowid), así que entre página y página no queda
+        ningún cursor abierto y la memoria no depende del total.
+        """
+        sql = (
+            f"SELECT rowid, {COLUMNS} FROM transactions WHERE booking_date BETWEEN ? AND ? "
+            "AND (booking_date > ? OR (booking_date = ? AND rowid < ?)) "
+            "ORDER BY booking_date, rowid DESC LIMIT ?"
+        )
+        # Dentro de un día el banco da primero la más reciente: rowid descendente
+        fecha, rowid = "", 0
+        while True:
+            rows = self.conn.execute(
+                sql, (str(date_from), str(date_to), fecha, fecha, rowid, size)
+            ).fetchall()
+            if not rows:
+                return
+            yield [self._record(row[1:]) for row in rows]
+            rowid, fecha = rows[-1][0], rows[-1][2]
+            if len(rows) < size:
+                return
+
+    def seen_since(self, mark):
+        """
+        Transacciones (`Transaction`) que llegaron después de la marca
+        `first_seen`, en orden de llegada: [(first_seen, Transaction)].
+        """
+        rows = self.conn.execute(
+            f"SELECT first_seen, {COLUMNS} FROM transactions WHERE first_seen > ? "
+            "ORDER BY first_seen",
+            (mark,),
+        )
+        return [(row[0], self._record(row[1:])) for row in rows]
+
+    def rows_since(self, rowid, limit=None):
+        """
+        Filas escritas después de `rowid` (para índices incrementales), como
+        mucho `limit`: (rowid, cuenta, id, bookingDate, acreedor, deudor, concepto).
+        """
+        return self.conn.execute(
+            "SELECT rowid, account, transaction_id, booking_date, creditor_name, debtor_name, concept "
+            "FROM transactions WHERE rowid > ? ORDER BY rowid LIMIT ?",
+            (rowid, -1 if limit is None else limit),
+        ).fetchall()
+
+    def by_keys(self, keys):
+        """
+        Transacciones (`Transaction`) con esas claves (cuenta, id), en el
+        mismo orden.
+        """
+        keys = [(account or "", key) for account, key in keys]
+        if not keys:
+            return []
+        rows = self.conn.execute(
+            f"SELECT {COLUMNS} FROM transactions WHERE (account, transaction_id) "
+            f"IN (VALUES {', '.join(['(?, ?)'] * len(keys))})",
+            [value for pair in keys for value in pair],
+        )
+        found = {(t.account or "", t.id): t for t in map(self._record, rows)}
+        return [found[k] for k in keys if k in found]
+
+    def columns(self):
+        """
+        (bookingDate, céntimos, contrapartida) de todas las transacciones,
+        para construir vistas en columnas.
+        """
+        return self.conn.execute(
+            "SELECT booking_date, amount_cents, COALESCE(creditor_name, debtor_name) FROM transactions"
+        ).fetchall()
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,58 @@
+"""
+Procesado concurrente de updates manteniendo el orden dentro de cada chat.
+
+Chats distintos se atienden en paralelo (hasta `max_concurrent_updates`),
+pero los updates de un mismo chat se ejecutan uno detrás de otro y en el
+orden en que llegaron: si ya hay un worker con ese chat, el update se le
+encola y se libera el hueco para otro chat.
+"""
+from collections import deque
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        self._queues = {}  # chat_id -> deque de corrutinas pendientes
+
+    @staticmethod
+    def _chat_key(update):
+        if isinstance(update, Update) and update.effective_chat is not None:
+            return update.effective_chat.id
+        return None
+
+    async def do_process_update(self, update, coroutine) -> None:
+        key = self._chat_key(update)
+        if key is None:
+            await coroutine
+            return
+
+        queue = self._queues.get(key)
+        if queue is not None:
+            # Otro worker ya está con este chat: que lo ejecute él, en orden
+            queue.append(coroutine)
+            return
+
+        queue = self._queues[key] = deque([coroutine])
+        try:
+            while queue:
+                try:
+                    await queue[0]
+                except Exception as e:
+                    # Un fallo no debe dejar atascados los siguientes del chat
+                    print(f"Error procesando un update del chat {key}: {e}")
+                finally:
+                    queue.popleft()
+        finally:
+            del self._queues[key]
+            # Si nos cancelan (apagado), no dejamos corrutinas sin esperar
+            for pending in queue:
+                pending.close()
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
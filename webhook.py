@@ -0,0 +1,109 @@
+"""
+Webhook de los procesos de apoyo.
+
+Con varios procesos en modo webhook el proxy reparte entre todos las
+peticiones de Telegram, pero sólo el líder registra la URL con setWebhook
+(`Application.run_webhook`). El Updater de PTB siempre la registra al
+arrancar, así que los de apoyo no lo usan: arrancan la Application a mano y
+reciben los updates con este servidor mínimo, que comprueba el secreto y
+los mete en `application.update_queue` (el camino que documenta PTB para
+servidores de webhook propios).
+"""
+import asyncio
+import hmac
+import json
+import signal
+
+from telegram import Update
+
+# Tamaño máximo de un update (Telegram nunca se acerca)
+MAX_BODY = 1 << 20
+
+
+async def _read_request(reader):
+    """
+    `(método, ruta, cabeceras)` de una petición HTTP/1.1.
+    """
+    request_line = await reader.readline()
+    headers = {}
+    while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    parts = request_line.decode(errors="replace").split()
+    if len(parts) < 2:
+        return None, None, headers
+    return parts[0], parts[1].split("?")[0], headers
+
+
+async def _serve(reader, writer, application, url_path, secret_token):
+    try:
+        method, path, headers = await _read_request(reader)
+        secret = headers.get("x-telegram-bot-api-secret-token", "").encode()
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            length = -1
+        if path != url_path:
+            status = "404 Not Found"
+        elif method != "POST":
+            status = "405 Method Not Allowed"
+        elif not hmac.compare_digest(secret, secret_token.encode()):
+            status = "403 Forbidden"
+        elif not 0 < length <= MAX_BODY:
+            status = "400 Bad Request"
+        else:
+            try:
+                update = Update.de_json(json.loads(await reader.readexactly(length)), application.bot)
+            except (ValueError, TypeError, KeyError):
+                status = "400 Bad Request"
+            else:
+                # Se responde al momento; los handlers lo procesan después
+                await application.update_queue.put(update)
+                status = "200 OK"
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n".encode())
+        await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_webhook_server(application, listen, port, url_path, secret_token):
+    """
+    Arranca el receptor de updates en `listen:port/url_path`. Devuelve el
+    `asyncio.Server`.
+    """
+    url_path = "/" + url_path.lstrip("/")
+    return await asyncio.start_server(
+        lambda r, w: _serve(r, w, application, url_path, secret_token), host=listen, port=port
+    )
+
+
+async def serve_standby(application, listen, port, url_path, secret_token, stop=None):
+    """
+    Ejecuta `application` como `run_webhook` (con sus post_init, post_stop y
+    post_shutdown) pero sin llamar a setWebhook ni a deleteWebhook, hasta
+    SIGINT/SIGTERM o hasta que se active `stop`.
+    """
+    if stop is None:
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        try:
+            server = await start_webhook_server(application, listen, port, url_path, secret_token)
+            async with server:
+                await stop.wait()
+        finally:
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+    finally:
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)